@@ -1,10 +1,13 @@
 import math
 
+import numpy as np
+
 from analysis.indicators import (
     calcular_volatilidade_log_std,
     calcular_volatilidade_ewma,
     calcular_volatilidade_robusta,
 )
+from analysis.volatility import precos_validos, vol_prefixos
 
 
 def _faixa(preco, vol_pct, dias, k=1.0):
@@ -13,7 +16,25 @@ def _faixa(preco, vol_pct, dias, k=1.0):
     return preco - delta, preco + delta
 
 
-def backtest_faixa(
+def _resultado(metodo, dias, k, total, acertos, larguras):
+    if total == 0:
+        return None
+
+    coverage = acertos / total
+    largura_media = sum(larguras) / len(larguras)
+
+    return {
+        "metodo": metodo,
+        "dias": dias,
+        "k": k,
+        "total_testes": total,
+        "coverage": round(coverage * 100, 2),
+        "largura_media": round(largura_media, 2),
+        "sharpness": round(largura_media / coverage, 2) if coverage > 0 else None,
+    }
+
+
+def backtest_faixa_referencia(
     historico,
     dias=10,
     k=1.0,
@@ -21,9 +42,8 @@ def backtest_faixa(
     min_hist=60,
 ):
     """
-    Walk-forward backtest.
-    historico: lista [{date, close}]
-    metodo: 'std' | 'ewma' | 'rob'
+    Walk-forward original: recalcula a vol de closes[:t] a cada passo (O(n²)).
+    Mantido como referência para validar/medir o motor vetorizado.
     """
     closes = [h["close"] for h in historico]
 
@@ -55,18 +75,58 @@ def backtest_faixa(
         if minimo <= preco_futuro <= maximo:
             acertos += 1
 
-    if total == 0:
+    return _resultado(metodo, dias, k, total, acertos, larguras)
+
+
+def backtest_com_vols(closes, vols, dias=10, k=1.0, metodo="ewma", min_hist=60):
+    """
+    Walk-forward sobre vols já calculadas (vols[t] = vol de closes[:t]).
+    Permite reaproveitar a mesma série de vols para vários k (calibração).
+    """
+    c = np.asarray(closes, dtype=float)
+    ts = np.arange(min_hist, len(c) - dias)
+    if len(ts) == 0:
         return None
 
-    coverage = acertos / total
-    largura_media = sum(larguras) / len(larguras)
+    vol_pct = vols[ts]
+    ok = ~np.isnan(vol_pct)
+    ts = ts[ok]
 
-    return {
-        "metodo": metodo,
-        "dias": dias,
-        "k": k,
-        "total_testes": total,
-        "coverage": round(coverage * 100, 2),
-        "largura_media": round(largura_media, 2),
-        "sharpness": round(largura_media / coverage, 2) if coverage > 0 else None,
-    }
+    # mesmas operações (e ordem) de _faixa, elemento a elemento
+    preco = c[ts]
+    vol = vol_pct[ok] / 100.0
+    delta = preco * k * vol * math.sqrt(dias)
+    minimo = preco - delta
+    maximo = preco + delta
+
+    futuro = c[ts + dias]
+    acertos = int(np.count_nonzero((minimo <= futuro) & (futuro <= maximo)))
+
+    # soma sequencial (como no loop original) para o mesmo arredondamento
+    larguras = (maximo - minimo).tolist()
+
+    return _resultado(metodo, dias, k, len(ts), acertos, larguras)
+
+
+def backtest_faixa(
+    historico,
+    dias=10,
+    k=1.0,
+    metodo="ewma",
+    min_hist=60,
+):
+    """
+    Walk-forward backtest.
+    historico: lista [{date, close}]
+    metodo: 'std' | 'ewma' | 'rob'
+
+    As vols de todos os prefixos saem de uma passada (analysis.volatility);
+    o resultado é o mesmo do loop original (backtest_faixa_referencia).
+    """
+    closes = [h["close"] for h in historico]
+
+    if not precos_validos(closes):
+        # preços faltando/inválidos: mantém exatamente o comportamento antigo
+        return backtest_faixa_referencia(historico, dias=dias, k=k, metodo=metodo, min_hist=min_hist)
+
+    return backtest_com_vols(closes, vol_prefixos(closes, metodo), dias=dias, k=k, metodo=metodo, min_hist=min_hist)
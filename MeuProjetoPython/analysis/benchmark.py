@@ -0,0 +1,49 @@
+"""
+Compara o backtest walk-forward original (O(n²)) com o motor vetorizado.
+
+    python -m analysis.benchmark
+    python -m analysis.benchmark --anos 2 10 --metodos ewma
+"""
+import argparse
+import time
+
+import numpy as np
+
+from analysis.backtest import backtest_faixa, backtest_faixa_referencia
+
+PREGOES_POR_ANO = 252
+
+
+def _serie_sintetica(n, seed=0):
+    rng = np.random.default_rng(seed)
+    closes = 30.0 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, n)))
+    return [{"close": float(c)} for c in closes]
+
+
+def _cronometrar(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark do backtest_faixa (referência x vetorizado)")
+    ap.add_argument("--anos", type=int, nargs="*", default=[2, 10, 20])
+    ap.add_argument("--metodos", nargs="*", default=["std", "ewma", "rob"])
+    ap.add_argument("--dias", type=int, default=10)
+    args = ap.parse_args()
+
+    print(f"{'série':>6} {'método':>6} {'ref (s)':>10} {'novo (s)':>10} {'speedup':>9}  igual")
+    for anos in args.anos:
+        historico = _serie_sintetica(anos * PREGOES_POR_ANO, seed=anos)
+        for metodo in args.metodos:
+            ref, t_ref = _cronometrar(backtest_faixa_referencia, historico, dias=args.dias, metodo=metodo)
+            novo, t_novo = _cronometrar(backtest_faixa, historico, dias=args.dias, metodo=metodo)
+            print(
+                f"{str(anos) + 'y':>6} {metodo:>6} {t_ref:>10.3f} {t_novo:>10.4f} "
+                f"{t_ref / t_novo:>8.0f}x  {'sim' if ref == novo else 'NÃO'}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,170 @@
-from analysis.backtest import backtest_faixa
+import math
 
+import numpy as np
 
-def calibrar_k(
+from analysis.backtest import backtest_com_vols, backtest_faixa
+from analysis.volatility import precos_validos, vol_prefixos
+
+
+# =========================================================
+# A faixa acerta quando |futuro - preço| <= k * preço * vol * √dias.
+# Logo a cobertura para um k é a fração de erros normalizados
+#     z = |futuro / preço - 1| / (vol * √dias)
+# que ficam <= k, e o k de uma cobertura-alvo é um quantil de z.
+# Uma passada calcula z; a curva inteira sai de um sort.
+# =========================================================
+
+
+def _grade_k(k_min, k_max, k_step):
+    """Mesma sequência de k da varredura original (inclusive o acúmulo de float)."""
+    ks = []
+    k = k_min
+    while k <= k_max:
+        ks.append(round(k, 3))
+        k += k_step
+    return ks
+
+
+def erros_normalizados(historico, dias=10, metodo="ewma", min_hist=60):
+    """
+    z de cada teste do walk-forward (mesmos t do backtest_faixa), ordenado.
+    Retorna None se os preços não permitem o motor vetorizado.
+    """
+    closes = [h["close"] for h in historico]
+    if not precos_validos(closes):
+        return None
+
+    c = np.asarray(closes, dtype=float)
+    vols = vol_prefixos(closes, metodo)
+
+    ts = np.arange(min_hist, len(c) - dias)
+    ts = ts[~np.isnan(vols[ts])] if len(ts) else ts
+
+    escala = vols[ts] / 100.0 * math.sqrt(dias)
+    erro = np.abs(c[ts + dias] / c[ts] - 1.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(escala > 0, erro / escala, np.where(erro > 0, np.inf, 0.0))
+
+    return {"closes": closes, "vols": vols, "z": np.sort(z)}
+
+
+def curva_cobertura(z_ordenado, ks):
+    """Cobertura (%) para cada k: fração de z <= k."""
+    total = len(z_ordenado)
+    if total == 0:
+        return []
+    hits = np.searchsorted(z_ordenado, np.asarray(ks, dtype=float), side="right")
+    return [{"k": k, "coverage": round(h / total * 100, 2)} for k, h in zip(ks, hits.tolist())]
+
+
+def _k_continuo(z_ordenado, target):
+    """Menor k (sem grade) com cobertura >= target."""
+    total = len(z_ordenado)
+    if total == 0:
+        return None
+    i = max(0, math.ceil(target * total) - 1)
+    k = float(z_ordenado[min(i, total - 1)])
+    return k if math.isfinite(k) else None
+
+
+def _primeiro_k_na_grade(base, ks, target, dias, metodo, min_hist):
+    """
+    Primeiro k da grade cujo backtest (exato) atinge o alvo. O quantil de z
+    dá o candidato; a bissecção confirma com backtest_com_vols, cuja
+    cobertura é monótona em k.
+    """
+    cache = {}
+
+    def bt(i):
+        if i not in cache:
+            cache[i] = backtest_com_vols(
+                base["closes"], base["vols"], dias=dias, k=ks[i], metodo=metodo, min_hist=min_hist
+            )
+        return cache[i]
+
+    def ok(i):
+        r = bt(i)
+        return r is not None and r["coverage"] >= target * 100
+
+    if not ks or not ok(len(ks) - 1):
+        return None, None
+
+    k_cont = _k_continuo(base["z"], target)
+    cand = int(np.searchsorted(ks, k_cont, side="left")) if k_cont is not None else 0
+    cand = min(max(cand, 0), len(ks) - 1)
+
+    if ok(cand) and (cand == 0 or not ok(cand - 1)):
+        return ks[cand], bt(cand)
+
+    # fronteira caiu num empate de ponto flutuante: bissecção na grade
+    lo, hi = 0, len(ks) - 1
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if ok(mid):
+            hi = mid
+        else:
+            lo = mid + 1
+    return ks[lo], bt(lo)
+
+
+def calibrar(
     historico,
     dias=10,
-    metodo="ewma",
-    target_coverage=0.80,
+    metodos=("std", "ewma", "rob"),
+    targets=(0.80,),
     k_min=0.6,
     k_max=3.0,
     k_step=0.05,
+    min_hist=60,
 ):
+    """
+    Calibra k para vários métodos e coberturas-alvo de uma vez.
+
+    Retorna, por método:
+      - "alvos": {target: {"k_otimo", "k_continuo", "resultado"}}
+        (k_otimo/resultado iguais aos da varredura de calibrar_k)
+      - "curva": cobertura (%) x k na grade
+      - "total_testes"
+    """
+    ks = _grade_k(k_min, k_max, k_step)
+    saida = {}
+
+    for metodo in metodos:
+        base = erros_normalizados(historico, dias=dias, metodo=metodo, min_hist=min_hist)
+        if base is None:
+            saida[metodo] = None
+            continue
+
+        alvos = {}
+        for target in targets:
+            k_otimo, resultado = _primeiro_k_na_grade(base, ks, target, dias, metodo, min_hist)
+            alvos[target] = {
+                "k_otimo": k_otimo,
+                "k_continuo": _k_continuo(base["z"], target),
+                "resultado": resultado,
+            }
+
+        saida[metodo] = {
+            "alvos": alvos,
+            "curva": curva_cobertura(base["z"], ks),
+            "total_testes": int(len(base["z"])),
+        }
+
+    return saida
+
+
+def _calibrar_k_varredura(historico, dias, metodo, target_coverage, k_min, k_max, k_step):
+    """Varredura original (um backtest por k); usada quando há preços inválidos."""
     resultados = []
 
-    k = k_min
-    while k <= k_max:
+    for k in _grade_k(k_min, k_max, k_step):
         bt = backtest_faixa(
             historico=historico,
             dias=dias,
-            k=round(k, 3),
+            k=k,
             metodo=metodo,
         )
         if bt is None:
-            k += k_step
             continue
 
         resultados.append(bt)
@@ -33,10 +176,47 @@ def calibrar_k(
                 "tentativas": resultados,
             }
 
-        k += k_step
-
     return {
         "k_otimo": None,
         "resultado": None,
         "tentativas": resultados,
     }
+
+
+def calibrar_k(
+    historico,
+    dias=10,
+    metodo="ewma",
+    target_coverage=0.80,
+    k_min=0.6,
+    k_max=3.0,
+    k_step=0.05,
+):
+    """
+    Menor k da grade com cobertura >= target_coverage (mesmo resultado da
+    varredura antiga). "tentativas" agora é a curva cobertura x k até o
+    k escolhido, sem rodar um backtest por ponto.
+    """
+    cal = calibrar(
+        historico,
+        dias=dias,
+        metodos=(metodo,),
+        targets=(target_coverage,),
+        k_min=k_min,
+        k_max=k_max,
+        k_step=k_step,
+    )[metodo]
+
+    if cal is None:
+        return _calibrar_k_varredura(historico, dias, metodo, target_coverage, k_min, k_max, k_step)
+
+    alvo = cal["alvos"][target_coverage]
+    k_otimo = alvo["k_otimo"]
+    tentativas = [p for p in cal["curva"] if k_otimo is None or p["k"] <= k_otimo]
+
+    return {
+        "k_otimo": k_otimo,
+        "resultado": alvo["resultado"],
+        "tentativas": tentativas,
+        "curva": cal["curva"],
+    }
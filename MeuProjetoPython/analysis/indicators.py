@@ -1,6 +1,8 @@
 import statistics
 import math
 
+import numpy as np
+
 
 def media_movel(valores, janela):
     if len(valores) < janela:
@@ -45,24 +47,13 @@ def _log_returns(precos):
     return rets
 
 
-def calcular_volatilidade_log_std(precos):
-    """
-    Volatilidade simples: desvio padrão dos log-returns (diário) em %.
-    (Seu modelo antigo, mas já na base correta da Aula 7.)
-    """
-    rets = _log_returns(precos)
+def _vol_std(rets):
     if len(rets) < 2:
         return None
     return round(statistics.stdev(rets) * 100, 2)
 
 
-def calcular_volatilidade_ewma(precos, lam=0.94):
-    """
-    EWMA (RiskMetrics): variância recursiva.
-    lam = 0.94 é comum para dados diários (mais “realista” que std fixo).
-    Retorna vol diária em %.
-    """
-    rets = _log_returns(precos)
+def _vol_ewma(rets, lam=0.94):
     if len(rets) < 2:
         return None
 
@@ -75,16 +66,7 @@ def calcular_volatilidade_ewma(precos, lam=0.94):
     return round(vol * 100, 2)
 
 
-def calcular_volatilidade_robusta(precos, clip_k=3.0):
-    """
-    Volatilidade robusta: winsoriza outliers usando MAD.
-    - Calcula log-returns
-    - Encontra mediana e MAD
-    - Clipa retornos fora de mediana ± clip_k * sigma_robusta
-    - Usa stdev no conjunto clipado
-    Retorna vol diária em %.
-    """
-    rets = _log_returns(precos)
+def _vol_robusta(rets, clip_k=3.0):
     if len(rets) < 10:
         return None  # robustez pede um pouco mais de dados
 
@@ -108,6 +90,35 @@ def calcular_volatilidade_robusta(precos, clip_k=3.0):
     return round(statistics.stdev(clipped) * 100, 2)
 
 
+def calcular_volatilidade_log_std(precos):
+    """
+    Volatilidade simples: desvio padrão dos log-returns (diário) em %.
+    (Seu modelo antigo, mas já na base correta da Aula 7.)
+    """
+    return _vol_std(_log_returns(precos))
+
+
+def calcular_volatilidade_ewma(precos, lam=0.94):
+    """
+    EWMA (RiskMetrics): variância recursiva.
+    lam = 0.94 é comum para dados diários (mais “realista” que std fixo).
+    Retorna vol diária em %.
+    """
+    return _vol_ewma(_log_returns(precos), lam=lam)
+
+
+def calcular_volatilidade_robusta(precos, clip_k=3.0):
+    """
+    Volatilidade robusta: winsoriza outliers usando MAD.
+    - Calcula log-returns
+    - Encontra mediana e MAD
+    - Clipa retornos fora de mediana ± clip_k * sigma_robusta
+    - Usa stdev no conjunto clipado
+    Retorna vol diária em %.
+    """
+    return _vol_robusta(_log_returns(precos), clip_k=clip_k)
+
+
 def calcular_drawdonw(precos):
     topo = precos[0]
     maior_queda = 0
@@ -121,10 +132,7 @@ def calcular_drawdonw(precos):
     return round(maior_queda * 100, 2)
 
 
-def detectar_tendencia(precos):
-    mm20 = media_movel(precos, 20)
-    mm60 = media_movel(precos, 60)
-
+def _tendencia(mm20, mm60):
     if mm20 is None or mm60 is None:
         return "Tendencia Indefinida"
     if mm20 > mm60:
@@ -135,6 +143,10 @@ def detectar_tendencia(precos):
         return "Tendencia Lateral"
 
 
+def detectar_tendencia(precos):
+    return _tendencia(media_movel(precos, 20), media_movel(precos, 60))
+
+
 def classificar_risco(volatilidade, drawdonw):
     if volatilidade is None or drawdonw is None:
         return "Risco Indefinido"
@@ -146,27 +158,222 @@ def classificar_risco(volatilidade, drawdonw):
         return "Risco Alto"
 
 
-def analisar_indicadores(historico):
-    precos = [p["close"] for p in historico if p.get("close") is not None]
+# =========================================================
+# Versões com NumPy: recebem o array de closes, calculam os retornos uma
+# vez e devolvem o último valor (serie=False) ou a série inteira, com
+# serie[t] == função_original(closes[:t+1]) e NaN onde ela devolve None.
+# =========================================================
+def _soma_janela(x, janela):
+    """Soma móvel somando as posições da janela em ordem (igual ao sum() do Python)."""
+    n = len(x) - janela + 1
+    if n <= 0:
+        return np.empty(0)
+    acc = np.zeros(n)
+    for j in range(janela):
+        acc = acc + x[j:j + n]
+    return acc
+
+
+def _arredondar_serie(valores, casas=2):
+    return np.array([v if math.isnan(v) else round(v, casas) for v in valores.tolist()])
+
+
+def log_retornos_np(closes):
+    """Log-returns dos pares válidos (> 0), como _log_returns."""
+    c = np.asarray(closes, dtype=float)
+    if len(c) < 2:
+        return np.empty(0)
+    ok = (c[:-1] > 0) & (c[1:] > 0)
+    p0 = c[:-1][ok].tolist()
+    p1 = c[1:][ok].tolist()
+    # math.log para bater bit a bit com as funções escalares
+    return np.array([math.log(b / a) for a, b in zip(p0, p1)], dtype=float)
+
+
+def media_movel_np(closes, janela, serie=False):
+    c = np.asarray(closes, dtype=float)
+    if not serie:
+        return media_movel(c.tolist(), janela)
+
+    out = np.full(len(c), np.nan)
+    if len(c) >= janela:
+        out[janela - 1:] = _soma_janela(c, janela) / janela
+    return out
+
+
+def rsi_np(closes, periodo=14, serie=False):
+    c = np.asarray(closes, dtype=float)
+    if not serie:
+        # só a última janela importa para o valor atual
+        if len(c) < periodo + 1:
+            return None
+        c = c[-(periodo + 1):]
+
+    out = np.full(len(c), np.nan)
+    if len(c) >= periodo + 1:
+        d = np.diff(c)
+        ganho = _soma_janela(np.where(d >= 0, d, 0.0), periodo) / periodo
+        perda = _soma_janela(np.where(d < 0, -d, 0.0), periodo) / periodo
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rsi = _arredondar_serie(100 - (100 / (1 + ganho / perda)))
+        rsi[perda == 0] = 100
+        out[periodo:] = rsi
+
+    if serie:
+        return out
+    # calcular_rsi devolve o int 100 quando não há perdas
+    return 100 if out[-1] == 100 else float(out[-1])
+
+
+def drawdown_np(closes, serie=False):
+    c = np.asarray(closes, dtype=float)
+    if len(c) == 0:
+        return np.empty(0) if serie else None
+
+    topo = np.maximum.accumulate(c)
+    queda = np.maximum.accumulate((topo - c) / topo)
+    out = _arredondar_serie(queda * 100)
+    return out if serie else float(out[-1])
+
+
+def _pct_arredondado(pct, exato):
+    """
+    round(pct, 2); se pct estiver colado num empate da 2ª casa, usa o cálculo
+    exato (statistics) para não divergir das funções escalares.
+    """
+    if abs((pct * 100.0) % 1.0 - 0.5) < 1e-6:
+        return exato()
+    return round(pct, 2)
+
+
+def _vol_std_np(r):
+    if len(r) < 2:
+        return None
+    pct = float(np.std(r, ddof=1)) * 100
+    return _pct_arredondado(pct, lambda: _vol_std(r.tolist()))
+
+
+def _vol_ewma_np(r, lam=0.94):
+    if len(r) < 2:
+        return None
+    var = float(np.var(r))
+    for x in r[1:].tolist():
+        var = lam * var + (1 - lam) * (x * x)
+    pct = math.sqrt(var) * 100
+    return _pct_arredondado(pct, lambda: _vol_ewma(r.tolist(), lam=lam))
+
 
-    vol_std = calcular_volatilidade_log_std(precos)
-    vol_ewma = calcular_volatilidade_ewma(precos, lam=0.94)
-    vol_rob = calcular_volatilidade_robusta(precos, clip_k=3.0)
+def _vol_robusta_np(r, clip_k=3.0):
+    if len(r) < 10:
+        return None
+
+    med = float(np.median(r))
+    mad = float(np.median(np.abs(r - med)))
+    if not mad > 0:
+        return _vol_std_np(r)
+
+    sigma = 1.4826 * mad
+    clipped = np.clip(r, med - clip_k * sigma, med + clip_k * sigma)
+    pct = float(np.std(clipped, ddof=1)) * 100
+    return _pct_arredondado(pct, lambda: _vol_robusta(r.tolist(), clip_k=clip_k))
+
+
+def volatilidades_np(closes, serie=False, lam=0.94, clip_k=3.0):
+    """vol_std, vol_ewma e vol_robusta (em %) a partir de um único cálculo de retornos."""
+    c = np.asarray(closes, dtype=float)
+
+    if not serie:
+        r = log_retornos_np(c)
+        return {
+            "vol_std": _vol_std_np(r),
+            "vol_ewma": _vol_ewma_np(r, lam=lam),
+            "vol_robusta": _vol_robusta_np(r, clip_k=clip_k),
+        }
+
+    # import local: analysis.volatility usa as funções escalares deste módulo
+    from analysis.volatility import (
+        precos_validos,
+        vol_ewma_prefixos,
+        vol_robusta_prefixos,
+        vol_std_prefixos,
+    )
+
+    if precos_validos(c):
+        # prefixos[t] = vol de closes[:t] -> série[t] = prefixos[t + 1]
+        return {
+            "vol_std": vol_std_prefixos(c)[1:],
+            "vol_ewma": vol_ewma_prefixos(c, lam=lam)[1:],
+            "vol_robusta": vol_robusta_prefixos(c, clip_k=clip_k)[1:],
+        }
+
+    precos = c.tolist()
+    fns = {
+        "vol_std": calcular_volatilidade_log_std,
+        "vol_ewma": lambda p: calcular_volatilidade_ewma(p, lam=lam),
+        "vol_robusta": lambda p: calcular_volatilidade_robusta(p, clip_k=clip_k),
+    }
+    out = {}
+    for nome, fn in fns.items():
+        vals = [fn(precos[: t + 1]) for t in range(len(precos))]
+        out[nome] = np.array([np.nan if v is None else v for v in vals], dtype=float)
+    return out
 
-    drawdown = calcular_drawdonw(precos)
+
+def _ultimo(serie):
+    if len(serie) == 0 or math.isnan(serie[-1]):
+        return None
+    return float(serie[-1])
+
+
+def indicadores_np(closes, serie=False):
+    """
+    Todos os indicadores do dashboard a partir do array de closes.
+    Com serie=True inclui "series" (RSI, 3 vols, drawdown, MA20/MA60) para
+    gráficos; os escalares são o último ponto de cada série.
+    """
+    c = np.asarray(closes, dtype=float)
+
+    if serie:
+        vols_s = volatilidades_np(c, serie=True)
+        series = {
+            "rsi": rsi_np(c, serie=True),
+            **vols_s,
+            "drawdown": drawdown_np(c, serie=True),
+            "ma20": media_movel_np(c, 20, serie=True),
+            "ma60": media_movel_np(c, 60, serie=True),
+        }
+        vols = {k: _ultimo(v) for k, v in vols_s.items()}
+        rsi = rsi_np(c)
+        drawdown = _ultimo(series["drawdown"])
+    else:
+        vols = volatilidades_np(c)
+        rsi = rsi_np(c)
+        drawdown = drawdown_np(c)
+
+    mm20 = media_movel_np(c, 20)
+    mm60 = media_movel_np(c, 60)
 
     # Escolha padrão da Aula 8: EWMA (se existir), senão std
-    vol_usada = vol_ewma if vol_ewma is not None else vol_std
+    vol_usada = vols["vol_ewma"] if vols["vol_ewma"] is not None else vols["vol_std"]
 
-    return {
-        "tendencia": detectar_tendencia(precos),
-        "rsi": calcular_rsi(precos),
+    out = {
+        "tendencia": _tendencia(mm20, mm60),
+        "rsi": rsi,
         # mantemos compatibilidade: "volatilidade" continua existindo (agora é a escolhida)
         "volatilidade": vol_usada,
         # expõe as 3 para comparação no dashboard
-        "vol_std": vol_std,
-        "vol_ewma": vol_ewma,
-        "vol_robusta": vol_rob,
+        "vol_std": vols["vol_std"],
+        "vol_ewma": vols["vol_ewma"],
+        "vol_robusta": vols["vol_robusta"],
         "drawdown": drawdown,
         "risco": classificar_risco(vol_usada, drawdown),
     }
+    if serie:
+        out["series"] = series
+    return out
+
+
+def analisar_indicadores(historico, series=False):
+    precos = [p["close"] for p in historico if p.get("close") is not None]
+    return indicadores_np(np.asarray(precos, dtype=float), serie=series)
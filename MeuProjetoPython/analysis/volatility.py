@@ -0,0 +1,231 @@
+import bisect
+import math
+
+import numpy as np
+
+from analysis.indicators import (
+    calcular_volatilidade_log_std,
+    calcular_volatilidade_ewma,
+    calcular_volatilidade_robusta,
+)
+
+
+# =========================================================
+# Volatilidade de TODOS os prefixos closes[:t] em uma passada.
+#
+# vols[t] == calcular_volatilidade_*(closes[:t]) (mesmo arredondamento,
+# NaN onde a função original devolve None). Usado pelo backtest
+# walk-forward, que antes recalculava cada prefixo do zero (O(n²)).
+# =========================================================
+
+# Quando o valor (em %) cai a menos disso de um empate na 2ª casa decimal,
+# recalculamos com a função original para garantir o mesmo arredondamento.
+_TOL_EMPATE = 1e-6
+
+
+def precos_validos(closes):
+    """True se todos os preços são números > 0 (caso coberto pelo motor vetorizado)."""
+    try:
+        arr = np.asarray(closes, dtype=float)
+    except (TypeError, ValueError):
+        return False
+    return arr.ndim == 1 and bool(np.all(np.isfinite(arr))) and bool(np.all(arr > 0))
+
+
+def _retornos(closes):
+    # math.log (e não np.log) para bater bit a bit com indicators._log_returns
+    c = [float(x) for x in closes]
+    return np.array([math.log(p1 / p0) for p0, p1 in zip(c[:-1], c[1:])], dtype=float)
+
+
+def _arredondar(valores_pct, closes, referencia):
+    """round(v, 2) como as funções originais; empates vão para a referência."""
+    out = np.full(len(valores_pct), np.nan)
+    for t, v in enumerate(valores_pct.tolist()):
+        if math.isnan(v):
+            continue
+        frac = (v * 100.0) % 1.0
+        if abs(frac - 0.5) < _TOL_EMPATE:
+            ref = referencia(closes[:t])
+            out[t] = np.nan if ref is None else ref
+        else:
+            out[t] = round(v, 2)
+    return out
+
+
+def vol_std_prefixos(closes):
+    """Desvio padrão dos log-returns de cada prefixo, em % (como calcular_volatilidade_log_std)."""
+    n = len(closes)
+    rets = _retornos(closes)
+
+    s1 = np.concatenate(([0.0], np.cumsum(rets)))
+    s2 = np.concatenate(([0.0], np.cumsum(rets * rets)))
+
+    # prefixo closes[:t] tem m = t - 1 retornos
+    m = np.arange(n + 1, dtype=float) - 1.0
+    pct = np.full(n + 1, np.nan)
+
+    ok = m >= 2
+    mi = m[ok].astype(int)
+    var = (s2[mi] - s1[mi] ** 2 / m[ok]) / (m[ok] - 1.0)
+    pct[ok] = np.sqrt(np.maximum(var, 0.0)) * 100
+
+    return _arredondar(pct, closes, calcular_volatilidade_log_std)
+
+
+def vol_ewma_prefixos(closes, lam=0.94):
+    """
+    EWMA de cada prefixo, em % (como calcular_volatilidade_ewma).
+
+    A função original começa da variância populacional do próprio prefixo e
+    aplica a recursão nos retornos seguintes, ou seja:
+        var_m = lam^(m-1) * pvar_m + E_m,   E_m = lam * E_(m-1) + (1-lam) * r_(m-1)^2
+    """
+    n = len(closes)
+    rets = _retornos(closes)
+
+    s1 = np.concatenate(([0.0], np.cumsum(rets)))
+    s2 = np.concatenate(([0.0], np.cumsum(rets * rets)))
+
+    e = np.zeros(n + 1)
+    acc = 0.0
+    sq = (rets * rets).tolist()
+    for m in range(2, n):
+        acc = lam * acc + (1 - lam) * sq[m - 1]
+        e[m] = acc
+
+    m = np.arange(n + 1, dtype=float) - 1.0
+    pct = np.full(n + 1, np.nan)
+
+    ok = m >= 2
+    mi = m[ok].astype(int)
+    pvar = (s2[mi] - s1[mi] ** 2 / m[ok]) / m[ok]
+    var = np.power(lam, m[ok] - 1.0) * np.maximum(pvar, 0.0) + e[mi]
+    pct[ok] = np.sqrt(var) * 100
+
+    return _arredondar(pct, closes, lambda p: calcular_volatilidade_ewma(p, lam=lam))
+
+
+class _Fenwick:
+    """Somas de prefixo com atualização pontual em O(log n)."""
+
+    def __init__(self, n):
+        self.n = n
+        self.tree = [0.0] * (n + 1)
+
+    def add(self, i, v):
+        i += 1
+        while i <= self.n:
+            self.tree[i] += v
+            i += i & -i
+
+    def soma(self, i):
+        """Soma das posições [0, i)."""
+        s = 0.0
+        while i > 0:
+            s += self.tree[i]
+            i -= i & -i
+        return s
+
+
+def _kth_desvio(s, p, med, k):
+    """
+    k-ésimo menor |r - med| (0-indexado) do multiconjunto ordenado `s`.
+
+    Os desvios são a união de duas sequências crescentes:
+        A_i = med - s[p-1-i]  (valores abaixo da mediana)
+        B_j = s[p+j] - med    (valores a partir da mediana)
+    e a seleção é feita por busca binária em quantos vêm de A.
+    """
+    la = p
+    lb = len(s) - p
+    lo = max(0, k + 1 - lb)
+    hi = min(k + 1, la)
+
+    while True:
+        i = (lo + hi) // 2
+        j = k + 1 - i
+        if i < la and j > 0 and s[p + j - 1] - med > med - s[p - 1 - i]:
+            lo = i + 1
+        elif i > 0 and j < lb and med - s[p - i] > s[p + j] - med:
+            hi = i - 1
+        else:
+            a = med - s[p - i] if i > 0 else -math.inf
+            b = s[p + j - 1] - med if j > 0 else -math.inf
+            return max(a, b)
+
+
+def vol_robusta_prefixos(closes, clip_k=3.0):
+    """
+    Volatilidade robusta (MAD + winsorização) de cada prefixo, em %
+    (como calcular_volatilidade_robusta).
+
+    Mediana e MAD saem de uma lista ordenada mantida por inserção; as somas
+    dos retornos dentro de [low, high] saem de árvores de Fenwick indexadas
+    pelo rank global de cada retorno.
+    """
+    n = len(closes)
+    rets = _retornos(closes)
+    std = vol_std_prefixos(closes)
+
+    glob = sorted(rets.tolist())
+    rank = np.empty(len(rets), dtype=int)
+    rank[np.argsort(rets, kind="stable")] = np.arange(len(rets))
+
+    f1 = _Fenwick(len(rets))
+    f2 = _Fenwick(len(rets))
+
+    s = []
+    pct = np.full(n + 1, np.nan)
+    fallback_std = []
+
+    for m, r in enumerate(rets.tolist(), start=1):
+        bisect.insort(s, r)
+        f1.add(int(rank[m - 1]), r)
+        f2.add(int(rank[m - 1]), r * r)
+
+        t = m + 1  # prefixo closes[:t]
+        if m < 10:
+            continue
+
+        half = m // 2
+        med = s[half] if m % 2 else (s[half - 1] + s[half]) / 2
+
+        p = bisect.bisect_left(s, med)
+        if m % 2:
+            mad = _kth_desvio(s, p, med, half)
+        else:
+            mad = (_kth_desvio(s, p, med, half - 1) + _kth_desvio(s, p, med, half)) / 2
+
+        sigma = 1.4826 * mad if mad and mad > 0 else None
+        if sigma is None:
+            fallback_std.append(t)
+            continue
+
+        low = med - clip_k * sigma
+        high = med + clip_k * sigma
+
+        n_low = bisect.bisect_left(s, low)
+        n_high = m - bisect.bisect_right(s, high)
+
+        g_lo = bisect.bisect_left(glob, low)
+        g_hi = bisect.bisect_right(glob, high)
+        soma = f1.soma(g_hi) - f1.soma(g_lo) + n_low * low + n_high * high
+        soma2 = f2.soma(g_hi) - f2.soma(g_lo) + n_low * low * low + n_high * high * high
+
+        var = (soma2 - soma * soma / m) / (m - 1)
+        pct[t] = math.sqrt(max(var, 0.0)) * 100
+
+    out = _arredondar(pct, closes, lambda p: calcular_volatilidade_robusta(p, clip_k=clip_k))
+    for t in fallback_std:
+        out[t] = std[t]
+    return out
+
+
+def vol_prefixos(closes, metodo="ewma"):
+    """Despacha para o método usado no backtest: 'std' | 'ewma' | 'rob'."""
+    if metodo == "std":
+        return vol_std_prefixos(closes)
+    if metodo == "rob":
+        return vol_robusta_prefixos(closes)
+    return vol_ewma_prefixos(closes)
@@ -1,21 +1,38 @@
-from flask import Flask, render_template, request, session, redirect, url_for
+from flask import (
+    Flask,
+    Response,
+    get_template_attribute,
+    jsonify,
+    render_template,
+    request,
+    session,
+    redirect,
+    stream_with_context,
+    url_for,
+)
 
-import requests
+import json
 import logging
 import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
 
-from config import BRAPI_KEY
+from config import BRAPI_KEY, HISTORY_DB_PATH, HISTORY_LIMIT, HISTORY_PAGE_SIZE
 
 from analysis.calibration import calibrar_k
 from analysis.backtest import backtest_faixa
 from analysis.indicators import analisar_indicadores
 from analysis.forecast import projetar_faixa
 
-from services.macro import get_macro_cards
+from services.history_store import get_history_store
+from services.macro import get_macro_cards, get_macro_refresher
+from services.quotes import get_quote_service
 from services.yf_history import fetch_history_yf
 
-from ml_engine.predict_service import predict_ticker
+from ml.cache import ohlcv_cache
+from ml_engine.model_loader import get_registry
+from ml_engine.predict_service import MODELS_DIR, predict_ticker, predict_tickers
 
 
 logging.basicConfig(
@@ -26,6 +43,28 @@ logging.basicConfig(
 app = Flask(__name__)
 app.secret_key = "investedu-secret-2024"
 
+# Pool compartilhado para as chamadas de rede independentes do /analyze
+# (preço, histórico e ML). Limitado para não abrir threads sem controle.
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="analyze")
+
+
+# Carrega todos os bundles lgbm_*.joblib uma única vez no startup.
+_models_footprint = get_registry(MODELS_DIR).load_all()
+print("MODELS LOADED:", {k: f"{v / 1e6:.1f} MB" for k, v in _models_footprint.items()})
+
+# Cards macro (BCB/brapi) atualizados em segundo plano; a home só lê o snapshot.
+get_macro_refresher(brapi_token=BRAPI_KEY)
+
+# Histórico de análises no servidor (SQLite); o cookie guarda só o id do usuário.
+_history = get_history_store(HISTORY_DB_PATH, HISTORY_LIMIT)
+
+
+def _timed(fn, *args, **kwargs):
+    """Executa fn e devolve (resultado, duração em ms)."""
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, round((time.perf_counter() - t0) * 1000, 1)
+
 
 # =========================================================
 # HOME
@@ -75,14 +114,37 @@ def faq():
 # =========================================================
 # HISTÓRICO
 # =========================================================
+def _user_id():
+    """Id anônimo do navegador; é a única coisa do histórico que vai no cookie."""
+
+    uid = session.get("uid")
+
+    if not uid:
+        uid = uuid.uuid4().hex
+        session["uid"] = uid
+        session.permanent = True
+
+    # histórico antigo guardado no próprio cookie
+    session.pop("historico", None)
+
+    return uid
+
+
 @app.get("/historico")
 def historico():
 
-    hist = session.get("historico", [])
+    page = max(1, request.args.get("page", 1, type=int))
+
+    hist, total = _history.page(_user_id(), page=page, per_page=HISTORY_PAGE_SIZE)
+
+    pages = max(1, -(-total // HISTORY_PAGE_SIZE))
 
     return render_template(
         "historico.html",
         historico=hist,
+        total=total,
+        page=page,
+        pages=pages,
         title="Histórico — InvestEdu"
     )
 
@@ -90,7 +152,7 @@ def historico():
 @app.get("/historico/limpar")
 def limpar_historico():
 
-    session.pop("historico", None)
+    _history.clear(_user_id())
 
     return redirect(url_for("historico"))
 
@@ -105,39 +167,19 @@ def get_stock_price(symbol: str):
     if not symbol:
         return None
 
-    url = "https://brapi.dev/api/quote/" + symbol
-
-    params = {
-        "token": BRAPI_KEY
-    }
-
-    try:
-
-        r = requests.get(
-            url,
-            params=params,
-            timeout=20
-        )
-
-        r.raise_for_status()
+    # cache de segundos + chamadas multi-ticker agrupadas (services.quotes)
+    price = get_quote_service(BRAPI_KEY).get_price(symbol)
 
-        data = r.json()
+    if price is None:
+        print("BRAPI PRICE ERROR:", symbol)
 
-        return float(
-            data["results"][0]["regularMarketPrice"]
-        )
-
-    except Exception as e:
-
-        print("BRAPI PRICE ERROR:", e)
-
-        return None
+    return price
 
 
 # =========================================================
 # SAVE HISTORY
 # =========================================================
-def _save_to_history(
+def _history_entry(
     ticker,
     dias,
     price,
@@ -148,9 +190,7 @@ def _save_to_history(
     bt_rob
 ):
 
-    hist = session.get("historico", [])
-
-    entry = {
+    return {
         "ticker": ticker,
         "dias": dias,
         "price": price,
@@ -171,12 +211,77 @@ def _save_to_history(
         "bt_rob": bt_rob,
     }
 
-    hist.append(entry)
 
-    if len(hist) > 20:
-        hist = hist[-20:]
+def _append_history(entry, user_id=None):
+
+    _history.add(user_id or _user_id(), entry)
+
+
+def _save_to_history(*args):
+
+    _append_history(_history_entry(*args))
+
+
+# =========================================================
+# ANALYSIS HELPERS
+# =========================================================
+def _ml_fallback(ticker, price):
+
+    return {
+        "ticker": ticker,
+        "prob_up": None,
+        "entry": price,
+        "stop_gain": None,
+        "stop_loss": None,
+        "volatility": None,
+        "sector": None,
+        "source": None,
+        "model_accuracy": None,
+        "top_positive": [],
+        "top_negative": [],
+    }
+
+
+def _backtests(history, dias):
+
+    return {
+        metodo: backtest_faixa(history, dias=dias, metodo=metodo)
+        for metodo in ("std", "ewma", "rob")
+    }
+
+
+def _calibracao(history, dias):
+
+    calib = calibrar_k(
+        historico=history,
+        dias=dias,
+        metodo="ewma",
+        target_coverage=0.8,
+    )
+
+    return calib.get("k_otimo"), calib.get("resultado")
+
+
+def _faixas(price, indicadores, dias):
+
+    def _proj(key):
+        vol = indicadores.get(key)
+        return projetar_faixa(price, vol, dias=dias) if vol is not None else None
+
+    return {
+        "faixa": projetar_faixa(price, indicadores["volatilidade"], dias=dias),
+        "faixa_std": _proj("vol_std"),
+        "faixa_ewma": _proj("vol_ewma"),
+        "faixa_rob": _proj("vol_robusta"),
+    }
+
+
+def _faixa_calibrada(price, indicadores, dias, k_otimo):
+
+    if k_otimo is None:
+        return None
 
-    session["historico"] = hist
+    return projetar_faixa(price, indicadores["volatilidade"], dias=dias, k=k_otimo)
 
 
 # =========================================================
@@ -187,31 +292,34 @@ def analyze():
     ticker = (request.form.get("ticker") or "").strip().upper()
     dias = int(request.form.get("dias", 10))
 
-    # PRICE
-    price = get_stock_price(ticker)
+    # =====================================================
+    # FAN-OUT: PRICE + HISTORY + MACHINE LEARNING
+    # =====================================================
+    t0 = time.perf_counter()
 
-    # HISTORY
-    history, history_meta = fetch_history_yf(
-        ticker=ticker, period="2y", interval="1d", min_rows=60
+    price_future = _executor.submit(_timed, get_stock_price, ticker)
+    history_future = _executor.submit(
+        _timed,
+        fetch_history_yf,
+        ticker=ticker,
+        period="2y",
+        interval="1d",
+        min_rows=60,
     )
+    ml_future = _executor.submit(_timed, predict_ticker, ticker, dias=dias)
+
+    price, price_ms = price_future.result()
+    (history, history_meta), history_ms = history_future.result()
 
     try:
-        ml_result = predict_ticker(ticker, dias=dias)
-    except Exception as e:
+        ml_result, ml_ms = ml_future.result()
+    except (Exception, SystemExit) as e:
+        # ml.decision sinaliza falhas com SystemExit (herança do CLI)
         print("ML ERROR:", e)
-        ml_result = {
-            "ticker": ticker,
-            "prob_up": 50.0,
-            "entry": price or 45.0,
-            "stop_gain": None,
-            "stop_loss": None,
-            "volatility": 0.025,
-            "sector": "GLOBAL",
-            "source": "error",
-            "model_accuracy": 0.65,
-            "top_positive": [],
-            "top_negative": [],
-        }
+        ml_ms = None
+        ml_result = _ml_fallback(ticker, price)
+
+    fanout_ms = round((time.perf_counter() - t0) * 1000, 1)
 
     print(
         "AUDIT:",
@@ -222,34 +330,16 @@ def analyze():
             "price_source": "brapi",
             "history_source": "yfinance",
             "meta": history_meta,
+            "timings_ms": {
+                "price": price_ms,
+                "history": history_ms,
+                "ml": ml_ms,
+                "fanout": fanout_ms,
+            },
+            "ohlcv_cache": ohlcv_cache.stats(),
         }
     )
 
-    # =====================================================
-    # MACHINE LEARNING
-    # =====================================================
-    try:
-
-        ml_result = predict_ticker(ticker)
-
-    except Exception as e:
-
-        print("ML ERROR:", e)
-
-        ml_result = {
-            "ticker": ticker,
-            "prob_up": None,
-            "entry": price,
-            "stop_gain": None,
-            "stop_loss": None,
-            "volatility": None,
-            "sector": None,
-            "source": None,
-            "model_accuracy": None,
-            "top_positive": [],
-            "top_negative": [],
-        }
-
     # =====================================================
     # HISTORY VALIDATION
     # =====================================================
@@ -313,91 +403,28 @@ def analyze():
     # =====================================================
     # BACKTESTS
     # =====================================================
-    bt_std = backtest_faixa(
-        history,
-        dias=dias,
-        metodo="std"
-    )
-
-    bt_ewma = backtest_faixa(
-        history,
-        dias=dias,
-        metodo="ewma"
-    )
+    bts = _backtests(history, dias)
 
-    bt_rob = backtest_faixa(
-        history,
-        dias=dias,
-        metodo="rob"
-    )
+    bt_std = bts["std"]
+    bt_ewma = bts["ewma"]
+    bt_rob = bts["rob"]
 
     # =====================================================
     # CALIBRATION
     # =====================================================
-    calib = calibrar_k(
-        historico=history,
-        dias=dias,
-        metodo="ewma",
-        target_coverage=0.8,
-    )
-
-    k_otimo = calib.get("k_otimo")
-
-    bt_calibrado = calib.get("resultado")
+    k_otimo, bt_calibrado = _calibracao(history, dias)
 
     # =====================================================
     # FORECASTS
     # =====================================================
-    faixa = projetar_faixa(
-        price,
-        indicadores["volatilidade"],
-        dias=dias
-    )
+    faixas = _faixas(price, indicadores, dias)
 
-    faixa_std = (
-        projetar_faixa(
-            price,
-            indicadores["vol_std"],
-            dias=dias
-        )
+    faixa = faixas["faixa"]
+    faixa_std = faixas["faixa_std"]
+    faixa_ewma = faixas["faixa_ewma"]
+    faixa_rob = faixas["faixa_rob"]
 
-        if indicadores.get("vol_std") is not None
-        else None
-    )
-
-    faixa_ewma = (
-        projetar_faixa(
-            price,
-            indicadores["vol_ewma"],
-            dias=dias
-        )
-
-        if indicadores.get("vol_ewma") is not None
-        else None
-    )
-
-    faixa_rob = (
-        projetar_faixa(
-            price,
-            indicadores["vol_robusta"],
-            dias=dias
-        )
-
-        if indicadores.get("vol_robusta") is not None
-        else None
-    )
-
-    faixa_calibrada = (
-        projetar_faixa(
-            price,
-            indicadores["volatilidade"],
-            dias=dias,
-            k=k_otimo
-        )
-
-        if k_otimo is not None
-        else None
-    )
+    faixa_calibrada = _faixa_calibrada(price, indicadores, dias, k_otimo)
 
     # =====================================================
     # SAVE HISTORY
@@ -451,6 +478,302 @@ def analyze():
     )
 
 
+# =========================================================
+# ANALYZE (STREAMING / SSE)
+# =========================================================
+_SECTIONS_TEMPLATE = "_dashboard_sections.html"
+
+_INDICADORES_VAZIOS = {
+    "tendencia": "Tendência Indefinida",
+    "rsi": None,
+    "volatilidade": None,
+    "drawdown": None,
+    "risco": "Risco Indefinido",
+}
+
+
+def _section(macro, *args):
+
+    return str(get_template_attribute(_SECTIONS_TEMPLATE, macro)(*args))
+
+
+def _sse(event, payload):
+
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+
+def _chart_points(history):
+
+    return [
+        {
+            "date": h["date"] if isinstance(h["date"], str) else h["date"].strftime("%Y-%m-%d"),
+            "close": h["close"],
+        }
+        for h in history
+    ]
+
+
+@app.get("/analyze/live")
+def analyze_live():
+    """Esqueleto do dashboard; as seções chegam depois via /analyze/stream."""
+    ticker = (request.args.get("ticker") or "").strip().upper()
+    dias = int(request.args.get("dias", 10))
+    # garante o cookie com o id antes do stream, que grava no histórico
+    _user_id()
+
+    return render_template(
+        "dashboard.html",
+
+        streaming=True,
+
+        ticker=ticker,
+        price=None,
+        history=[],
+
+        indicadores=None,
+
+        faixa=None,
+        faixa_std=None,
+        faixa_ewma=None,
+        faixa_rob=None,
+
+        dias=dias,
+
+        error=None,
+
+        history_meta=None,
+
+        bt_std=None,
+        bt_ewma=None,
+        bt_rob=None,
+
+        k_otimo=None,
+        bt_calibrado=None,
+        faixa_calibrada=None,
+
+        ml_result=None,
+
+        title=f"{ticker} — InvestEdu",
+    )
+
+
+@app.get("/analyze/stream")
+def analyze_stream():
+    """
+    Mesmo cálculo do POST /analyze, mas cada seção é enviada (SSE) assim
+    que suas dependências terminam: a primeira aparece no tempo da fonte
+    mais rápida, não da mais lenta.
+    """
+    ticker = (request.args.get("ticker") or "").strip().upper()
+    dias = int(request.args.get("dias", 10))
+    # lido antes de começar o stream: o cookie não muda mais depois disso
+    user_id = _user_id()
+
+    def generate():
+        t0 = time.perf_counter()
+
+        pending = {
+            _executor.submit(_timed, get_stock_price, ticker): "price",
+            _executor.submit(
+                _timed,
+                fetch_history_yf,
+                ticker=ticker,
+                period="2y",
+                interval="1d",
+                min_rows=60,
+            ): "history",
+            _executor.submit(_timed, predict_ticker, ticker, dias=dias): "ml",
+        }
+
+        done = {}
+        timings = {}
+        sent = set()
+
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for fut in finished:
+                name = pending.pop(fut)
+                try:
+                    done[name], timings[name] = fut.result()
+                except (Exception, SystemExit) as e:
+                    print(f"STREAM {name.upper()} ERROR:", e)
+                    done[name], timings[name] = None, None
+
+                if name == "history":
+                    history, history_meta = done["history"] or ([], None)
+                    done["history"] = history
+                    done["history_meta"] = history_meta
+                    if history:
+                        done["indicadores"] = analisar_indicadores(history)
+                        pending[_executor.submit(_timed, _backtests, history, dias)] = "backtests"
+                        pending[_executor.submit(_timed, _calibracao, history, dias)] = "calibration"
+
+            price = done.get("price")
+            indicadores = done.get("indicadores")
+
+            if "price" in done and "quote" not in sent:
+                sent.add("quote")
+                yield _sse("quote", {"sections": {"quote": _section("quote_kpi", price)}})
+
+            if "history" in done and "indicators" not in sent:
+                sent.add("indicators")
+                if not done["history"]:
+                    yield _sse("failure", {"error": "Histórico insuficiente para análise (min 60 candles)."})
+                else:
+                    yield _sse("history", {"history": _chart_points(done["history"])})
+                shown = indicadores or _INDICADORES_VAZIOS
+                yield _sse("indicators", {"sections": {
+                    "vol": _section("volatility_card", shown),
+                    "rsi": _section("rsi_card", shown),
+                    "trend": _section("trend_card", shown),
+                }})
+
+            if "price" in done and indicadores and price is not None and "bands" not in sent:
+                sent.add("bands")
+                done["faixas"] = _faixas(price, indicadores, dias)
+                f = done["faixas"]
+                yield _sse("bands", {"sections": {
+                    "bands": _section("bands_grid", f["faixa"], f["faixa_std"], f["faixa_ewma"], f["faixa_rob"]),
+                }})
+
+            if "calibration" in done and "price" in done and "calibration" not in sent:
+                sent.add("calibration")
+                k_otimo, _ = done["calibration"] or (None, None)
+                faixa_calibrada = (
+                    _faixa_calibrada(price, indicadores, dias, k_otimo)
+                    if price is not None
+                    else None
+                )
+                yield _sse("calibration", {"sections": {
+                    "calibration": _section("calibrated_band", faixa_calibrada, k_otimo),
+                }})
+
+            if "backtests" in done and "calibration" in done and "backtests" not in sent:
+                sent.add("backtests")
+                bts = done["backtests"] or {}
+                _, bt_calibrado = done["calibration"] or (None, None)
+                yield _sse("backtests", {"sections": {
+                    "backtests": _section(
+                        "backtests_table", dias, bts.get("std"), bts.get("ewma"), bts.get("rob"), bt_calibrado
+                    ),
+                }})
+
+            if "ml" in done and "price" in done and "ml" not in sent:
+                sent.add("ml")
+                ml_result = done["ml"] or _ml_fallback(ticker, price)
+                yield _sse("ml", {"sections": {"ml": _section("ml_section", ml_result)}})
+
+        bts = done.get("backtests") or {}
+        faixas = done.get("faixas") or {}
+        _append_history(_history_entry(
+            ticker,
+            dias,
+            done.get("price"),
+            done.get("indicadores"),
+            faixas.get("faixa"),
+            bts.get("std"),
+            bts.get("ewma"),
+            bts.get("rob"),
+        ), user_id=user_id)
+
+        print(
+            "AUDIT:",
+            {
+                "endpoint": "/analyze/stream",
+                "ts": int(time.time()),
+                "ticker": ticker,
+                "price_source": "brapi",
+                "history_source": "yfinance",
+                "meta": done.get("history_meta"),
+                "timings_ms": {
+                    **timings,
+                    "total": round((time.perf_counter() - t0) * 1000, 1),
+                },
+                "ohlcv_cache": ohlcv_cache.stats(),
+            }
+        )
+
+        yield _sse("done", {})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# =========================================================
+# API: PREVISÃO EM LOTE
+# =========================================================
+_API_PREDICT_MAX_TICKERS = 120  # cobre a carteira do IBOV inteira
+
+
+@app.route("/api/predict", methods=["GET", "POST"])
+def api_predict():
+    """
+    GET  /api/predict?tickers=PETR4,VALE3&dias=10
+    POST /api/predict  {"tickers": ["PETR4", "VALE3"], "dias": 10}
+    """
+    if request.method == "POST":
+        payload = request.get_json(silent=True) or {}
+        tickers = payload.get("tickers") or []
+        dias = payload.get("dias", 10)
+    else:
+        tickers = (request.args.get("tickers") or "").split(",")
+        dias = request.args.get("dias", 10)
+
+    if isinstance(tickers, str):
+        tickers = tickers.split(",")
+
+    tickers = [str(t).strip().upper() for t in tickers if str(t).strip()]
+
+    try:
+        dias = int(dias)
+    except (TypeError, ValueError):
+        return jsonify({"error": "dias deve ser inteiro"}), 400
+
+    if not tickers:
+        return jsonify({"error": "informe ao menos um ticker"}), 400
+
+    if len(tickers) > _API_PREDICT_MAX_TICKERS:
+        return jsonify({"error": f"máximo de {_API_PREDICT_MAX_TICKERS} tickers por chamada"}), 400
+
+    results, ms = _timed(predict_tickers, tickers, dias=dias)
+
+    print(
+        "AUDIT:",
+        {
+            "endpoint": "/api/predict",
+            "ts": int(time.time()),
+            "tickers": len(tickers),
+            "errors": sum(1 for r in results if "error" in r),
+            "timings_ms": {"predict": ms},
+        }
+    )
+
+    return jsonify({"dias": dias, "results": results})
+
+
+# =========================================================
+# API: COTAÇÕES
+# =========================================================
+@app.get("/api/quotes")
+def api_quotes():
+    """GET /api/quotes?tickers=PETR4,VALE3 -> uma chamada à brapi para todos."""
+    tickers = [t for t in (request.args.get("tickers") or "").split(",") if t.strip()]
+
+    if not tickers:
+        return jsonify({"error": "informe ao menos um ticker"}), 400
+
+    if len(tickers) > _API_PREDICT_MAX_TICKERS:
+        return jsonify({"error": f"máximo de {_API_PREDICT_MAX_TICKERS} tickers por chamada"}), 400
+
+    quotes = get_quote_service(BRAPI_KEY).get_quotes(tickers)
+
+    return jsonify({"quotes": quotes})
+
+
 # =========================================================
 # MAIN
 # =========================================================
@@ -7,3 +7,8 @@ BRAPI_KEY = os.getenv("API_KEY_BRAPI")
 
 if not BRAPI_KEY:
     raise RuntimeError("API_KEY_BRAPI não encontrada. Configure no arquivo .env")
+
+# Histórico de análises (guardado no servidor; o cookie só leva o id do usuário)
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "data/history.sqlite3")
+HISTORY_LIMIT = int(os.getenv("HISTORY_LIMIT", "500"))
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
@@ -0,0 +1,85 @@
+"""
+Compara o build_feature_frame antigo (pandas, merges por data) com o motor
+colunar: tempo e pico de memória (tracemalloc) por ticker.
+
+    python -m ml.benchmark
+    python -m ml.benchmark --anos 1 5 10 --repeticoes 10
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from ml.features import build_feature_frame, build_feature_frame_pandas, fundamentals_snapshots
+
+PREGOES_POR_ANO = 252
+
+
+def _ticker_sintetico(n, seed=0):
+    """OHLCV + macro, fundamentos e notícias no formato que o train usa."""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2015-01-01", periods=n).strftime("%Y-%m-%d")
+    close = 30.0 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, n)))
+    ohlcv = pd.DataFrame(
+        {
+            "date": dates,
+            "open": close * (1 + rng.normal(0, 0.005, n)),
+            "high": close * (1 + np.abs(rng.normal(0, 0.01, n))),
+            "low": close * (1 - np.abs(rng.normal(0, 0.01, n))),
+            "close": close,
+            "volume": rng.integers(100_000, 5_000_000, n).astype(float),
+        }
+    )
+
+    macro = pd.DataFrame({"date": dates})
+    for col in ["selic", "ipca", "usd_brl", "ibov_close", "brent_close", "spx_close", "vix_close"]:
+        macro[col] = rng.normal(10, 1, n)
+
+    # um snapshot de fundamentos por trimestre
+    fundamentals = fundamentals_snapshots(
+        (d, {"results": [{"defaultKeyStatistics": {"trailingPE": 8.0 + k, "priceToBook": 1.2}}]})
+        for k, d in enumerate(dates[::63])
+    )
+
+    news = pd.DataFrame({"date": dates[::3], "news_count": 2.0, "news_sent_mean": 0.1})
+    return ohlcv, fundamentals, macro, news
+
+
+def _medir(fn, args, repeticoes):
+    """(saída, segundos por chamada, pico em MB)."""
+    out = fn(*args)  # aquece imports/caches fora da medida
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    for _ in range(repeticoes):
+        out = fn(*args)
+    segundos = (time.perf_counter() - t0) / repeticoes
+    pico = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return out, segundos, pico
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark do build_feature_frame (pandas x colunar)")
+    ap.add_argument("--anos", type=int, nargs="*", default=[1, 5, 10])
+    ap.add_argument("--repeticoes", type=int, default=5)
+    args = ap.parse_args()
+
+    print(
+        f"{'série':>6} {'ref (ms)':>9} {'novo (ms)':>10} {'speedup':>8} "
+        f"{'ref (MB)':>9} {'novo (MB)':>10} {'redução':>8} {'colunas':>9}"
+    )
+    for anos in args.anos:
+        dados = _ticker_sintetico(anos * PREGOES_POR_ANO, seed=anos)
+        ref, t_ref, m_ref = _medir(build_feature_frame_pandas, dados, args.repeticoes)
+        novo, t_novo, m_novo = _medir(build_feature_frame, dados, args.repeticoes)
+        print(
+            f"{str(anos) + 'y':>6} {t_ref * 1000:>9.1f} {t_novo * 1000:>10.1f} {t_ref / t_novo:>7.1f}x "
+            f"{m_ref:>9.2f} {m_novo:>10.2f} {m_ref / m_novo:>7.1f}x "
+            f"{len(ref.columns):>4}/{len(novo.columns):<4}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Hashable, Optional
+from zoneinfo import ZoneInfo
+
+B3_TZ = ZoneInfo("America/Sao_Paulo")
+B3_OPEN_HOUR = 10
+B3_CLOSE_HOUR = 18  # inclui o call de fechamento
+
+# durante o pregão o último candle ainda está mudando
+INTRADAY_TTL = 60.0
+IN_SESSION_TTL = 300.0
+# resposta vazia (ex.: brapi 401/429) não fica presa até o próximo pregão
+EMPTY_TTL = 300.0
+
+_DAILY_INTERVALS = {"1d", "5d", "1wk", "1mo", "3mo"}
+
+
+def _next_session_open(now: datetime) -> datetime:
+    day = now.date()
+    if now.hour >= B3_OPEN_HOUR:
+        day += timedelta(days=1)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return datetime(day.year, day.month, day.day, B3_OPEN_HOUR, tzinfo=B3_TZ)
+
+
+def session_expiry(interval: str, now: Optional[float] = None) -> float:
+    """
+    Timestamp (epoch) em que um histórico de `interval` deixa de ser válido.
+
+    - Durante o pregão da B3: TTL curto (o candle atual ainda se move).
+    - Fora do pregão: válido até a próxima abertura (feriados ignorados).
+    """
+    ts = time.time() if now is None else now
+    local = datetime.fromtimestamp(ts, B3_TZ)
+
+    in_session = local.weekday() < 5 and B3_OPEN_HOUR <= local.hour < B3_CLOSE_HOUR
+    if in_session:
+        ttl = IN_SESSION_TTL if interval in _DAILY_INTERVALS else INTRADAY_TTL
+        return ts + ttl
+
+    return _next_session_open(local).timestamp()
+
+
+class TTLCache:
+    """
+    Cache LRU com expiração por entrada e contadores de hit/miss.
+
+    get_or_load() garante uma única carga por chave quando várias threads
+    pedem o mesmo item ao mesmo tempo (as demais esperam o resultado).
+    """
+
+    def __init__(self, maxsize: int = 256) -> None:
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get_locked(self, key: Hashable, now: float) -> tuple[bool, Any]:
+        item = self._data.get(key)
+        if item is None:
+            return False, None
+        expires_at, value = item
+        if expires_at <= now:
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            found, value = self._get_locked(key, time.time())
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, expires_at: float) -> None:
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Any],
+        expires_at: Callable[[Any], float],
+    ) -> Any:
+        with self._lock:
+            found, value = self._get_locked(key, time.time())
+            if found:
+                self.hits += 1
+                return value
+            key_lock = self._inflight.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # outra thread pode ter carregado enquanto esperávamos
+            with self._lock:
+                found, value = self._get_locked(key, time.time())
+                if found:
+                    self.hits += 1
+                    return value
+                self.misses += 1
+
+            try:
+                value = loader()
+                self.set(key, value, expires_at(value))
+                return value
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Cache de OHLCV compartilhado entre web (services.yf_history) e ML (ml.sources).
+# Chave: (fonte, ticker, interval, range). Os DataFrames guardados não devem
+# ser modificados por quem lê.
+ohlcv_cache = TTLCache(maxsize=256)
+
+
+def cached_ohlcv(source: str, ticker: str, interval: str, range_: str, loader: Callable[[], Any]) -> Any:
+    def _expiry(df: Any) -> float:
+        if df is None or getattr(df, "empty", True):
+            return time.time() + EMPTY_TTL
+        return session_expiry(interval)
+
+    return ohlcv_cache.get_or_load((source, ticker, interval, range_), loader, _expiry)
@@ -3,7 +3,9 @@ from __future__ import annotations
 import sqlite3
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
 
 
 @dataclass(frozen=True)
@@ -34,6 +36,12 @@ CREATE TABLE IF NOT EXISTS prices (
   PRIMARY KEY (ticker, date)
 );
 
+-- primeiro pregão que as fontes têm para o ticker (listado depois do período pedido)
+CREATE TABLE IF NOT EXISTS price_starts (
+  ticker TEXT PRIMARY KEY,
+  first_date TEXT NOT NULL
+);
+
 CREATE TABLE IF NOT EXISTS fundamentals (
   ticker TEXT NOT NULL,
   asof TEXT NOT NULL,
@@ -53,6 +61,32 @@ CREATE TABLE IF NOT EXISTS macro (
   vix_close REAL,
   source TEXT NOT NULL
 );
+
+CREATE TABLE IF NOT EXISTS news (
+  ticker TEXT NOT NULL,
+  date TEXT NOT NULL,
+  headline_hash TEXT NOT NULL,
+  headline TEXT NOT NULL,
+  sent_score REAL NOT NULL,
+  fetched_at TEXT NOT NULL,
+  PRIMARY KEY (ticker, date, headline_hash)
+);
+
+-- vals: float32 na ordem de features.FEATURE_COLS (NaN = sem valor)
+CREATE TABLE IF NOT EXISTS features (
+  ticker TEXT NOT NULL,
+  date TEXT NOT NULL,
+  feature_version TEXT NOT NULL,
+  vals BLOB NOT NULL,
+  PRIMARY KEY (ticker, date, feature_version)
+);
+
+CREATE TABLE IF NOT EXISTS news_feeds (
+  url TEXT PRIMARY KEY,
+  etag TEXT,
+  last_modified TEXT,
+  fetched_at TEXT NOT NULL
+);
 """
 
 
@@ -95,4 +129,214 @@ def upsert_ticker(
           last_updated=excluded.last_updated
         """,
         (ticker, yf_symbol, sector, industry, last_updated),
-    )
\ No newline at end of file
+    )
+
+def load_tickers(con: sqlite3.Connection) -> List[Tuple[str, Optional[str], Optional[str], Optional[str]]]:
+    """(ticker, sector, industry, last_updated) de todos os tickers conhecidos."""
+    cur = con.execute("SELECT ticker, sector, industry, last_updated FROM tickers")
+    return list(cur.fetchall())
+
+
+def upsert_prices(con: sqlite3.Connection, ticker: str, df: pd.DataFrame, source: str) -> None:
+    def _f(v) -> Optional[float]:
+        return float(v) if pd.notna(v) else None
+
+    rows = (
+        (ticker, str(r.date), _f(r.open), _f(r.high), _f(r.low), _f(r.close), _f(r.volume), source)
+        for r in df[["date", "open", "high", "low", "close", "volume"]].itertuples(index=False)
+    )
+    executemany(
+        con,
+        """
+        INSERT OR REPLACE INTO prices (ticker, date, open, high, low, close, volume, source)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        rows,
+    )
+
+
+def load_prices(con: sqlite3.Connection, ticker: str, start: Optional[str] = None) -> pd.DataFrame:
+    """OHLCV diário salvo para o ticker (date, open, high, low, close, volume, source)."""
+    sql = "SELECT date, open, high, low, close, volume, source FROM prices WHERE ticker = ?"
+    params: list = [ticker]
+    if start:
+        sql += " AND date >= ?"
+        params.append(start)
+    return pd.read_sql_query(sql + " ORDER BY date", con, params=params)
+
+
+def upsert_fundamentals(con: sqlite3.Connection, ticker: str, asof: str, payload_json: str, source: str) -> None:
+    """Snapshot dos fundamentos em `asof`; outro snapshot do mesmo dia substitui o anterior."""
+    con.execute(
+        """
+        INSERT OR REPLACE INTO fundamentals (ticker, asof, payload_json, source)
+        VALUES (?, ?, ?, ?)
+        """,
+        (ticker, asof, payload_json, source),
+    )
+
+
+def load_fundamentals(con: sqlite3.Connection, ticker: str, end: Optional[str] = None) -> List[Tuple[str, str]]:
+    """(asof, payload_json) salvos do ticker, em ordem de asof (até `end`, inclusive)."""
+    sql = "SELECT asof, payload_json FROM fundamentals WHERE ticker = ?"
+    params: list = [ticker]
+    if end:
+        sql += " AND asof <= ?"
+        params.append(end)
+    return list(con.execute(sql + " ORDER BY asof", params).fetchall())
+
+
+MACRO_COLS = ["selic", "ipca", "usd_brl", "ibov_close", "brent_close", "spx_close", "vix_close"]
+
+
+def upsert_macro(con: sqlite3.Connection, df: pd.DataFrame, source: str) -> None:
+    """
+    Linhas diárias de macro (date + MACRO_COLS). Valor ausente (coluna fora do
+    df ou NaN) não apaga o que já estava salvo: cada fonte completa a linha.
+    """
+    def _f(v) -> Optional[float]:
+        return float(v) if pd.notna(v) else None
+
+    frame = df.reindex(columns=["date", *MACRO_COLS])
+    rows = ((str(r[0]), *(_f(v) for v in r[1:]), source) for r in frame.itertuples(index=False))
+    executemany(
+        con,
+        """
+        INSERT INTO macro (date, selic, ipca, usd_brl, ibov_close, brent_close, spx_close, vix_close, source)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(date) DO UPDATE SET
+          selic=COALESCE(excluded.selic, macro.selic),
+          ipca=COALESCE(excluded.ipca, macro.ipca),
+          usd_brl=COALESCE(excluded.usd_brl, macro.usd_brl),
+          ibov_close=COALESCE(excluded.ibov_close, macro.ibov_close),
+          brent_close=COALESCE(excluded.brent_close, macro.brent_close),
+          spx_close=COALESCE(excluded.spx_close, macro.spx_close),
+          vix_close=COALESCE(excluded.vix_close, macro.vix_close),
+          source=excluded.source
+        """,
+        rows,
+    )
+
+
+def load_macro(con: sqlite3.Connection, start: Optional[str] = None) -> pd.DataFrame:
+    """Macro diário salvo (date + MACRO_COLS + source), em ordem de data."""
+    sql = f"SELECT date, {', '.join(MACRO_COLS)}, source FROM macro"
+    params: list = []
+    if start:
+        sql += " WHERE date >= ?"
+        params.append(start)
+    return pd.read_sql_query(sql + " ORDER BY date", con, params=params)
+
+
+def set_price_start(con: sqlite3.Connection, ticker: str, first_date: str) -> None:
+    con.execute(
+        "INSERT OR REPLACE INTO price_starts (ticker, first_date) VALUES (?, ?)",
+        (ticker, first_date),
+    )
+
+
+def load_price_start(con: sqlite3.Connection, ticker: str) -> Optional[str]:
+    """Primeiro pregão disponível nas fontes, se um download completo já mostrou que não há antes."""
+    row = con.execute("SELECT first_date FROM price_starts WHERE ticker = ?", (ticker,)).fetchone()
+    return row[0] if row else None
+
+
+def insert_news(con: sqlite3.Connection, ticker: str, rows: Iterable[tuple]) -> int:
+    """
+    rows: (date, headline_hash, headline, sent_score, fetched_at).
+    Manchete já salva é ignorada (o primeiro score fica). Retorna quantas entraram.
+    """
+    before = con.total_changes
+    executemany(
+        con,
+        """
+        INSERT OR IGNORE INTO news (ticker, date, headline_hash, headline, sent_score, fetched_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        ((ticker, *r) for r in rows),
+    )
+    return con.total_changes - before
+
+
+def load_news(
+    con: sqlite3.Connection,
+    ticker: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+) -> pd.DataFrame:
+    """Manchetes salvas do ticker (date, headline, sent_score)."""
+    sql = "SELECT date, headline, sent_score FROM news WHERE ticker = ?"
+    params: list = [ticker]
+    if start:
+        sql += " AND date >= ?"
+        params.append(start)
+    if end:
+        sql += " AND date <= ?"
+        params.append(end)
+    return pd.read_sql_query(sql + " ORDER BY date", con, params=params)
+
+
+def load_news_feeds(con: sqlite3.Connection, urls: List[str]) -> Dict[str, Tuple[Optional[str], Optional[str], str]]:
+    """{url: (etag, last_modified, fetched_at)} dos feeds já consultados."""
+    if not urls:
+        return {}
+    marks = ",".join("?" for _ in urls)
+    cur = con.execute(f"SELECT url, etag, last_modified, fetched_at FROM news_feeds WHERE url IN ({marks})", urls)
+    return {url: (etag, lm, fetched) for url, etag, lm, fetched in cur.fetchall()}
+
+
+def upsert_news_feed(
+    con: sqlite3.Connection,
+    url: str,
+    etag: Optional[str],
+    last_modified: Optional[str],
+    fetched_at: str,
+) -> None:
+    con.execute(
+        """
+        INSERT INTO news_feeds (url, etag, last_modified, fetched_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(url) DO UPDATE SET
+          etag=excluded.etag,
+          last_modified=excluded.last_modified,
+          fetched_at=excluded.fetched_at
+        """,
+        (url, etag, last_modified, fetched_at),
+    )
+
+
+def upsert_features(con: sqlite3.Connection, ticker: str, version: str, rows: Iterable[Tuple[str, bytes]]) -> None:
+    """rows: (date, vals). Data já salva nesta versão é sobrescrita."""
+    executemany(
+        con,
+        """
+        INSERT OR REPLACE INTO features (ticker, date, feature_version, vals)
+        VALUES (?, ?, ?, ?)
+        """,
+        ((ticker, d, version, v) for d, v in rows),
+    )
+
+
+def load_features(
+    con: sqlite3.Connection,
+    ticker: str,
+    version: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+) -> List[Tuple[str, bytes]]:
+    """(date, vals) salvos do ticker nesta versão, em ordem de data."""
+    sql = "SELECT date, vals FROM features WHERE ticker = ? AND feature_version = ?"
+    params: list = [ticker, version]
+    if start:
+        sql += " AND date >= ?"
+        params.append(start)
+    if end:
+        sql += " AND date <= ?"
+        params.append(end)
+    return list(con.execute(sql + " ORDER BY date", params).fetchall())
+
+
+def feature_tickers(con: sqlite3.Connection, version: str) -> List[str]:
+    """Tickers com linhas salvas nesta versão."""
+    cur = con.execute("SELECT DISTINCT ticker FROM features WHERE feature_version = ? ORDER BY ticker", (version,))
+    return [t for (t,) in cur.fetchall()]
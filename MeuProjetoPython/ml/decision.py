@@ -1,59 +1,60 @@
 from __future__ import annotations
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Iterable, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 
 from ml.db import DBConfig, connect
-from ml.features import build_feature_frame
+from ml.feature_store import load_feature_row
+from ml.fundamentals_store import load_fundamentals_snapshots
+from ml.macro_store import load_macro_daily
 from ml.modeling import load_bundle
-from ml.sources import (
-    BrapiAuth,
-    fetch_fundamentals_brapi,
-    fetch_news_daily,
-    fetch_ohlcv_brapi,
-    fetch_ohlcv_yfinance,
-    fetch_sector_yfinance,
-)
-from ml.train import _choose_best_source, _fundamentals_to_daily
+from ml.news_store import load_news_daily, news_watermark
+from ml.price_store import load_ohlcv
+from ml.sources import BrapiAuth
+from ml.sectors import get_sector_cache
 
 
-def _load_macro(con) -> pd.DataFrame:
-    return pd.read_sql_query("SELECT * FROM macro ORDER BY date", con).drop(columns=["source"], errors="ignore")
+_CONTRIB_COLS = ["feature", "value", "contribution", "abs_contribution"]
 
 
-def _feature_contrib_frame(row: pd.DataFrame, bundle) -> pd.DataFrame:
-    X = row[bundle.feature_cols]
-
+def _feature_contrib_frames(X: pd.DataFrame, bundle) -> list:
+    """Contribuições (pred_contrib) de todas as linhas de X numa única chamada."""
     try:
         contrib = bundle.clf.predict(X, pred_contrib=True)
     except TypeError:
-        return pd.DataFrame(columns=["feature", "value", "contribution", "abs_contribution"])
+        return []
 
     contrib = np.asarray(contrib)
-    if contrib.ndim != 2 or contrib.shape[0] != 1:
-        return pd.DataFrame(columns=["feature", "value", "contribution", "abs_contribution"])
-
-    raw_contrib = contrib[0]
-    if len(raw_contrib) == len(bundle.feature_cols) + 1:
-        feature_contrib = raw_contrib[:-1]
-    else:
-        feature_contrib = raw_contrib[: len(bundle.feature_cols)]
+    if contrib.ndim != 2 or contrib.shape[0] != len(X):
+        return []
+
+    n_feat = len(bundle.feature_cols)
+    feature_contrib = contrib[:, :n_feat]
+
+    frames = []
+    for i in range(len(X)):
+        df_exp = pd.DataFrame(
+            {
+                "feature": bundle.feature_cols,
+                "value": X.iloc[i].reindex(bundle.feature_cols).tolist(),
+                "contribution": feature_contrib[i],
+            }
+        )
+        df_exp["abs_contribution"] = df_exp["contribution"].abs()
+        frames.append(df_exp.sort_values("abs_contribution", ascending=False).reset_index(drop=True))
+    return frames
 
-    values = X.iloc[0].to_dict()
 
-    df_exp = pd.DataFrame(
-        {
-            "feature": bundle.feature_cols,
-            "value": [values.get(f) for f in bundle.feature_cols],
-            "contribution": feature_contrib,
-        }
-    )
-    df_exp["abs_contribution"] = df_exp["contribution"].abs()
-    return df_exp.sort_values("abs_contribution", ascending=False).reset_index(drop=True)
+def _feature_contrib_frame(row: pd.DataFrame, bundle) -> pd.DataFrame:
+    frames = _feature_contrib_frames(row[bundle.feature_cols], bundle)
+    if len(frames) != 1:
+        return pd.DataFrame(columns=_CONTRIB_COLS)
+    return frames[0]
 
 
 def _show_feature_contributions(row: pd.DataFrame, bundle, top_n: int = 12) -> None:
@@ -101,21 +102,14 @@ def _show_feature_contributions(row: pd.DataFrame, bundle, top_n: int = 12) -> N
     print("=======================================================\n")
 
 
-def _predict_dict(
-    ticker: str,
-    db_path: str,
-    models_dir: str,
-    range_: str,
-    interval: str,
-    asof: Optional[str],
-    brapi_token: Optional[str],
-    brapi_bearer: Optional[str],
-    horizon: int = 10,          
-) -> Dict[str, float]:
-    auth = BrapiAuth(token=brapi_token, bearer=brapi_bearer)
-
-    sector, _ = fetch_sector_yfinance(ticker)
-    sector_key = (sector or "UNKNOWN").replace(" ", "_").upper()
+def _resolve_bundle(sector_key: str, models_dir: str, registry=None):
+    """(nome_do_arquivo, bundle) do setor, com fallback para o GLOBAL."""
+    if registry is not None:
+        # bundles já carregados em memória (ml_engine.model_loader)
+        found = registry.lookup(sector_key)
+        if found is None:
+            raise SystemExit(f"Model not found for sector: {sector_key}")
+        return found
 
     models_dir_p = Path(models_dir)
     model_path = models_dir_p / f"lgbm_{sector_key}.joblib"
@@ -125,50 +119,77 @@ def _predict_dict(
     if not model_path.exists():
         raise SystemExit(f"Model not found: {model_path}")
 
-    bundle = load_bundle(str(model_path))
-
-    df_yf = fetch_ohlcv_yfinance(ticker, range_=range_, interval=interval)
-    df_br = fetch_ohlcv_brapi(ticker, auth=auth, range_=range_, interval=interval)
-    best_df, src = _choose_best_source(df_yf, df_br)
-
-    if best_df.empty:
-        raise SystemExit("No price data available.")
+    return model_path.name, load_bundle(str(model_path))
 
-    fpay = fetch_fundamentals_brapi(ticker, auth=auth)
-    fundamentals_daily = _fundamentals_to_daily(fpay, best_df["date"])
-
-    news_daily = fetch_news_daily(
-        ticker=ticker,
-        company_name=ticker,
-        sector=sector,
-    )
 
+def _latest_feature_row(
+    ticker: str,
+    db_path: str,
+    auth: BrapiAuth,
+    range_: str,
+    interval: str,
+    asof: Optional[str],
+    sector: Optional[str],
+) -> Tuple[pd.DataFrame, str]:
+    """Última linha de features do ticker (até `asof`) e a fonte dos preços."""
     with connect(DBConfig(path=Path(db_path))) as con:
-        macro = _load_macro(con)
-
-    feat = build_feature_frame(best_df, fundamentals_daily, macro, news_daily)
-
-    if feat.empty:
-        raise SystemExit("Feature frame is empty.")
-
-    if asof:
-        feat = feat[feat["date"] <= asof].copy()
+        best_df, src = load_ohlcv(con, ticker, auth=auth, range_=range_, interval=interval)
+        if best_df.empty:
+            raise SystemExit("No price data available.")
+
+        macro = load_macro_daily(con, start=best_df["date"].astype(str).min())
+        news_daily = load_news_daily(con, ticker, company_name=ticker, sector=sector)
+        news_until = news_watermark(con, ticker, company_name=ticker, sector=sector)
+
+        fundamentals = load_fundamentals_snapshots(con, ticker, auth=auth)
+
+        # pregão fechado já calculado antes sai direto do feature store
+        row = load_feature_row(
+            con,
+            ticker,
+            best_df,
+            fundamentals,
+            macro,
+            news_daily,
+            asof=asof,
+            interval=interval,
+            news_until=news_until,
+        )
 
-    if feat.empty:
+    if row.empty:
         raise SystemExit("No feature rows available.")
 
-    row = feat.iloc[-1:].copy()
+    return row, src
+
 
-    missing_cols = [c for c in bundle.feature_cols if c not in row.columns]
+def _check_feature_cols(rows: pd.DataFrame, bundle) -> None:
+    missing_cols = [c for c in bundle.feature_cols if c not in rows.columns]
     if missing_cols:
         raise SystemExit(f"Missing feature columns: {missing_cols}")
 
-    X = row[bundle.feature_cols]
 
-    prob_up = float(bundle.clf.predict_proba(X)[:, 1][0])
-    sl_hat = float(bundle.reg_sl.predict(X)[0])
-    sg_hat = float(bundle.reg_sg.predict(X)[0])
-    vol_hat = float(bundle.reg_vol.predict(X)[0])
+def _score_rows(bundle, X: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Uma chamada por modelo sobre todas as linhas de X."""
+    return {
+        "prob_up": np.asarray(bundle.clf.predict_proba(X)[:, 1], dtype=float),
+        "sl": np.asarray(bundle.reg_sl.predict(X), dtype=float),
+        "sg": np.asarray(bundle.reg_sg.predict(X), dtype=float),
+        "vol": np.asarray(bundle.reg_vol.predict(X), dtype=float),
+    }
+
+
+def _result_dict(
+    ticker: str,
+    model_name: str,
+    src: str,
+    row: pd.DataFrame,
+    scores: Dict[str, np.ndarray],
+    i: int,
+    bundle,
+    horizon: int,
+) -> Dict[str, float]:
+    sl_hat = float(scores["sl"][i])
+    sg_hat = float(scores["sg"][i])
 
     entry = float(row["close"].iloc[0])
     stop_loss = entry * (1.0 + sl_hat)
@@ -176,22 +197,113 @@ def _predict_dict(
 
     return {
         "ticker": ticker,
-        "model": model_path.name,
+        "model": model_name,
         "source_used": src,
         "date": row["date"].iloc[0],
         "entry": entry,
-        "prob_up": prob_up,
+        "prob_up": float(scores["prob_up"][i]),
         "stop_loss_pct": sl_hat,
         "stop_gain_pct": sg_hat,
         "stop_loss": stop_loss,
         "stop_gain": stop_gain,
-        "future_vol_logstd": vol_hat,
+        "future_vol_logstd": float(scores["vol"][i]),
         "_row_for_explain": row,
         "_bundle_for_explain": bundle,
-        "horizon": horizon,                    
+        "horizon": horizon,
     }
 
 
+def _predict_dict(
+    ticker: str,
+    db_path: str,
+    models_dir: str,
+    range_: str,
+    interval: str,
+    asof: Optional[str],
+    brapi_token: Optional[str],
+    brapi_bearer: Optional[str],
+    horizon: int = 10,          
+    registry=None,
+) -> Dict[str, float]:
+    auth = BrapiAuth(token=brapi_token, bearer=brapi_bearer)
+
+    sector, _ = get_sector_cache(db_path).lookup(ticker)
+    sector_key = (sector or "UNKNOWN").replace(" ", "_").upper()
+
+    model_name, bundle = _resolve_bundle(sector_key, models_dir, registry)
+
+    row, src = _latest_feature_row(ticker, db_path, auth, range_, interval, asof, sector)
+    _check_feature_cols(row, bundle)
+
+    scores = _score_rows(bundle, row[bundle.feature_cols])
+    return _result_dict(ticker, model_name, src, row, scores, 0, bundle, horizon)
+
+
+def predict_batch(
+    tickers: Iterable[str],
+    db_path: str,
+    models_dir: str,
+    range_: str,
+    interval: str,
+    asof: Optional[str],
+    brapi_token: Optional[str],
+    brapi_bearer: Optional[str],
+    horizon: int = 10,
+    registry=None,
+    max_workers: int = 8,
+) -> Dict[str, Dict]:
+    """
+    Previsão para vários tickers de uma vez.
+
+    As linhas de features são montadas em paralelo (rede/banco) e agrupadas
+    por bundle de setor; cada grupo faz uma única chamada de clf, reg_sl,
+    reg_sg, reg_vol (e pred_contrib) sobre a matriz empilhada.
+
+    Retorna {ticker: resultado}; tickers que falharam vêm como
+    {"ticker": ..., "error": "..."}.
+    """
+    auth = BrapiAuth(token=brapi_token, bearer=brapi_bearer)
+    sectors = get_sector_cache(db_path)
+
+    tickers = list(dict.fromkeys((t or "").strip().upper() for t in tickers if (t or "").strip()))
+    out: Dict[str, Dict] = {}
+
+    def _prepare(ticker: str):
+        sector, _ = sectors.lookup(ticker)
+        sector_key = (sector or "UNKNOWN").replace(" ", "_").upper()
+        model_name, bundle = _resolve_bundle(sector_key, models_dir, registry)
+        row, src = _latest_feature_row(ticker, db_path, auth, range_, interval, asof, sector)
+        _check_feature_cols(row, bundle)
+        return model_name, bundle, row, src
+
+    groups: Dict[str, list] = {}
+    bundles: Dict[str, object] = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tickers) or 1))) as ex:
+        futures = {ex.submit(_prepare, t): t for t in tickers}
+        for fut, ticker in futures.items():
+            try:
+                model_name, bundle, row, src = fut.result()
+            except (Exception, SystemExit) as e:
+                out[ticker] = {"ticker": ticker, "error": str(e)}
+                continue
+            bundles[model_name] = bundle
+            groups.setdefault(model_name, []).append((ticker, row, src))
+
+    for model_name, items in groups.items():
+        bundle = bundles[model_name]
+        X = pd.concat([row[bundle.feature_cols] for _, row, _ in items], ignore_index=True)
+
+        scores = _score_rows(bundle, X)
+        contribs = _feature_contrib_frames(X, bundle)
+
+        for i, (ticker, row, src) in enumerate(items):
+            res = _result_dict(ticker, model_name, src, row, scores, i, bundle, horizon)
+            res["_contrib_for_explain"] = contribs[i] if contribs else None
+            out[ticker] = res
+
+    return {t: out[t] for t in tickers}
+
+
 def decide(
     prob_up: float,
     stop_loss_pct: float,
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import sqlite3
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ml.db import load_features, upsert_features
+from ml.features import (
+    FEATURE_COLS,
+    FEATURE_LOOKBACK,
+    FEATURE_VERSION,
+    build_feature_frame,
+    build_feature_rows,
+    build_latest_features,
+)
+
+# A tabela `features` só guarda pregões fechados: linhas com data anterior
+# ao último candle carregado. O último candle (que ainda pode mudar durante
+# o pregão) é sempre recalculado e nunca gravado. Também não são gravados os
+# primeiros FEATURE_LOOKBACK - 1 pregões do histórico recebido (janela dos
+# técnicos incompleta), então toda linha salva pode ser reaproveitada como está.
+#
+# Só candles diários: outros intervalos calculam direto, sem passar pela tabela.
+
+
+def _matrix(frame: pd.DataFrame) -> np.ndarray:
+    """Valores de `frame` em float32, na ordem de FEATURE_COLS (NaN onde faltar a coluna)."""
+    return frame.reindex(columns=FEATURE_COLS).to_numpy(dtype=np.float32, na_value=np.nan)
+
+
+def _to_frame(dates: Iterable[str], m: np.ndarray) -> pd.DataFrame:
+    out = pd.DataFrame(m, columns=FEATURE_COLS, copy=False)
+    out.insert(0, "date", np.asarray(list(dates), dtype=object))
+    return out
+
+
+def _decode(rows: List[Tuple[str, bytes]]) -> Tuple[List[str], np.ndarray]:
+    if not rows:
+        return [], np.empty((0, len(FEATURE_COLS)), dtype=np.float32)
+    dates = [d for d, _ in rows]
+    m = np.frombuffer(b"".join(v for _, v in rows), dtype=np.float32).reshape(len(rows), len(FEATURE_COLS))
+    return dates, m.copy()
+
+
+def _store(con: sqlite3.Connection, ticker: str, version: str, dates: Iterable[str], m: np.ndarray) -> None:
+    upsert_features(con, ticker, version, ((d, row.tobytes()) for d, row in zip(dates, m)))
+
+
+def _in_sorted(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """a[i] in b, com b ordenado (np.isin em arrays de objetos é quadrático)."""
+    if len(b) == 0:
+        return np.zeros(len(a), dtype=bool)
+    pos = np.minimum(np.searchsorted(b, a), len(b) - 1)
+    return b[pos] == a
+
+
+def _valid_dates(ohlcv: pd.DataFrame) -> np.ndarray:
+    """Datas (ordenadas) que o build_feature_frame devolve: a partir do primeiro close/high/low."""
+    raw = ohlcv["date"].astype(str).to_numpy(dtype=object)
+    order = np.argsort(raw, kind="stable")
+    dates = raw[order]
+    first = 0
+    for c in ("close", "high", "low"):
+        ok = np.flatnonzero(pd.to_numeric(ohlcv[c], errors="coerce").notna().to_numpy()[order])
+        if len(ok) == 0:
+            return dates[:0]
+        first = max(first, int(ok[0]))
+    return dates[first:]
+
+
+def _first_storable(wanted: np.ndarray) -> Optional[str]:
+    """Primeira data com FEATURE_LOOKBACK pregões válidos no histórico recebido."""
+    return wanted[FEATURE_LOOKBACK - 1] if len(wanted) >= FEATURE_LOOKBACK else None
+
+
+def load_stored_frame(
+    con: sqlite3.Connection,
+    ticker: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    version: str = FEATURE_VERSION,
+) -> pd.DataFrame:
+    """Linhas salvas do ticker ("date" + FEATURE_COLS), sem recalcular nada."""
+    dates, m = _decode(load_features(con, ticker, version, start=start, end=end))
+    return _to_frame(dates, m)
+
+
+def _covered(dates: np.ndarray, macro_daily: pd.DataFrame, news_until: Optional[str]) -> np.ndarray:
+    """
+    Datas cobertas por todas as fontes laterais: macro até a última data
+    recebida e notícias antes de `news_until` (news_store.news_watermark).
+    Fonte vazia ou sem watermark: nada coberto. O que não for gravado é
+    recalculado na próxima chamada, então uma fonte que falhou não congela.
+    """
+    if macro_daily is None or macro_daily.empty or not news_until:
+        return np.zeros(len(dates), dtype=bool)
+    macro_last = str(macro_daily["date"].astype(str).max())
+    return (dates <= macro_last) & (dates < news_until)
+
+
+def load_feature_frame(
+    con: sqlite3.Connection,
+    ticker: str,
+    ohlcv: pd.DataFrame,
+    fundamentals: pd.DataFrame,
+    macro_daily: pd.DataFrame,
+    news_daily: Optional[pd.DataFrame] = None,
+    version: str = FEATURE_VERSION,
+    interval: str = "1d",
+    news_until: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Read-through da tabela `features`, mesmas linhas do build_feature_frame:
+    - lê os pregões já salvos para o ticker;
+    - calcula só as datas que faltam (build_feature_rows a partir da
+      primeira delas; frame inteiro se faltar algo no meio do histórico);
+    - grava as novas linhas fechadas, com a janela completa e cobertas
+      pelas fontes laterais (ver _covered).
+
+    Sempre devolve todas as FEATURE_COLS (NaN onde a fonte não existia).
+    """
+    if interval != "1d":
+        fresh = build_feature_frame(ohlcv, fundamentals, macro_daily, news_daily)
+        return _to_frame(fresh["date"].to_numpy(dtype=object), _matrix(fresh))
+
+    wanted = _valid_dates(ohlcv)
+    if len(wanted) == 0:
+        return _to_frame([], np.empty((0, len(FEATURE_COLS)), dtype=np.float32))
+
+    stored_dates, stored = _decode(load_features(con, ticker, version, start=wanted[0], end=wanted[-1]))
+    stored_dates = np.asarray(stored_dates, dtype=object)
+    keep = _in_sorted(stored_dates, wanted)
+    stored_dates, stored = stored_dates[keep], stored[keep]
+
+    missing = wanted[~_in_sorted(wanted, stored_dates)]
+    if len(missing) == 0:
+        return _to_frame(stored_dates, stored)
+
+    # os primeiros pregões do histórico recebido nunca são gravados: saem de
+    # um frame só com os candles até eles, sem contar como buraco no histórico
+    storable = _first_storable(wanted)
+    head = missing if storable is None else missing[missing < storable]
+    body = missing[len(head):]
+
+    parts = []
+    if len(head):
+        upto = build_feature_frame(
+            ohlcv[ohlcv["date"].astype(str) <= head[-1]], fundamentals, macro_daily, news_daily
+        )
+        parts.append(upto[_in_sorted(upto["date"].to_numpy(dtype=object), head)])
+    if len(body):
+        first = body[0]
+        if (stored_dates > first).any():
+            # buraco no meio do que já estava salvo: recalcula tudo e fica com o que falta
+            rest = build_feature_frame(ohlcv, fundamentals, macro_daily, news_daily)
+            rest = rest[_in_sorted(rest["date"].to_numpy(dtype=object), body)]
+        else:
+            pos = int(np.searchsorted(wanted, first))
+            rest = build_feature_rows(ohlcv, fundamentals, macro_daily, news_daily, after=wanted[pos - 1])
+        parts.append(rest)
+
+    fresh_dates = np.concatenate([p["date"].to_numpy(dtype=object) for p in parts])
+    fresh_m = np.concatenate([_matrix(p) for p in parts])
+
+    closed = (fresh_dates < wanted[-1]) & (fresh_dates >= (storable or wanted[-1]))
+    closed &= _covered(fresh_dates, macro_daily, news_until)
+    if closed.any():
+        _store(con, ticker, version, fresh_dates[closed], fresh_m[closed])
+        con.commit()
+
+    dates = np.concatenate([stored_dates, fresh_dates])
+    order = np.argsort(dates, kind="stable")
+    return _to_frame(dates[order], np.concatenate([stored, fresh_m])[order])
+
+
+def load_feature_row(
+    con: sqlite3.Connection,
+    ticker: str,
+    ohlcv: pd.DataFrame,
+    fundamentals: pd.DataFrame,
+    macro_daily: pd.DataFrame,
+    news_daily: Optional[pd.DataFrame] = None,
+    asof: Optional[str] = None,
+    version: str = FEATURE_VERSION,
+    interval: str = "1d",
+    news_until: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Última linha de features até `asof` ("date" + FEATURE_COLS).
+    Pregão já salvo sai da tabela; senão é calculado (build_latest_features)
+    e, se estiver fechado, com a janela completa e coberto pelas fontes
+    laterais (ver _covered), gravado para a próxima vez.
+    """
+    if interval != "1d":
+        row = build_latest_features(ohlcv, fundamentals, macro_daily, news_daily, asof=asof)
+        return _to_frame(row["date"].tolist(), _matrix(row))
+
+    wanted = _valid_dates(ohlcv)
+    if asof:
+        wanted = wanted[: np.searchsorted(wanted, str(asof), side="right")]
+    if len(wanted) == 0:
+        return _to_frame([], np.empty((0, len(FEATURE_COLS)), dtype=np.float32))
+
+    target = wanted[-1]
+    dates, m = _decode(load_features(con, ticker, version, start=target, end=target))
+    if dates:
+        return _to_frame(dates, m)
+
+    row = build_latest_features(ohlcv, fundamentals, macro_daily, news_daily, asof=target)
+    m = _matrix(row)
+    dates = row["date"].tolist()
+
+    last = ohlcv["date"].astype(str).max()
+    storable = bool(dates) and dates[0] < last and len(wanted) >= FEATURE_LOOKBACK
+    if storable and _covered(np.asarray(dates, dtype=object), macro_daily, news_until).all():
+        _store(con, ticker, version, dates, m)
+        con.commit()
+    return _to_frame(dates, m)
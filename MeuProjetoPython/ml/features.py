@@ -1,9 +1,11 @@
 from __future__ import annotations
 
-from typing import Any, Dict, Optional
+import hashlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
 
 
 def _rsi(close: pd.Series, period: int = 14) -> pd.Series:
@@ -66,12 +68,94 @@ def parse_brapi_fundamentals(payload: Dict[str, Any]) -> Dict[str, Optional[floa
     }
 
 
-def build_feature_frame(
+FUNDAMENTAL_COLS: List[str] = ["pl", "pvp", "ev_ebitda", "roe", "roa", "margem_ebitda", "margem_liquida", "div_yield", "peg"]
+
+
+def fundamentals_snapshots(snapshots: Iterable[Tuple[str, Dict[str, Any]]]) -> pd.DataFrame:
+    """
+    Fundamentos como snapshots datados: uma linha por (asof, payload brapi),
+    "date" = asof + FUNDAMENTAL_COLS em float32.
+
+    No build_feature_frame cada snapshot vale para os pregões com data >= asof
+    (as-of join), então nenhum pregão enxerga fundamento obtido depois dele.
+    """
+    dates: List[str] = []
+    rows: List[List[Optional[float]]] = []
+    for asof, payload in snapshots:
+        feat = parse_brapi_fundamentals(payload)
+        dates.append(str(asof))
+        rows.append([feat[c] for c in FUNDAMENTAL_COLS])
+
+    m = np.array(rows, dtype=np.float32).reshape(len(rows), len(FUNDAMENTAL_COLS))
+    out = pd.DataFrame(m, columns=FUNDAMENTAL_COLS, copy=False)
+    out.insert(0, "date", np.asarray(dates, dtype=object))
+    return out
+
+
+# Colunas de saída do build_feature_frame (além de "date"), nesta ordem.
+FEATURE_COLS: List[str] = [
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "logret",
+    "ret_1",
+    "ret_5",
+    "ret_10",
+    "ma_10",
+    "ma_20",
+    "ma_60",
+    "ma_ratio_10_20",
+    "rsi_14",
+    "atr_pct_14",
+    "vol_10",
+    "vol_20",
+    "selic",
+    "ipca",
+    "usd_brl",
+    "ibov_close",
+    "brent_close",
+    "spx_close",
+    "vix_close",
+    "pl",
+    "pvp",
+    "ev_ebitda",
+    "roe",
+    "roa",
+    "margem_ebitda",
+    "margem_liquida",
+    "div_yield",
+    "peg",
+    "news_count",
+    "news_sent_mean",
+    "news_sent_sum",
+    "news_pos_count",
+    "news_neg_count",
+    "news_burst_3d",
+    "news_burst_7d",
+    "news_sent_3d",
+    "news_sent_7d",
+]
+
+# sobe quando o cálculo de alguma coluna muda
+# (2: fundamentos por snapshot datado; 3: selic/ipca/usd_brl/ibov_close preenchidos)
+FEATURE_REVISION = 3
+
+# versão das linhas salvas no feature store: muda junto com a lista de colunas e a revisão
+FEATURE_VERSION = hashlib.sha1(f"{FEATURE_REVISION}:{','.join(FEATURE_COLS)}".encode("utf-8")).hexdigest()[:12]
+
+def build_feature_frame_pandas(
     ohlcv: pd.DataFrame,
     fundamentals_daily: pd.DataFrame,
     macro_daily: pd.DataFrame,
     news_daily: Optional[pd.DataFrame] = None,
 ) -> pd.DataFrame:
+    """
+    Versão anterior (pandas, merges por data) mantida como referência para
+    ml.benchmark. Atenção: macro e fundamentos são mesclados duas vezes, as
+    colunas saem com sufixo _x/_y e acabam fora do `keep`.
+    """
     df = ohlcv.copy().sort_values("date")
     df["date"] = df["date"].astype(str)
 
@@ -113,51 +197,7 @@ def build_feature_frame(
     df = df.merge(fundamentals_daily, on="date", how="left")
     df = df.sort_values("date").ffill()
 
-    keep = [
-        "date",
-        "open",
-        "high",
-        "low",
-        "close",
-        "volume",
-        "logret",
-        "ret_1",
-        "ret_5",
-        "ret_10",
-        "ma_10",
-        "ma_20",
-        "ma_60",
-        "ma_ratio_10_20",
-        "rsi_14",
-        "atr_pct_14",
-        "vol_10",
-        "vol_20",
-        "selic",
-        "ipca",
-        "usd_brl",
-        "ibov_close",
-        "brent_close",
-        "spx_close",
-        "vix_close",
-        "pl",
-        "pvp",
-        "ev_ebitda",
-        "roe",
-        "roa",
-        "margem_ebitda",
-        "margem_liquida",
-        "div_yield",
-        "peg",
-        "news_count",
-        "news_sent_mean",
-        "news_sent_sum",
-        "news_pos_count",
-        "news_neg_count",
-        "news_burst_3d",
-        "news_burst_7d",
-        "news_sent_3d",
-        "news_sent_7d",
-    ]
+    keep = ["date", *FEATURE_COLS]
 
     out = df[[c for c in keep if c in df.columns]].copy()
     out = out.dropna(subset=["close", "high", "low"]).reset_index(drop=True)
@@ -174,4 +214,284 @@ def build_feature_frame(
     if news_cols:
         out[news_cols] = out[news_cols].fillna(0.0)
 
-    return out
\ No newline at end of file
+    return out
+
+# =========================================================
+# Motor colunar: técnicos em NumPy (float64 no cálculo, float32 na saída)
+# e um único as-of join para macro, fundamentos e notícias.
+#
+# Toda janela móvel é calculada só com os valores da própria janela
+# (sliding_window_view), sem somas acumuladas: o valor de uma linha não
+# depende de quanto histórico veio antes dela.
+# =========================================================
+_PRICE_COLS = ["open", "high", "low", "close", "volume"]
+
+# maior janela dos técnicos (ma_60); as demais pedem no máximo 21 pregões
+FEATURE_LOOKBACK = 60
+
+
+def _rolling(x: np.ndarray, window: int, fn: str) -> np.ndarray:
+    """
+    out[t] = fn(x[t-window+1 .. t]); NaN se a janela não cabe ou tem NaN.
+    O desvio (ddof=1) soma os quadrados deslocamento a deslocamento, sem
+    materializar a matriz de janelas.
+    """
+    out = np.full(len(x), np.nan)
+    if len(x) < window:
+        return out
+    m = sliding_window_view(x, window).mean(axis=1)
+    if fn == "mean":
+        out[window - 1:] = m
+        return out
+
+    n = len(m)
+    acc = np.zeros(n)
+    for k in range(window):
+        d = x[k:k + n] - m
+        acc += d * d
+    out[window - 1:] = np.sqrt(acc / (window - 1))
+    return out
+
+
+def _pct_change(x: np.ndarray, k: int) -> np.ndarray:
+    out = np.full(len(x), np.nan)
+    if len(x) > k:
+        out[k:] = x[k:] / x[:-k] - 1.0
+    return out
+
+
+def _technical_columns(price: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    close, high, low = price["close"], price["high"], price["low"]
+
+    prev = np.concatenate(([np.nan], close[:-1]))
+    logret = np.log(close / prev)
+
+    ma_10 = _rolling(close, 10, "mean")
+    ma_20 = _rolling(close, 20, "mean")
+
+    delta = close - prev
+    avg_gain = _rolling(np.clip(delta, 0, None), 14, "mean")
+    avg_loss = _rolling(np.clip(-delta, 0, None), 14, "mean")
+    rs = avg_gain / np.where(avg_loss == 0, np.nan, avg_loss)
+    rsi = 100 - (100 / (1 + rs))
+
+    # fmax ignora NaN como o max(axis=1) do pandas (primeira linha = high - low)
+    tr = np.fmax(np.fmax(high - low, np.abs(high - prev)), np.abs(low - prev))
+
+    return {
+        "logret": logret,
+        "ret_1": _pct_change(close, 1),
+        "ret_5": _pct_change(close, 5),
+        "ret_10": _pct_change(close, 10),
+        "ma_10": ma_10,
+        "ma_20": ma_20,
+        "ma_60": _rolling(close, 60, "mean"),
+        "ma_ratio_10_20": ma_10 / ma_20,
+        "rsi_14": np.where(np.isnan(rsi), 50.0, rsi),
+        "atr_pct_14": _rolling(tr, 14, "mean") / close,
+        "vol_10": _rolling(logret, 10, "std"),
+        "vol_20": _rolling(logret, 20, "std"),
+    }
+
+
+def _numeric(values: Any) -> np.ndarray:
+    try:
+        return np.asarray(values, dtype=float)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=float)
+
+
+def _ffill(x: np.ndarray) -> np.ndarray:
+    """ffill de uma coluna (in-place) sem laço em Python."""
+    nan = np.isnan(x)
+    if nan.any():
+        idx = np.where(nan, 0, np.arange(len(x)))
+        np.maximum.accumulate(idx, out=idx)
+        x[:] = x[idx]
+    return x
+
+
+def _side_table(frames: List[Optional[pd.DataFrame]]) -> tuple[np.ndarray, List[str], np.ndarray]:
+    """
+    Junta macro, fundamentos e notícias numa tabela só, ordenada pela união
+    das datas, com cada coluna preenchida para frente (último valor conhecido).
+    Data repetida fica com a última linha; coluna repetida, com a última fonte.
+    Retorna (datas, colunas, valores float32).
+    """
+    sources = []
+    for f in frames:
+        if f is None or f.empty or "date" not in f.columns:
+            continue
+        cols = [c for c in FEATURE_COLS if c in f.columns and c not in _PRICE_COLS]
+        if cols:
+            sources.append((f["date"].astype(str).to_numpy(dtype=object), f, cols))
+
+    if not sources:
+        return np.array([], dtype=object), [], np.empty((0, 0), dtype=np.float32)
+
+    dates = np.unique(np.concatenate([d for d, _, _ in sources]))
+    where: Dict[str, int] = {}
+    for k, (_, _, cols) in enumerate(sources):
+        for c in cols:
+            where[c] = k
+    names = [c for c in FEATURE_COLS if c in where]
+
+    values = np.full((len(dates), len(names)), np.nan, dtype=np.float32)
+    for k, (src_dates, f, _) in enumerate(sources):
+        pos = np.searchsorted(dates, src_dates)
+        for j, c in enumerate(names):
+            if where[c] == k:
+                # atribuição em ordem: data repetida fica com a última linha
+                values[pos, j] = _numeric(f[c].to_numpy())
+
+    for j in range(len(names)):
+        _ffill(values[:, j])
+    return dates, names, values
+
+
+def _sorted_prices(ohlcv: pd.DataFrame, asof: Optional[str] = None) -> tuple[np.ndarray, Dict[str, np.ndarray]]:
+    raw_dates = ohlcv["date"].astype(str).to_numpy(dtype=object)
+    order = np.argsort(raw_dates, kind="stable")
+    dates = raw_dates[order]
+    if asof:
+        # só passado: filtrar antes dá a mesma linha que filtrar o frame pronto
+        order = order[: np.searchsorted(dates, str(asof), side="right")]
+        dates = raw_dates[order]
+    price = {c: _numeric(ohlcv[c].to_numpy())[order] for c in _PRICE_COLS}
+    return dates, price
+
+
+def _assemble(
+    dates: np.ndarray,
+    price: Dict[str, np.ndarray],
+    technical: Dict[str, np.ndarray],
+    side_frames: List[Optional[pd.DataFrame]],
+) -> pd.DataFrame:
+    """As-of join das fontes laterais, ffill e matriz float32 final."""
+    side_dates, side_cols, side_vals = _side_table(side_frames)
+
+    cols = [c for c in FEATURE_COLS if c in price or c in technical or c in side_cols]
+    m = np.empty((len(dates), len(cols)), dtype=np.float32)
+
+    side_pos = {c: j for j, c in enumerate(side_cols)}
+    if side_cols:
+        pos = np.searchsorted(side_dates, dates, side="right") - 1
+        hit = pos >= 0
+
+    for j, c in enumerate(cols):
+        if c in side_pos:
+            col = np.full(len(dates), np.nan, dtype=np.float32)
+            col[hit] = side_vals[pos[hit], side_pos[c]]
+        else:
+            col = price[c] if c in price else technical[c]
+        m[:, j] = _ffill(col)
+
+    # após o ffill só ficam NaN as linhas antes do primeiro preço válido
+    valid = ~np.isnan(m[:, [cols.index("close"), cols.index("high"), cols.index("low")]]).any(axis=1)
+    if not valid.all():
+        m = m[valid]
+        dates = dates[valid]
+
+    for j, c in enumerate(cols):
+        if c.startswith("news_"):
+            np.nan_to_num(m[:, j], copy=False, nan=0.0)
+
+    out = pd.DataFrame(m, columns=cols, copy=False)
+    out.insert(0, "date", dates)
+    return out
+
+
+def _side_frames(
+    fundamentals: pd.DataFrame,
+    macro_daily: pd.DataFrame,
+    news_daily: Optional[pd.DataFrame],
+) -> List[Optional[pd.DataFrame]]:
+    news = news_daily if news_daily is not None and not news_daily.empty else None
+    return [macro_daily, fundamentals, news]
+
+
+def build_feature_frame(
+    ohlcv: pd.DataFrame,
+    fundamentals: pd.DataFrame,
+    macro_daily: pd.DataFrame,
+    news_daily: Optional[pd.DataFrame] = None,
+) -> pd.DataFrame:
+    """
+    Frame de features por pregão: "date" (str) + FEATURE_COLS em float32.
+
+    Técnicos calculados uma vez em NumPy; macro, fundamentos e notícias entram
+    por um único as-of join (valor mais recente com data <= pregão).
+    `fundamentals` são os snapshots datados (fundamentals_snapshots): pregões
+    antes do primeiro snapshot ficam sem fundamentos (NaN).
+    Notícias sem histórico viram 0.
+    """
+    dates, price = _sorted_prices(ohlcv)
+    return _assemble(dates, price, _technical_columns(price), _side_frames(fundamentals, macro_daily, news_daily))
+
+
+def _rows_from(
+    dates: np.ndarray,
+    price: Dict[str, np.ndarray],
+    side: List[Optional[pd.DataFrame]],
+    start: int,
+) -> pd.DataFrame:
+    """
+    Linhas dates[start:] do frame inteiro, com os técnicos calculados só a
+    partir de FEATURE_LOOKBACK - 1 pregões antes de `start`.
+
+    Os técnicos só olham para a própria janela, então sem NaN nessas linhas
+    (antes do ffill) os valores são os mesmos do frame inteiro. Com NaN ali
+    o ffill iria buscar valores mais antigos: cai no frame inteiro.
+    """
+    lo = start - (FEATURE_LOOKBACK - 1)
+    if lo > 0:
+        tail = {c: v[lo:] for c, v in price.items()}
+        technical = _technical_columns(tail)
+        k = start - lo
+        if not any(np.isnan(v[k:]).any() for v in (*tail.values(), *technical.values())):
+            out = _assemble(dates[lo:], tail, technical, side)
+            return out.iloc[len(out) - (len(dates) - start):].reset_index(drop=True)
+
+    out = _assemble(dates, price, _technical_columns(price), side)
+    if start > 0:
+        out = out[out["date"] >= dates[start]]
+    return out.reset_index(drop=True)
+
+
+def build_feature_rows(
+    ohlcv: pd.DataFrame,
+    fundamentals: pd.DataFrame,
+    macro_daily: pd.DataFrame,
+    news_daily: Optional[pd.DataFrame] = None,
+    after: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Linhas do build_feature_frame com date > `after` (todas se None),
+    calculadas só sobre a janela que elas precisam (ver _rows_from).
+    """
+    dates, price = _sorted_prices(ohlcv)
+    start = int(np.searchsorted(dates, str(after), side="right")) if after else 0
+    side = _side_frames(fundamentals, macro_daily, news_daily)
+    if start >= len(dates) > 0:
+        # nada novo: frame vazio com as mesmas colunas
+        return _rows_from(dates, price, side, len(dates) - 1).iloc[:0]
+    return _rows_from(dates, price, side, start)
+
+
+def build_latest_features(
+    ohlcv: pd.DataFrame,
+    fundamentals: pd.DataFrame,
+    macro_daily: pd.DataFrame,
+    news_daily: Optional[pd.DataFrame] = None,
+    asof: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Só a última linha (até `asof`) do build_feature_frame, com os técnicos
+    calculados nos últimos FEATURE_LOOKBACK pregões: custo constante,
+    qualquer que seja o histórico carregado.
+    """
+    dates, price = _sorted_prices(ohlcv, asof=asof)
+    side = _side_frames(fundamentals, macro_daily, news_daily)
+    if len(dates) == 0:
+        return _assemble(dates, price, _technical_columns(price), side)
+    return _rows_from(dates, price, side, len(dates) - 1)
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+import pandas as pd
+
+from ml.cache import B3_TZ
+from ml.db import load_fundamentals, upsert_fundamentals
+from ml.features import FUNDAMENTAL_COLS, fundamentals_snapshots, parse_brapi_fundamentals
+from ml.sources import BrapiAuth, fetch_fundamentals_brapi
+
+# Cada consulta à brapi vira um snapshot na tabela `fundamentals`, datado
+# (asof) com o dia da consulta em B3_TZ: o valor só era conhecido a partir
+# dali, mesmo que o último candle carregado seja mais antigo. Como o feature
+# store só grava pregões anteriores ao último candle (nunca depois de hoje),
+# um snapshot novo nunca muda uma linha já salva.
+
+
+def _values(payload: Dict[str, Any]) -> tuple:
+    feat = parse_brapi_fundamentals(payload)
+    return tuple(feat[c] for c in FUNDAMENTAL_COLS)
+
+
+def save_fundamentals(
+    con: sqlite3.Connection,
+    ticker: str,
+    payload: Dict[str, Any],
+    asof: str,
+    source: str = "brapi",
+) -> bool:
+    """
+    Grava o payload como snapshot em `asof`. Não grava se veio vazio (brapi
+    negou/falhou) ou se os valores são os mesmos do snapshot anterior.
+    Retorna True se gravou.
+    """
+    values = _values(payload)
+    if all(v is None for v in values):
+        return False
+
+    previous = load_fundamentals(con, ticker, end=asof)
+    if previous and previous[-1][0] != asof and _values(json.loads(previous[-1][1])) == values:
+        return False
+
+    upsert_fundamentals(con, ticker, asof, json.dumps(payload, ensure_ascii=False), source)
+    con.commit()
+    return True
+
+
+def load_fundamentals_snapshots(
+    con: sqlite3.Connection,
+    ticker: str,
+    auth: Optional[BrapiAuth] = None,
+    end: Optional[str] = None,
+    throttle: Optional[Callable[[str], None]] = None,
+    now: Optional[datetime] = None,
+) -> pd.DataFrame:
+    """
+    Read-through da tabela `fundamentals`: com `auth`, consulta a brapi e
+    grava o snapshot datado com hoje (B3_TZ) antes de ler. Devolve uma linha
+    por snapshot (fundamentals_snapshots), até `end` se informado.
+    `throttle("brapi")` é chamado antes da consulta.
+    """
+    if auth is not None:
+        if throttle is not None:
+            throttle("brapi")
+        asof = (now or datetime.now(B3_TZ)).date()
+        save_fundamentals(con, ticker, fetch_fundamentals_brapi(ticker, auth=auth), str(asof))
+
+    return fundamentals_snapshots((a, json.loads(p)) for a, p in load_fundamentals(con, ticker, end=end))
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# (connect, read) em segundos; cada chamada pode passar o seu
+DEFAULT_TIMEOUT = (5.0, 30.0)
+
+# 520 é o "unknown error" da Cloudflare (B3 devolve com frequência)
+RETRY_STATUS = (429, 500, 502, 503, 504, 520)
+RETRIES = 3
+BACKOFF = 0.5  # 0.5s, 1s, 2s...
+
+# Requisições simultâneas por host (respeita rate limit das APIs públicas)
+HOST_LIMITS: Dict[str, int] = {
+    "brapi.dev": 4,
+    "api.bcb.gov.br": 6,
+    "news.google.com": 4,
+    "www.b3.com.br": 2,
+    "sistemaswebb3-listados.b3.com.br": 2,
+}
+DEFAULT_HOST_LIMIT = 4
+
+
+def _retry_policy(retries: int, backoff: float) -> Retry:
+    return Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUS,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=True,
+        # devolve a última resposta (ex.: 429) para quem chamou decidir
+        raise_on_status=False,
+    )
+
+
+class HttpClient:
+    """
+    Cliente HTTP compartilhado pelos fetchers (brapi, BCB, B3, Google News).
+
+    - Uma requests.Session por host: keep-alive / TLS reaproveitados.
+    - Retry com backoff exponencial para 429/5xx (urllib3), honrando Retry-After.
+    - Semáforo por host limita chamadas simultâneas.
+    - Timeout padrão em toda chamada (sem timeout = thread presa para sempre).
+    """
+
+    def __init__(
+        self,
+        retries: int = RETRIES,
+        backoff: float = BACKOFF,
+        pool_maxsize: int = 10,
+        host_limits: Optional[Dict[str, int]] = None,
+    ) -> None:
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_maxsize = pool_maxsize
+        self.host_limits = dict(HOST_LIMITS if host_limits is None else host_limits)
+        self._sessions: Dict[str, requests.Session] = {}
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _host(self, url: str) -> str:
+        return urlsplit(url).netloc.lower()
+
+    def session(self, host: str) -> requests.Session:
+        with self._lock:
+            sess = self._sessions.get(host)
+            if sess is None:
+                sess = requests.Session()
+                adapter = HTTPAdapter(
+                    max_retries=_retry_policy(self.retries, self.backoff),
+                    pool_connections=1,
+                    pool_maxsize=self.pool_maxsize,
+                )
+                sess.mount("https://", adapter)
+                sess.mount("http://", adapter)
+                self._sessions[host] = sess
+            return sess
+
+    def _semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            sem = self._semaphores.get(host)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self.host_limits.get(host, DEFAULT_HOST_LIMIT))
+                self._semaphores[host] = sem
+            return sem
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        timeout: Any = None,
+        retry_status: Iterable[int] = (),
+        **kwargs: Any,
+    ) -> requests.Response:
+        """
+        retry_status: status extras (além de 429/5xx) que esta chamada quer
+        repetir com o mesmo backoff, ex.: 403 intermitente da B3.
+        """
+        host = self._host(url)
+        sess = self.session(host)
+        extra = set(retry_status)
+
+        attempt = 0
+        while True:
+            with self._semaphore(host):
+                t0 = time.perf_counter()
+                resp = sess.request(method, url, timeout=timeout or DEFAULT_TIMEOUT, **kwargs)
+            logger.debug(
+                "http %s %s -> %s (%.0f ms)", method, host, resp.status_code, (time.perf_counter() - t0) * 1000
+            )
+
+            if resp.status_code not in extra or attempt >= self.retries:
+                return resp
+
+            time.sleep(self.backoff * (2 ** attempt))
+            attempt += 1
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def close(self) -> None:
+        with self._lock:
+            for sess in self._sessions.values():
+                sess.close()
+            self._sessions.clear()
+
+
+_client: Optional[HttpClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> HttpClient:
+    """Cliente único por processo."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def http_get(url: str, **kwargs: Any) -> requests.Response:
+    return get_client().get(url, **kwargs)
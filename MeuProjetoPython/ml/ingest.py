@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import multiprocessing
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from ml.db import DBConfig, connect
+from ml.feature_store import load_feature_frame
+from ml.features import build_feature_frame
+from ml.fundamentals_store import load_fundamentals_snapshots
+from ml.news_store import load_news_daily, news_watermark
+from ml.price_store import load_ohlcv
+from ml.sectors import get_sector_cache
+from ml.sources import BrapiAuth
+from ml.targets import make_targets
+
+# chamadas por segundo de cada fonte, somando todas as threads
+DEFAULT_RATES: Dict[str, float] = {
+    "yfinance": 2.0,
+    "brapi": 4.0,
+    "news": 2.0,
+}
+
+
+class RateLimiter:
+    """No máximo `rate` chamadas por segundo, espaçadas igualmente entre as threads."""
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+@dataclass
+class TickerData:
+    """Tudo que o ticker precisa da rede; o resto (features/targets) é CPU."""
+    ticker: str
+    sector: Optional[str]
+    ohlcv: pd.DataFrame
+    fundamentals: pd.DataFrame
+    news_daily: pd.DataFrame
+    news_until: Optional[str] = None
+
+
+@dataclass
+class BuildStats:
+    """Tempo do build_feature_frame de um ticker (memória: python -m ml.benchmark)."""
+    seconds: float
+
+
+@dataclass
+class IngestReport:
+    frames: Dict[str, pd.DataFrame] = field(default_factory=dict)
+    builds: Dict[str, BuildStats] = field(default_factory=dict)
+    sectors: Dict[str, str] = field(default_factory=dict)
+    skipped: Dict[str, str] = field(default_factory=dict)
+    failed: Dict[str, str] = field(default_factory=dict)
+    seconds: float = 0.0
+
+    def sector_frames(self, tickers: List[str]) -> Dict[str, List[pd.DataFrame]]:
+        """{setor: [frames]} na ordem de `tickers`, igual ao laço serial."""
+        out: Dict[str, List[pd.DataFrame]] = {}
+        for t in tickers:
+            if t in self.frames:
+                out.setdefault(self.sectors[t], []).append(self.frames[t])
+        return out
+
+
+def _fetch_ticker(
+    con: sqlite3.Connection,
+    db: DBConfig,
+    ticker: str,
+    auth: BrapiAuth,
+    range_: str,
+    interval: str,
+    min_rows: int,
+    throttle: Callable[[str], None],
+) -> Tuple[Optional[TickerData], Optional[str]]:
+    # cada store chama throttle(fonte) só antes de uma requisição de verdade
+    # grava o setor na tabela `tickers` (treino a partir do feature store usa)
+    sector, _ = get_sector_cache(str(db.path)).lookup(ticker, throttle=throttle)
+
+    best_df, _ = load_ohlcv(con, ticker, auth=auth, range_=range_, interval=interval, throttle=throttle)
+
+    if best_df.empty or len(best_df) < min_rows:
+        return None, "dados insuficientes"
+
+    # grava o snapshot de hoje; volta o histórico de snapshots
+    fundamentals = load_fundamentals_snapshots(con, ticker, auth=auth, throttle=throttle)
+
+    news_daily = load_news_daily(con, ticker, company_name=ticker, sector=sector, throttle=throttle)
+    news_until = news_watermark(con, ticker, company_name=ticker, sector=sector)
+
+    return TickerData(ticker, sector, best_df, fundamentals, news_daily, news_until), None
+
+
+# ---------------- processo de features ----------------
+_worker_macro: Optional[pd.DataFrame] = None
+
+
+def _init_feature_worker(macro: pd.DataFrame) -> None:
+    global _worker_macro
+    _worker_macro = macro
+
+
+def _timed_build(build: Callable[..., pd.DataFrame], *args: Any) -> Tuple[pd.DataFrame, BuildStats]:
+    t0 = time.perf_counter()
+    feat = build(*args)
+    return feat, BuildStats(seconds=time.perf_counter() - t0)
+
+
+def build_ticker_frame(
+    data: TickerData,
+    horizon: int,
+    macro: Optional[pd.DataFrame] = None,
+    db: Optional[DBConfig] = None,
+) -> Tuple[pd.DataFrame, BuildStats]:
+    """
+    Features + targets de um ticker e o custo das features.
+    Com `db`, as features passam pelo feature store (só pregões novos são calculados).
+    """
+    macro = _worker_macro if macro is None else macro
+    args = (data.ohlcv, data.fundamentals, macro, data.news_daily)
+
+    if db is None:
+        feat, stats = _timed_build(build_feature_frame, *args)
+    else:
+        con = connect(db)
+        try:
+            feat, stats = _timed_build(
+                partial(load_feature_frame, news_until=data.news_until), con, data.ticker, *args
+            )
+        finally:
+            con.close()
+    feat = make_targets(feat, horizon=horizon)
+    if feat.empty:
+        return feat, stats
+
+    feat["ticker"] = data.ticker
+    feat["sector"] = data.sector or "UNKNOWN"
+    return feat, stats
+
+
+def ingest_tickers(
+    db: DBConfig,
+    tickers: List[str],
+    macro: pd.DataFrame,
+    auth: BrapiAuth,
+    horizon: int,
+    range_: str = "5y",
+    interval: str = "1d",
+    min_rows: int = 400,
+    workers: int = 8,
+    feature_procs: int = 4,
+    rates: Optional[Dict[str, float]] = None,
+    feature_store: bool = True,
+) -> IngestReport:
+    """
+    Ingestão concorrente dos tickers:
+    - threads (`workers`) para as chamadas de rede, com limite de taxa por fonte;
+    - processos (`feature_procs`) para build_feature_frame/make_targets,
+      disparados assim que o ticker chega (rede e CPU se sobrepõem).
+
+    feature_procs=0 calcula as features na thread principal.
+    feature_store=True lê/grava as features na tabela `features` (só interval="1d").
+    Falhas de um ticker não param os demais: ficam em report.failed.
+    """
+    limits = {src: RateLimiter(r) for src, r in {**DEFAULT_RATES, **(rates or {})}.items()}
+    report = IngestReport()
+    total = len(tickers)
+    t0 = time.perf_counter()
+
+    def _throttle(source: str) -> None:
+        limits[source].wait()
+
+    def _fetch(ticker: str) -> Tuple[Optional[TickerData], Optional[str]]:
+        # sqlite: conexão própria em cada thread
+        con = connect(db)
+        try:
+            return _fetch_ticker(con, db, ticker, auth, range_, interval, min_rows, _throttle)
+        finally:
+            con.close()
+
+    done = 0
+
+    def _progress(ticker: str, msg: str) -> None:
+        nonlocal done
+        done += 1
+        print(f"  [{done:02d}/{total}] {ticker}: {msg}")
+
+    procs = None
+    if feature_procs > 0:
+        # spawn: fork com as threads de rede rodando pode herdar locks presos
+        procs = ProcessPoolExecutor(
+            max_workers=feature_procs,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_feature_worker,
+            initargs=(macro,),
+        )
+
+    builds: Dict[Future, str] = {}
+    # feature store só guarda candles diários
+    store = db if feature_store and interval == "1d" else None
+
+    def _collect(ticker: str, built: Tuple[pd.DataFrame, BuildStats]) -> None:
+        feat, stats = built
+        report.builds[ticker] = stats
+        if feat.empty:
+            report.skipped[ticker] = "sem targets"
+            _progress(ticker, "Pulado: sem targets")
+            return
+        report.frames[ticker] = feat
+        report.sectors[ticker] = feat["sector"].iloc[0]
+        _progress(
+            ticker,
+            f"Sucesso → {len(feat)} linhas (features {stats.seconds * 1000:.0f} ms)",
+        )
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ingest") as pool:
+            fetches = {pool.submit(_fetch, t): t for t in tickers}
+
+            for fut in as_completed(fetches):
+                t = fetches[fut]
+                try:
+                    data, reason = fut.result()
+                except Exception as e:
+                    report.failed[t] = f"{type(e).__name__}: {e}"
+                    _progress(t, f"Falhou ({report.failed[t]})")
+                    continue
+
+                if data is None:
+                    report.skipped[t] = reason or "sem dados"
+                    _progress(t, f"Pulado: {report.skipped[t]}")
+                    continue
+
+                if procs is None:
+                    try:
+                        _collect(t, build_ticker_frame(data, horizon, macro, store))
+                    except Exception as e:
+                        report.failed[t] = f"{type(e).__name__}: {e}"
+                        _progress(t, f"Falhou ({report.failed[t]})")
+                else:
+                    builds[procs.submit(build_ticker_frame, data, horizon, None, store)] = t
+
+        for fut in as_completed(builds):
+            t = builds[fut]
+            try:
+                _collect(t, fut.result())
+            except Exception as e:
+                report.failed[t] = f"{type(e).__name__}: {e}"
+                _progress(t, f"Falhou ({report.failed[t]})")
+    finally:
+        if procs is not None:
+            procs.shutdown(cancel_futures=True)
+
+    report.seconds = time.perf_counter() - t0
+    return report
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import sqlite3
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import pandas as pd
+
+from ml.cache import B3_TZ
+from ml.db import MACRO_COLS, load_macro, upsert_macro
+from ml.price_store import _START_SLACK_DAYS, _needs_refresh
+from ml.sources import fetch_macro_sgs, fetch_macro_yfinance
+
+# Treino e previsão leem o macro da mesma tabela `macro`: o que o treino
+# baixa fica salvo e é exatamente o que decision/predict usam depois.
+# Fontes: BCB/SGS (selic, ipca, usd_brl) e yfinance (ibov, brent, spx, vix).
+
+
+def load_macro_daily(
+    con: sqlite3.Connection,
+    start: str,
+    now: Optional[datetime] = None,
+    refresh: bool = True,
+) -> pd.DataFrame:
+    """
+    Read-through da tabela `macro` (date + MACRO_COLS) a partir de `start`:
+    - período maior que o salvo: baixa tudo desde `start`;
+    - senão baixa só a partir do último dia salvo (que é regravado, pode ter
+      sido capturado no meio do pregão) quando falta algum pregão.
+    """
+    now = now or datetime.now(B3_TZ)
+    stored = load_macro(con)
+
+    if refresh:
+        since: Optional[str] = None
+        if stored.empty or date.fromisoformat(stored["date"].iloc[0]) > date.fromisoformat(start) + timedelta(
+            days=_START_SLACK_DAYS
+        ):
+            since = start
+        elif _needs_refresh(date.fromisoformat(stored["date"].iloc[-1]), now):
+            since = stored["date"].iloc[-1]
+
+        if since is not None:
+            # `end` é exclusivo: amanhã inclui o dia de hoje
+            end = str(now.date() + timedelta(days=1))
+            wrote = False
+            for source, fetch in (("bcb", fetch_macro_sgs), ("yfinance", fetch_macro_yfinance)):
+                fresh = fetch(since, end)
+                if not fresh.empty:
+                    upsert_macro(con, fresh, source)
+                    wrote = True
+            if wrote:
+                con.commit()
+                stored = load_macro(con)
+
+    out = stored[stored["date"] >= start] if not stored.empty else stored
+    return out[["date", *MACRO_COLS]].reset_index(drop=True)
@@ -1,28 +1,38 @@
 from __future__ import annotations
 
+import sys
+import time
 from dataclasses import dataclass
-from typing import Any, Dict, List, Tuple
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import joblib
 import numpy as np
 import pandas as pd
 import lightgbm
+from threadpoolctl import threadpool_limits
+
+from ml.snapshot import load_snapshot, read_schema
 
 
 @dataclass(frozen=True)
 class ModelBundle:
-    clf: lightgbm.LGBMClassifier
-    reg_sl: lightgbm.LGBMRegressor
-    reg_sg: lightgbm.LGBMRegressor
-    reg_vol: lightgbm.LGBMRegressor
+    # BoosterClassifier/BoosterRegressor; bundles antigos trazem os estimadores sklearn
+    clf: Any
+    reg_sl: Any
+    reg_sg: Any
+    reg_vol: Any
     feature_cols: List[str]
+    # árvores do refit por alvo (cls/sl/sg/vol); None em bundles sem early stopping
+    n_estimators: Optional[Dict[str, int]] = None
 
 
 def _split_time(df: pd.DataFrame, test_ratio: float = 0.30) -> tuple[pd.DataFrame, pd.DataFrame]:
     n = len(df)
     cut = max(10, int(n * (1.0 - test_ratio)))
     cut = min(cut, n - 1)
-    return df.iloc[:cut].copy(), df.iloc[cut:].copy()
+    # fatias sem cópia: nada abaixo escreve nelas (snapshot continua no memmap)
+    return df.iloc[:cut], df.iloc[cut:]
 
 
 def _safe_div(a: float, b: float) -> float:
@@ -67,36 +77,143 @@ def _mae(y_true: np.ndarray, y_pred: np.ndarray) -> float:
     return float(np.mean(np.abs(y_pred - y_true)))
 
 
-def _build_lgbm_classifier() -> lightgbm.LGBMClassifier:
-    return lightgbm.LGBMClassifier(
-        n_estimators=300,
-        learning_rate=0.03,
-        num_leaves=31,
-        max_depth=6,
-        min_child_samples=40,
-        subsample=0.9,
-        colsample_bytree=0.9,
-        reg_alpha=0.5,
-        reg_lambda=1.0,
-        random_state=42,
-        verbosity=-1,
-    )
+# Mesmos parâmetros que LGBMClassifier/LGBMRegressor passavam ao LightGBM.
+# num_threads=0: o LightGBM usa o limite de threads OpenMP do processo (ver
+# train_bundle), então o número de threads não fica gravado no artefato.
+# col-wise + deterministic: o mesmo modelo com 1 ou N threads.
+_BASE_PARAMS: Dict[str, Any] = {
+    "boosting_type": "gbdt",
+    "learning_rate": 0.03,
+    "num_leaves": 31,
+    "max_depth": 6,
+    "min_child_samples": 40,
+    "min_child_weight": 0.001,
+    "min_split_gain": 0.0,
+    "subsample": 0.9,
+    "subsample_freq": 0,
+    "subsample_for_bin": 200000,
+    "colsample_bytree": 0.9,
+    "reg_alpha": 0.5,
+    "reg_lambda": 1.0,
+    "random_state": 42,
+    "verbosity": -1,
+    "num_threads": 0,
+    "force_col_wise": True,
+    "deterministic": True,
+}
+
+_CLF_PARAMS: Dict[str, Any] = {**_BASE_PARAMS, "objective": "binary", "metric": "binary"}
+_REG_PARAMS: Dict[str, Any] = {**_BASE_PARAMS, "objective": "regression", "metric": "regression"}
+
+# teto de árvores; com o bloco de validação o early stopping para antes
+_CLF_ROUNDS = 300
+_REG_ROUNDS = 400
+EARLY_STOPPING_ROUNDS = 50
+
+_TARGETS = ("cls", "sl", "sg", "vol")
+
+
+class BoosterClassifier:
+    """lightgbm.Booster binário com a interface do LGBMClassifier usada no app."""
+
+    def __init__(self, booster: lightgbm.Booster) -> None:
+        self.booster_ = booster
+        self.classes_ = np.array([0, 1])
+
+    def predict_proba(self, X: Any) -> np.ndarray:
+        p = self.booster_.predict(X)
+        return np.vstack((1.0 - p, p)).transpose()
+
+    def predict(self, X: Any, raw_score: bool = False, pred_contrib: bool = False, **kwargs: Any) -> np.ndarray:
+        if raw_score or pred_contrib:
+            return self.booster_.predict(X, raw_score=raw_score, pred_contrib=pred_contrib, **kwargs)
+        return (self.booster_.predict(X, **kwargs) >= 0.5).astype(int)
+
+
+class BoosterRegressor:
+    """lightgbm.Booster de regressão com a interface do LGBMRegressor usada no app."""
+
+    def __init__(self, booster: lightgbm.Booster) -> None:
+        self.booster_ = booster
+
+    def predict(self, X: Any, **kwargs: Any) -> np.ndarray:
+        return self.booster_.predict(X, **kwargs)
+
+
+def _fit_targets(
+    X: pd.DataFrame,
+    labels: Dict[str, np.ndarray],
+    valid: Optional[Tuple[pd.DataFrame, Dict[str, np.ndarray]]] = None,
+    rounds: Optional[Dict[str, int]] = None,
+) -> Dict[str, lightgbm.Booster]:
+    """
+    Treina os quatro alvos sobre um único Dataset: o binning das features é
+    feito uma vez e só o label é trocado entre um treino e outro.
+
+    valid: (X, labels) do bloco de validação; cada alvo para no melhor
+    número de árvores (booster.best_iteration).
+    rounds: número fixo de árvores por alvo (refit); sem ele, usa o teto.
+    """
+    ds = lightgbm.Dataset(X, label=labels["cls"], params=_BASE_PARAMS, free_raw_data=False)
+    ds.construct()
+
+    dv = None
+    if valid is not None:
+        # reference=ds: validação usa os mesmos bins do treino
+        dv = lightgbm.Dataset(valid[0], label=valid[1]["cls"], reference=ds, free_raw_data=False)
+
+    boosters: Dict[str, lightgbm.Booster] = {}
+    for key in _TARGETS:
+        params, max_rounds = (_CLF_PARAMS, _CLF_ROUNDS) if key == "cls" else (_REG_PARAMS, _REG_ROUNDS)
+        ds.set_label(labels[key])
+
+        if dv is None:
+            n = rounds[key] if rounds else max_rounds
+            boosters[key] = lightgbm.train(params, ds, num_boost_round=n)
+            continue
+
+        dv.set_label(valid[1][key])
+        boosters[key] = lightgbm.train(
+            params,
+            ds,
+            num_boost_round=max_rounds,
+            valid_sets=[dv],
+            callbacks=[lightgbm.early_stopping(EARLY_STOPPING_ROUNDS, first_metric_only=True, verbose=False)],
+        )
+    return boosters
 
 
-def _build_lgbm_regressor() -> lightgbm.LGBMRegressor:
-    return lightgbm.LGBMRegressor(
-        n_estimators=400,
-        learning_rate=0.03,
-        num_leaves=31,
-        max_depth=6,
-        min_child_samples=40,
-        subsample=0.9,
-        colsample_bytree=0.9,
-        reg_alpha=0.5,
-        reg_lambda=1.0,
-        random_state=42,
-        verbosity=-1,
-    )
+def _refit_rounds(best: Dict[str, int], n_train: int, n_full: int) -> Dict[str, int]:
+    """Árvores do refit: o melhor número na validação, escalado pelo tamanho dos dados."""
+    scale = n_full / max(n_train, 1)
+    return {key: max(1, int(round(n * scale))) for key, n in best.items()}
+
+
+def _labels(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    return {
+        "cls": df["y_cls"].astype(int).values,
+        "sl": df["y_sl"].astype(float).values,
+        "sg": df["y_sg"].astype(float).values,
+        "vol": df["y_vol"].astype(float).values,
+    }
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """Pico de memória (RSS) do processo até agora, em MB; None se não der para medir."""
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux devolve KB; macOS, bytes
+        return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+
+        return round(psutil.Process().memory_info().peak_wset / 2**20, 1)
+    except Exception:
+        return None
 
 
 def _error_examples(
@@ -217,12 +334,36 @@ def _print_console_summary(
 
 
 def train_bundle(
+    df: Union[pd.DataFrame, str, Path],
+    feature_cols: Optional[List[str]] = None,
+    model_name: str = "MODEL",
+    test_ratio: float = 0.30,
+    n_jobs: Optional[int] = None,
+) -> tuple[ModelBundle, Dict[str, Any]]:
+    """
+    df: DataFrame ou diretório de um snapshot (ml.snapshot), lido via memmap
+    sem rede; nesse caso feature_cols padrão vem do schema do snapshot.
+    n_jobs: threads do LightGBM neste treino (None = padrão do processo).
+    """
+    if not isinstance(df, pd.DataFrame):
+        feature_cols = feature_cols or read_schema(df)["feature_cols"]
+        df = load_snapshot(df)
+    if not feature_cols:
+        raise ValueError("feature_cols é obrigatório para treinar a partir de um DataFrame")
+
+    with threadpool_limits(limits=n_jobs, user_api="openmp"):
+        return _train_bundle(df, feature_cols, model_name=model_name, test_ratio=test_ratio)
+
+
+def _train_bundle(
     df: pd.DataFrame,
     feature_cols: List[str],
     model_name: str = "MODEL",
     test_ratio: float = 0.30,
 ) -> tuple[ModelBundle, Dict[str, Any]]:
-    df = df.sort_values("date").reset_index(drop=True)
+    # snapshot já vem ordenado por data: ordenar copiaria o memmap inteiro
+    if not df["date"].is_monotonic_increasing:
+        df = df.sort_values("date").reset_index(drop=True)
     train_df, test_df = _split_time(df, test_ratio=test_ratio)
 
     if len(train_df) < 20 or len(test_df) < 10:
@@ -234,33 +375,20 @@ def train_bundle(
     X_train = train_df[feature_cols]
     X_test = test_df[feature_cols]
 
-    y_train_cls = train_df["y_cls"].astype(int).values
     y_test_cls = test_df["y_cls"].astype(int).values
-
-    y_train_sl = train_df["y_sl"].astype(float).values
     y_test_sl = test_df["y_sl"].astype(float).values
-
-    y_train_sg = train_df["y_sg"].astype(float).values
     y_test_sg = test_df["y_sg"].astype(float).values
-
-    y_train_vol = train_df["y_vol"].astype(float).values
     y_test_vol = test_df["y_vol"].astype(float).values
 
-    print(f"\n[{model_name}] Etapa 1/4 - treinando classificador...")
-    clf = _build_lgbm_classifier()
-    clf.fit(X_train, y_train_cls)
-
-    print(f"[{model_name}] Etapa 2/4 - treinando regressor de stop-loss...")
-    reg_sl = _build_lgbm_regressor()
-    reg_sl.fit(X_train, y_train_sl)
-
-    print(f"[{model_name}] Etapa 3/4 - treinando regressor de stop-gain...")
-    reg_sg = _build_lgbm_regressor()
-    reg_sg.fit(X_train, y_train_sg)
-
-    print(f"[{model_name}] Etapa 4/4 - treinando regressor de volatilidade...")
-    reg_vol = _build_lgbm_regressor()
-    reg_vol.fit(X_train, y_train_vol)
+    t0 = time.perf_counter()
+    print(f"\n[{model_name}] Treinando classificador e regressores (stop-loss, stop-gain, volatilidade)...")
+    fitted = _fit_targets(X_train, _labels(train_df), valid=(X_test, _labels(test_df)))
+    best_iter = {key: int(b.best_iteration or b.current_iteration()) for key, b in fitted.items()}
+    clf = BoosterClassifier(fitted["cls"])
+    reg_sl = BoosterRegressor(fitted["sl"])
+    reg_sg = BoosterRegressor(fitted["sg"])
+    reg_vol = BoosterRegressor(fitted["vol"])
+    t_fit = time.perf_counter()
 
     print(f"[{model_name}] Validando no bloco final de 30%...")
     prob = clf.predict_proba(X_test)[:, 1]
@@ -301,26 +429,19 @@ def train_bundle(
     )
 
     print(f"[{model_name}] Refit final com 100% dos dados para salvar o bundle de produção...")
-    X_full = df[feature_cols]
-
-    clf_final = _build_lgbm_classifier()
-    clf_final.fit(X_full, df["y_cls"].astype(int).values)
-
-    reg_sl_final = _build_lgbm_regressor()
-    reg_sl_final.fit(X_full, df["y_sl"].astype(float).values)
-
-    reg_sg_final = _build_lgbm_regressor()
-    reg_sg_final.fit(X_full, df["y_sg"].astype(float).values)
-
-    reg_vol_final = _build_lgbm_regressor()
-    reg_vol_final.fit(X_full, df["y_vol"].astype(float).values)
+    t_valid = time.perf_counter()
+    n_estimators = _refit_rounds(best_iter, len(train_df), len(df))
+    print(f"[{model_name}] Árvores (melhor na validação -> refit): {best_iter} -> {n_estimators}")
+    final = _fit_targets(df[feature_cols], _labels(df), rounds=n_estimators)
+    t_refit = time.perf_counter()
 
     bundle = ModelBundle(
-        clf=clf_final,
-        reg_sl=reg_sl_final,
-        reg_sg=reg_sg_final,
-        reg_vol=reg_vol_final,
+        clf=BoosterClassifier(final["cls"]),
+        reg_sl=BoosterRegressor(final["sl"]),
+        reg_sg=BoosterRegressor(final["sg"]),
+        reg_vol=BoosterRegressor(final["vol"]),
         feature_cols=feature_cols,
+        n_estimators=n_estimators,
     )
 
     metrics: Dict[str, Any] = {
@@ -329,6 +450,18 @@ def train_bundle(
         "classification": cls_metrics,
         "regression": reg_metrics,
         "error_report": error_report,
+        "n_estimators": {"best_iteration": best_iter, "refit": n_estimators},
+        "resources": {
+            "seconds": {
+                "fit_70": round(t_fit - t0, 3),
+                "validation": round(t_valid - t_fit, 3),
+                "refit_100": round(t_refit - t_valid, 3),
+                "total": round(t_refit - t0, 3),
+            },
+            # pico do processo inteiro: só é deste modelo se ele rodou num processo
+            # próprio (train._train_all em paralelo); senão o chamador descarta
+            "peak_rss_mb": _peak_rss_mb(),
+        },
     }
     return bundle, metrics
 
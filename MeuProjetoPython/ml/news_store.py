@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from ml.cache import B3_TZ
+from ml.db import insert_news, load_news, load_news_feeds, upsert_news_feed
+from ml.http_client import http_get
+from ml.sources import _news_daily_features, _news_feed_urls, _parse_news_entries
+
+logger = logging.getLogger(__name__)
+
+# feed consultado há menos que isso nem sai para a rede
+NEWS_TTL = timedelta(minutes=30)
+
+# (etag, last_modified, manchetes); manchetes = None quando o feed respondeu 304
+FeedResult = Tuple[Optional[str], Optional[str], Optional[List[Dict[str, Any]]]]
+
+
+def _headline_hash(headline: str) -> str:
+    return hashlib.sha1(headline.encode("utf-8")).hexdigest()
+
+
+def _fetch_feed(url: str, etag: Optional[str], last_modified: Optional[str]) -> FeedResult:
+    """GET condicional: If-None-Match / If-Modified-Since com o que o feed mandou da última vez."""
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    resp = http_get(url, headers=headers, timeout=15)
+    if resp.status_code == 304:
+        return etag, last_modified, None
+
+    resp.raise_for_status()
+    return (
+        resp.headers.get("ETag") or etag,
+        resp.headers.get("Last-Modified") or last_modified,
+        _parse_news_entries(resp.content),
+    )
+
+
+def refresh_news(
+    con: sqlite3.Connection,
+    ticker: str,
+    company_name: Optional[str] = None,
+    sector: Optional[str] = None,
+    now: Optional[datetime] = None,
+    ttl: timedelta = NEWS_TTL,
+    throttle: Optional[Callable[[str], None]] = None,
+) -> int:
+    """
+    Atualiza a tabela `news` do ticker:
+    - pula feeds consultados dentro do TTL;
+    - consulta os demais em paralelo, com GET condicional;
+    - grava só manchetes novas (chave ticker, date, hash da manchete).
+
+    Retorna quantas manchetes novas entraram. Feed que falhar fica para a
+    próxima chamada (o estado dele não é atualizado).
+    `throttle("news")` é chamado antes de cada feed consultado.
+    """
+    now = now or datetime.now(timezone.utc)
+    urls = _news_feed_urls(ticker, company_name, sector)
+    state = load_news_feeds(con, urls)
+
+    due = [
+        u for u in urls
+        if u not in state or now - datetime.fromisoformat(state[u][2]) >= ttl
+    ]
+    if not due:
+        return 0
+
+    def _get(url: str) -> Optional[FeedResult]:
+        etag, last_modified, _ = state.get(url, (None, None, None))
+        if throttle is not None:
+            throttle("news")
+        try:
+            return _fetch_feed(url, etag, last_modified)
+        except Exception as e:
+            logger.warning("news_feed_failed %s: %s", url, e)
+            return None
+
+    with ThreadPoolExecutor(max_workers=len(due), thread_name_prefix="news") as pool:
+        results = list(pool.map(_get, due))
+
+    fetched_at = now.isoformat(timespec="seconds")
+    added = 0
+    # gravação só nesta thread: a conexão sqlite não é compartilhada com o pool
+    for url, res in zip(due, results):
+        if res is None:
+            continue
+        etag, last_modified, entries = res
+        if entries:
+            added += insert_news(
+                con,
+                ticker,
+                (
+                    (e["date"], _headline_hash(e["headline"]), e["headline"], e["sent_score"], fetched_at)
+                    for e in entries
+                ),
+            )
+        upsert_news_feed(con, url, etag, last_modified, fetched_at)
+    con.commit()
+
+    return added
+
+
+def news_watermark(
+    con: sqlite3.Connection,
+    ticker: str,
+    company_name: Optional[str] = None,
+    sector: Optional[str] = None,
+) -> Optional[str]:
+    """
+    Dia (horário da B3) da consulta bem-sucedida mais antiga entre os feeds
+    do ticker: pregões antes dele já estavam no feed e não ganham manchetes
+    novas. None se algum feed nunca respondeu.
+    """
+    urls = _news_feed_urls(ticker, company_name, sector)
+    state = load_news_feeds(con, urls)
+    if not urls or any(u not in state for u in urls):
+        return None
+    oldest = min(datetime.fromisoformat(state[u][2]) for u in urls)
+    return oldest.astimezone(B3_TZ).date().isoformat()
+
+
+def load_news_daily(
+    con: sqlite3.Connection,
+    ticker: str,
+    company_name: Optional[str] = None,
+    sector: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    refresh: bool = True,
+    throttle: Optional[Callable[[str], None]] = None,
+) -> pd.DataFrame:
+    """
+    Read-through da tabela `news`: mesmo formato de sources.fetch_news_daily,
+    mas as features saem das manchetes salvas (acumuladas entre chamadas).
+    """
+    if refresh:
+        refresh_news(con, ticker, company_name=company_name, sector=sector, throttle=throttle)
+
+    return _news_daily_features(load_news(con, ticker, start=start, end=end))
@@ -7,21 +7,14 @@ import numpy as np
 import pandas as pd
 
 from ml.db import DBConfig, connect
-from ml.features import build_feature_frame
+from ml.feature_store import load_feature_row
+from ml.fundamentals_store import load_fundamentals_snapshots
+from ml.macro_store import load_macro_daily
 from ml.modeling import load_bundle
-from ml.sources import (
-    BrapiAuth,
-    fetch_fundamentals_brapi,
-    fetch_news_daily,
-    fetch_ohlcv_brapi,
-    fetch_ohlcv_yfinance,
-    fetch_sector_yfinance,
-)
-from ml.train import _choose_best_source, _fundamentals_to_daily
-
-
-def _load_macro(con) -> pd.DataFrame:
-    return pd.read_sql_query("SELECT * FROM macro ORDER BY date", con).drop(columns=["source"], errors="ignore")
+from ml.news_store import load_news_daily, news_watermark
+from ml.price_store import load_ohlcv
+from ml.sources import BrapiAuth
+from ml.sectors import get_sector_cache
 
 
 def _show_feature_contributions(row: pd.DataFrame, bundle, top_n: int = 12) -> None:
@@ -119,7 +112,7 @@ def main() -> None:
     ticker = args.ticker.strip().upper()
     auth = BrapiAuth(token=args.brapi_token, bearer=args.brapi_bearer)
 
-    sector, _industry = fetch_sector_yfinance(ticker)
+    sector, _industry = get_sector_cache(args.db).lookup(ticker)
     sector_key = (sector or "UNKNOWN").replace(" ", "_").upper()
 
     models_dir = Path(args.models_dir)
@@ -132,38 +125,33 @@ def main() -> None:
 
     bundle = load_bundle(str(model_path))
 
-    df_yf = fetch_ohlcv_yfinance(ticker, range_=args.range_, interval=args.interval)
-    df_br = fetch_ohlcv_brapi(ticker, auth=auth, range_=args.range_, interval=args.interval)
-    best_df, src = _choose_best_source(df_yf, df_br)
-
-    if best_df.empty:
-        raise SystemExit("No price data available.")
-
-    fpay = fetch_fundamentals_brapi(ticker, auth=auth)
-    fundamentals_daily = _fundamentals_to_daily(fpay, best_df["date"])
-
-    news_daily = fetch_news_daily(
-        ticker=ticker,
-        company_name=ticker,
-        sector=sector,
-    )
-
     with connect(DBConfig(path=Path(args.db))) as con:
-        macro = _load_macro(con)
-
-    feat = build_feature_frame(best_df, fundamentals_daily, macro, news_daily)
-
-    if feat.empty:
-        raise SystemExit("Feature frame is empty.")
-
-    if args.asof:
-        feat = feat[feat["date"] <= args.asof].copy()
-
-    if feat.empty:
+        best_df, src = load_ohlcv(con, ticker, auth=auth, range_=args.range_, interval=args.interval)
+        news_daily = load_news_daily(con, ticker, company_name=ticker, sector=sector)
+        news_until = news_watermark(con, ticker, company_name=ticker, sector=sector)
+
+        if best_df.empty:
+            raise SystemExit("No price data available.")
+
+        macro = load_macro_daily(con, start=best_df["date"].astype(str).min())
+
+        fundamentals = load_fundamentals_snapshots(con, ticker, auth=auth)
+
+        row = load_feature_row(
+            con,
+            ticker,
+            best_df,
+            fundamentals,
+            macro,
+            news_daily,
+            asof=args.asof,
+            interval=args.interval,
+            news_until=news_until,
+        )
+
+    if row.empty:
         raise SystemExit("No feature rows available for the requested --asof date.")
 
-    row = feat.iloc[-1:].copy()
-
     missing_cols = [c for c in bundle.feature_cols if c not in row.columns]
     if missing_cols:
         raise SystemExit(f"Missing feature columns in prediction frame: {missing_cols}")
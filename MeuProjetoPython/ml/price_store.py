@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import re
+import sqlite3
+from datetime import date, datetime, timedelta
+from typing import Callable, Optional
+
+import pandas as pd
+
+from ml.cache import B3_CLOSE_HOUR, B3_OPEN_HOUR, B3_TZ
+from ml.db import load_price_start, load_prices, set_price_start, upsert_prices
+from ml.sources import BrapiAuth, fetch_ohlcv_brapi, fetch_ohlcv_yfinance
+
+OHLCV_COLS = ["date", "open", "high", "low", "close", "volume"]
+
+# menores períodos aceitos por yfinance/brapi, do menor para o maior
+_INCREMENT_RANGES = [("5d", 5), ("1mo", 31), ("3mo", 92), ("6mo", 183), ("1y", 366), ("2y", 731), ("5y", 1827)]
+
+# tolerância para o primeiro pregão do período (feriados/fins de semana)
+_START_SLACK_DAYS = 10
+
+_RANGE_RE = re.compile(r"^(\d+)(d|mo|y)$")
+
+
+def choose_best_source(df_yf: pd.DataFrame, df_br: pd.DataFrame) -> tuple[pd.DataFrame, str]:
+    if len(df_br) >= len(df_yf) and not df_br.empty:
+        return df_br, "brapi"
+    if not df_yf.empty:
+        return df_yf, "yfinance"
+    return pd.DataFrame(), "none"
+
+
+def _range_start(range_: str, today: date) -> Optional[date]:
+    if range_ == "ytd":
+        return date(today.year, 1, 1)
+    m = _RANGE_RE.match(range_ or "")
+    if not m:
+        return None  # "max" ou formato desconhecido: sem limite inferior
+    n, unit = int(m.group(1)), m.group(2)
+    days = {"d": n, "mo": n * 31, "y": n * 366}[unit]
+    return today - timedelta(days=days)
+
+
+def _previous_weekday(d: date) -> date:
+    d -= timedelta(days=1)
+    while d.weekday() >= 5:
+        d -= timedelta(days=1)
+    return d
+
+
+def _needs_refresh(last: date, now: datetime) -> bool:
+    """True se falta algum pregão depois de `last` (ou se o de hoje ainda está aberto)."""
+    today = now.date()
+    is_weekday = today.weekday() < 5
+    in_session = is_weekday and B3_OPEN_HOUR <= now.hour < B3_CLOSE_HOUR
+
+    expected = today if is_weekday and now.hour >= B3_OPEN_HOUR else _previous_weekday(today)
+    if last < expected:
+        return True
+    # candle de hoje salvo durante o pregão ainda pode mudar
+    return in_session and last >= today
+
+
+def _increment_range(last: date, today: date) -> str:
+    gap = (today - last).days + 1
+    for name, days in _INCREMENT_RANGES:
+        if gap <= days:
+            return name
+    return _INCREMENT_RANGES[-1][0]
+
+
+Throttle = Optional[Callable[[str], None]]
+
+
+def _from_yfinance(ticker: str, range_: str, interval: str, throttle: Throttle) -> pd.DataFrame:
+    if throttle is not None:
+        throttle("yfinance")
+    return fetch_ohlcv_yfinance(ticker, range_=range_, interval=interval)
+
+
+def _from_brapi(ticker: str, auth: BrapiAuth, range_: str, interval: str, throttle: Throttle) -> pd.DataFrame:
+    if throttle is not None:
+        throttle("brapi")
+    return fetch_ohlcv_brapi(ticker, auth=auth, range_=range_, interval=interval)
+
+
+def _fetch(
+    ticker: str,
+    auth: BrapiAuth,
+    range_: str,
+    interval: str,
+    prefer: Optional[str],
+    throttle: Throttle = None,
+) -> tuple[pd.DataFrame, str]:
+    if prefer == "yfinance":
+        df = _from_yfinance(ticker, range_, interval, throttle)
+        if not df.empty:
+            return df, "yfinance"
+    elif prefer == "brapi":
+        df = _from_brapi(ticker, auth, range_, interval, throttle)
+        if not df.empty:
+            return df, "brapi"
+
+    df_yf = _from_yfinance(ticker, range_, interval, throttle)
+    df_br = _from_brapi(ticker, auth, range_, interval, throttle)
+    return choose_best_source(df_yf, df_br)
+
+
+def load_ohlcv(
+    con: sqlite3.Connection,
+    ticker: str,
+    auth: BrapiAuth,
+    range_: str = "2y",
+    interval: str = "1d",
+    now: Optional[datetime] = None,
+    throttle: Throttle = None,
+) -> tuple[pd.DataFrame, str]:
+    """
+    Read-through da tabela `prices`:
+    - lê o que já está salvo para o ticker;
+    - baixa (yfinance/brapi) só as datas a partir do último pregão salvo;
+    - grava o incremento e devolve o período pedido já mesclado.
+
+    Só se aplica a candles diários; outros intervalos vão direto à fonte.
+    `throttle(fonte)` é chamado antes de cada download (nada se o salvo basta).
+    Retorna (df, fonte) no mesmo formato de _choose_best_source.
+    """
+    if interval != "1d":
+        return _fetch(ticker, auth, range_, interval, prefer=None, throttle=throttle)
+
+    now = now or datetime.now(B3_TZ)
+    today = now.date()
+    start = _range_start(range_, today)
+    start_s = str(start) if start else None
+
+    stored = load_prices(con, ticker)
+    listed = load_price_start(con, ticker)
+    covers_start = not stored.empty and (
+        start is None
+        or date.fromisoformat(stored["date"].iloc[0]) <= start + timedelta(days=_START_SLACK_DAYS)
+        # listado depois do início do período: o salvo já começa no primeiro pregão
+        or (listed is not None and stored["date"].iloc[0] <= listed)
+    )
+
+    if not covers_start:
+        # primeira carga (ou período maior que o salvo): baixa o range inteiro
+        fresh, src = _fetch(ticker, auth, range_, interval, prefer=None, throttle=throttle)
+        if fresh.empty:
+            if stored.empty:
+                return pd.DataFrame(), "none"
+            src = str(stored["source"].iloc[-1])
+        else:
+            first = str(fresh["date"].min())
+            if start is None or date.fromisoformat(first) > start + timedelta(days=_START_SLACK_DAYS):
+                # a fonte não tem nada antes disso: próximas chamadas não baixam tudo de novo
+                set_price_start(con, ticker, first)
+    else:
+        last = date.fromisoformat(stored["date"].iloc[-1])
+        src = str(stored["source"].iloc[-1])
+        if not _needs_refresh(last, now):
+            out = stored[stored["date"] >= start_s] if start_s else stored
+            return out[OHLCV_COLS].reset_index(drop=True), src
+
+        fresh, fresh_src = _fetch(ticker, auth, _increment_range(last, today), interval, prefer=src, throttle=throttle)
+        # regrava o último candle salvo (pode ter sido capturado no meio do pregão)
+        fresh = fresh[fresh["date"] >= str(last)] if not fresh.empty else fresh
+        if not fresh.empty:
+            src = fresh_src
+
+    if fresh.empty:
+        merged = stored[OHLCV_COLS]
+    else:
+        upsert_prices(con, ticker, fresh, src)
+        con.commit()
+        parts = [fresh[OHLCV_COLS]] if stored.empty else [stored[OHLCV_COLS], fresh[OHLCV_COLS]]
+        merged = pd.concat(parts, ignore_index=True)
+
+    merged = merged.drop_duplicates(subset=["date"], keep="last").sort_values("date")
+    if start_s:
+        merged = merged[merged["date"] >= start_s]
+    return merged.dropna(subset=["close"]).reset_index(drop=True), src
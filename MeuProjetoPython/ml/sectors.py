@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import argparse
+import threading
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from ml.db import DBConfig, connect, init_db, load_tickers, upsert_ticker
+from ml.sources import fetch_sector_yfinance, yf_symbol_b3
+
+DEFAULT_TTL_DAYS = 30.0
+
+SectorInfo = Tuple[Optional[str], Optional[str]]
+
+
+def _now_iso() -> str:
+    return datetime.now(UTC).replace(microsecond=0).isoformat().replace("+00:00", "Z")
+
+
+def _parse_iso(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=UTC)
+
+
+class SectorCache:
+    """
+    Mapa ticker -> (sector, industry) em memória, persistido na tabela `tickers`.
+
+    O yfinance `.info` (lento) só é chamado quando o ticker não está na
+    tabela ou quando o registro ficou mais velho que `ttl_days`.
+    """
+
+    def __init__(self, db: DBConfig, ttl_days: float = DEFAULT_TTL_DAYS) -> None:
+        self.db = db
+        self.ttl = timedelta(days=ttl_days)
+        self._map: Dict[str, Tuple[Optional[str], Optional[str], Optional[datetime]]] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self) -> None:
+        init_db(self.db)
+        con = connect(self.db)
+        try:
+            rows = load_tickers(con)
+        finally:
+            con.close()
+        self._map = {t: (sec, ind, _parse_iso(upd)) for t, sec, ind, upd in rows}
+        self._loaded = True
+
+    def _fresh(self, ticker: str) -> Optional[SectorInfo]:
+        if not self._loaded:
+            self._load()
+        hit = self._map.get(ticker)
+        if hit is None:
+            return None
+        sector, industry, updated = hit
+        if sector is None or updated is None or datetime.now(UTC) - updated > self.ttl:
+            return None
+        return sector, industry
+
+    def _store(self, ticker: str, sector: Optional[str], industry: Optional[str]) -> None:
+        now = _now_iso()
+        con = connect(self.db)
+        try:
+            upsert_ticker(con, ticker, yf_symbol_b3(ticker), sector, industry, now)
+            con.commit()
+        finally:
+            con.close()
+        self._map[ticker] = (sector, industry, _parse_iso(now))
+
+    def lookup(self, ticker: str, throttle: Optional[Callable[[str], None]] = None) -> SectorInfo:
+        """`throttle("yfinance")` é chamado só quando a consulta vai à rede."""
+        ticker = (ticker or "").strip().upper()
+        with self._lock:
+            hit = self._fresh(ticker)
+        if hit is not None:
+            return hit
+
+        if throttle is not None:
+            throttle("yfinance")
+        sector, industry = fetch_sector_yfinance(ticker)
+        if sector is None:
+            # falha no yfinance: não grava, tenta de novo na próxima chamada
+            return sector, industry
+
+        with self._lock:
+            self._store(ticker, sector, industry)
+        return sector, industry
+
+    def warm_up(self, tickers: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """
+        Carrega a tabela inteira em memória e busca no yfinance apenas os
+        tickers ausentes/expirados. Sem `tickers`, usa a carteira do IBOV.
+        """
+        if tickers is None:
+            from ml.universe import fetch_ibov_tickers
+
+            tickers = fetch_ibov_tickers()
+
+        with self._lock:
+            self._load()
+
+        fetched = 0
+        failed = 0
+        cached = 0
+        for t in tickers:
+            t = t.strip().upper()
+            with self._lock:
+                hit = self._fresh(t)
+            if hit is not None:
+                cached += 1
+                continue
+            sector, _ = self.lookup(t)
+            if sector is None:
+                failed += 1
+            else:
+                fetched += 1
+
+        return {"cached": cached, "fetched": fetched, "failed": failed}
+
+
+_caches: Dict[Tuple[str, float], SectorCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_sector_cache(db_path: str, ttl_days: float = DEFAULT_TTL_DAYS) -> SectorCache:
+    """Cache único por processo para cada (banco, ttl)."""
+    key = (str(db_path), float(ttl_days))
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = SectorCache(DBConfig(path=Path(db_path)), ttl_days=ttl_days)
+            _caches[key] = cache
+        return cache
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Pré-carrega o setor dos tickers na tabela `tickers`")
+    ap.add_argument("--db", default="data/market.sqlite3")
+    ap.add_argument("--tickers", nargs="*", default=[])
+    ap.add_argument("--ibov", action="store_true", help="Usa a carteira do IBOV")
+    ap.add_argument("--ttl_days", type=float, default=DEFAULT_TTL_DAYS)
+    args = ap.parse_args()
+
+    if not args.ibov and not args.tickers:
+        raise SystemExit("Use --ibov ou --tickers ...")
+
+    cache = get_sector_cache(args.db, ttl_days=args.ttl_days)
+    stats = cache.warm_up(None if args.ibov else args.tickers)
+    print(stats)
+
+
+if __name__ == "__main__":
+    main()
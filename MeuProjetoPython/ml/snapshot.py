@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import tempfile
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+# Snapshot de um dataset de treino (um setor ou o GLOBAL), num diretório:
+#   schema.json       colunas, dtypes, categorias, linhas e metadados
+#   date.i4           datas (dias desde 1970-01-01, int32, em ordem) = índice de datas
+#   <coluna>.f4/.f8   uma coluna numérica por arquivo (features em float32)
+#   <coluna>.i4       códigos das colunas de texto (ticker, sector)
+# Tudo é lido com np.memmap somente-leitura: vários treinos/experimentos
+# compartilham a mesma cópia (page cache do SO) sem baixar nada de novo.
+
+SCHEMA_FILE = "schema.json"
+SNAPSHOT_FORMAT = 1
+
+_EPOCH = np.datetime64("1970-01-01", "D")
+_SUFFIX = {np.dtype(np.float32): "f4", np.dtype(np.float64): "f8"}
+
+PathLike = Union[str, Path]
+
+
+def _encode_dates(dates: pd.Series) -> np.ndarray:
+    values = dates.astype(str).to_numpy(dtype=object)
+    days = (values.astype("datetime64[D]") - _EPOCH).astype(np.int32)
+    if not (_decode_dates(days) == values).all():
+        raise ValueError("snapshot: datas precisam estar no formato YYYY-MM-DD")
+    return days
+
+
+def _decode_dates(days: np.ndarray) -> np.ndarray:
+    return (np.asarray(days, dtype=np.int64).astype("datetime64[D]")).astype(str).astype(object)
+
+
+def read_schema(path: PathLike) -> Dict[str, Any]:
+    with open(Path(path) / SCHEMA_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def is_snapshot(path: PathLike) -> bool:
+    return (Path(path) / SCHEMA_FILE).is_file()
+
+
+def write_snapshot(
+    df: pd.DataFrame,
+    path: PathLike,
+    feature_cols: List[str],
+    meta: Optional[Dict[str, Any]] = None,
+) -> Path:
+    """
+    Grava `df` como snapshot em `path` (substitui o anterior de uma vez só:
+    escreve num diretório temporário ao lado e troca no fim).
+
+    As linhas ficam na ordem de `df`, que precisa estar ordenado por data.
+    Colunas float32 continuam float32; as demais numéricas viram float64
+    (os targets, para o modelo sair igual ao treino em memória).
+    """
+    path = Path(path)
+    if "date" not in df.columns:
+        raise ValueError("snapshot: coluna 'date' obrigatória")
+    if not df["date"].is_monotonic_increasing:
+        raise ValueError("snapshot: linhas precisam estar ordenadas por data")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(prefix=f".{path.name}.", dir=path.parent))
+    try:
+        days = _encode_dates(df["date"])
+        days.tofile(tmp / "date.i4")
+
+        columns: Dict[str, Dict[str, str]] = {}
+        categories: Dict[str, List[str]] = {}
+        for c in df.columns:
+            if c == "date":
+                continue
+            col = df[c]
+            if pd.api.types.is_numeric_dtype(col):
+                dtype = np.dtype(np.float32) if col.dtype == np.float32 else np.dtype(np.float64)
+                file = f"{c}.{_SUFFIX[dtype]}"
+                col.to_numpy(dtype=dtype, na_value=np.nan).tofile(tmp / file)
+                columns[c] = {"dtype": dtype.name, "file": file}
+            else:
+                codes, uniques = pd.factorize(col.astype(str), sort=True)
+                file = f"{c}.i4"
+                codes.astype(np.int32).tofile(tmp / file)
+                columns[c] = {"dtype": "category", "file": file}
+                categories[c] = [str(u) for u in uniques]
+
+        schema = {
+            "format": SNAPSHOT_FORMAT,
+            "name": path.name,
+            "rows": int(len(df)),
+            "created_at": datetime.now(UTC).replace(microsecond=0).isoformat(),
+            "date_range": [str(df["date"].iloc[0]), str(df["date"].iloc[-1])] if len(df) else [None, None],
+            "feature_cols": list(feature_cols),
+            "columns": columns,
+            "categories": categories,
+            "meta": meta or {},
+        }
+        with open(tmp / SCHEMA_FILE, "w", encoding="utf-8") as f:
+            json.dump(schema, f, indent=2, ensure_ascii=False)
+
+        if path.exists():
+            old = path.with_name(f".{path.name}.old")
+            shutil.rmtree(old, ignore_errors=True)
+            os.replace(path, old)
+            os.replace(tmp, path)
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            os.replace(tmp, path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return path
+
+
+def _memmap(path: Path, dtype: Any, rows: int) -> np.ndarray:
+    if rows == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(rows,))
+
+
+def load_snapshot(
+    path: PathLike,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """
+    Abre o snapshot como DataFrame: colunas numéricas são memmaps
+    somente-leitura (nada é copiado até alguém modificar/ordenar).
+    `start`/`end` (inclusive) cortam as linhas pelo índice de datas.
+    """
+    path = Path(path)
+    schema = read_schema(path)
+    rows = int(schema["rows"])
+
+    days = _memmap(path / "date.i4", np.int32, rows)
+    lo, hi = 0, rows
+    if start:
+        lo = int(np.searchsorted(days, (np.datetime64(start, "D") - _EPOCH).astype(np.int32), side="left"))
+    if end:
+        hi = int(np.searchsorted(days, (np.datetime64(end, "D") - _EPOCH).astype(np.int32), side="right"))
+    hi = max(lo, hi)
+
+    data: Dict[str, Any] = {"date": _decode_dates(days[lo:hi])}
+    for c, spec in schema["columns"].items():
+        if columns is not None and c not in columns:
+            continue
+        if spec["dtype"] == "category":
+            codes = _memmap(path / spec["file"], np.int32, rows)[lo:hi]
+            data[c] = np.asarray(schema["categories"][c], dtype=object)[codes]
+        else:
+            data[c] = _memmap(path / spec["file"], np.dtype(spec["dtype"]), rows)[lo:hi]
+
+    return pd.DataFrame(data, copy=False)
@@ -1,15 +1,18 @@
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from typing import Any, Dict, Optional, List
 from urllib.parse import quote_plus
 import re
 
 import pandas as pd
-import requests
 import yfinance as yf
 import feedparser
 
+from ml.cache import cached_ohlcv
+from ml.http_client import http_get
+
 BCB_SGS_URL = (
     "https://api.bcb.gov.br/dados/serie/bcdata.sgs.{code}/dados?formato=json&dataInicial={start}&dataFinal={end}"
 )
@@ -61,8 +64,7 @@ def _flatten_yf_columns(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def fetch_ohlcv_yfinance(ticker: str, range_: str = "5y", interval: str = "1d") -> pd.DataFrame:
-    sym = yf_symbol_b3(ticker)
+def _download_yf_history(sym: str, range_: str, interval: str) -> pd.DataFrame:
     df = yf.download(
         sym,
         period=range_,
@@ -79,15 +81,34 @@ def fetch_ohlcv_yfinance(ticker: str, range_: str = "5y", interval: str = "1d")
     df = df.reset_index()
     df.columns = [str(c).lower().replace(" ", "_") for c in df.columns]
 
-    if "adj_close" in df.columns and "close" not in df.columns:
-        df = df.rename(columns={"adj_close": "close"})
-
     if "date" not in df.columns:
         if "datetime" in df.columns:
             df = df.rename(columns={"datetime": "date"})
         else:
             df = df.rename(columns={df.columns[0]: "date"})
 
+    cols = [c for c in ["date", "open", "high", "low", "close", "adj_close", "volume"] if c in df.columns]
+    return df[cols]
+
+
+def yf_history(ticker: str, range_: str = "5y", interval: str = "1d") -> pd.DataFrame:
+    """
+    Histórico do yfinance normalizado (date, open, high, low, close,
+    adj_close, volume), compartilhado via ml.cache entre web e ML.
+    Não modifique o DataFrame retornado.
+    """
+    sym = yf_symbol_b3(ticker)
+    return cached_ohlcv("yfinance", sym, interval, range_, lambda: _download_yf_history(sym, range_, interval))
+
+
+def fetch_ohlcv_yfinance(ticker: str, range_: str = "5y", interval: str = "1d") -> pd.DataFrame:
+    df = yf_history(ticker, range_=range_, interval=interval)
+    if df is None or df.empty:
+        return pd.DataFrame()
+
+    if "adj_close" in df.columns and "close" not in df.columns:
+        df = df.rename(columns={"adj_close": "close"})
+
     needed = ["date", "open", "high", "low", "close", "volume"]
     if any(c not in df.columns for c in needed):
         return pd.DataFrame()
@@ -100,14 +121,19 @@ def fetch_ohlcv_yfinance(ticker: str, range_: str = "5y", interval: str = "1d")
 def fetch_ohlcv_brapi(ticker: str, auth: BrapiAuth, range_: str = "5y", interval: str = "1d") -> pd.DataFrame:
     """
     Se brapi negar (401/403) ou rate-limit (429), retorna DF vazio e o pipeline cai pro yfinance.
+    Resultado compartilhado via ml.cache; não modifique o DataFrame retornado.
     """
+    return cached_ohlcv("brapi", ticker, interval, range_, lambda: _download_brapi_history(ticker, auth, range_, interval))
+
+
+def _download_brapi_history(ticker: str, auth: BrapiAuth, range_: str, interval: str) -> pd.DataFrame:
     url = f"https://brapi.dev/api/quote/{ticker}"
     params: Dict[str, Any] = {"range": range_, "interval": interval}
     if auth.token:
         params["token"] = auth.token
 
     try:
-        r = requests.get(url, params=params, headers=auth.headers(), timeout=30)
+        r = http_get(url, params=params, headers=auth.headers(), timeout=30)
         if r.status_code in (401, 403, 429):
             return pd.DataFrame()
         r.raise_for_status()
@@ -164,7 +190,7 @@ def fetch_fundamentals_brapi(ticker: str, auth: BrapiAuth) -> Dict[str, Any]:
         params["token"] = auth.token
 
     try:
-        r = requests.get(url, params=params, headers=auth.headers(), timeout=30)
+        r = http_get(url, params=params, headers=auth.headers(), timeout=30)
         if r.status_code in (401, 403, 429):
             return {"results": [{}]}
         r.raise_for_status()
@@ -175,7 +201,7 @@ def fetch_fundamentals_brapi(ticker: str, auth: BrapiAuth) -> Dict[str, Any]:
 
 def fetch_sgs_series(code: int, start_ddmmyyyy: str, end_ddmmyyyy: str) -> pd.DataFrame:
     url = BCB_SGS_URL.format(code=code, start=start_ddmmyyyy, end=end_ddmmyyyy)
-    r = requests.get(url, timeout=30)
+    r = http_get(url, timeout=30)
     r.raise_for_status()
     arr = r.json() or []
     rows = [{"date": pd.to_datetime(it["data"], dayfirst=True).date(), "value": _safe_float(it["valor"])} for it in arr]
@@ -186,9 +212,45 @@ def fetch_sgs_series(code: int, start_ddmmyyyy: str, end_ddmmyyyy: str) -> pd.Da
     return df.sort_values("date").reset_index(drop=True)
 
 
+# séries mensais: o valor do mês M sai por volta do dia 10 de M+1 (IPCA/IBGE);
+# a data vira o dia 15 de M+1 para o as-of join não usar o índice antes da divulgação
+_SGS_MONTHLY = {"ipca"}
+
+
+def fetch_macro_sgs(start: str, end: str) -> pd.DataFrame:
+    """
+    selic, ipca e usd_brl do BCB/SGS entre `start` e `end` (ISO, end exclusivo
+    como no yfinance): date + uma coluna por série. Série que falhar fica de fora.
+    """
+    lo = pd.Timestamp(start) - pd.Timedelta(days=62)  # alcança o último mês já divulgado
+    hi = pd.Timestamp(end)
+    frames = []
+    for col, code in SGS.items():
+        try:
+            df = fetch_sgs_series(code, lo.strftime("%d/%m/%Y"), hi.strftime("%d/%m/%Y"))
+        except Exception:
+            continue
+        if df.empty:
+            continue
+        if col in _SGS_MONTHLY:
+            released = pd.to_datetime(df["date"]) + pd.DateOffset(months=1) + pd.Timedelta(days=14)
+            df["date"] = released.dt.strftime("%Y-%m-%d")
+        frames.append(df.rename(columns={"value": col}))
+
+    if not frames:
+        return pd.DataFrame()
+
+    out = frames[0]
+    for f in frames[1:]:
+        out = out.merge(f, on="date", how="outer")
+
+    out = out[out["date"] < str(end)[:10]]
+    return out.sort_values("date").reset_index(drop=True)
+
+
 def fetch_macro_yfinance(start: str, end: str) -> pd.DataFrame:
     # proxies globais
-    tickers = {"brent_close": "BZ=F", "spx_close": "^GSPC", "vix_close": "^VIX"}
+    tickers = {"ibov_close": "^BVSP", "brent_close": "BZ=F", "spx_close": "^GSPC", "vix_close": "^VIX"}
     frames = []
 
     for col, sym in tickers.items():
@@ -263,75 +325,63 @@ def _google_news_rss(query: str, lang: str = "pt-BR", country: str = "BR") -> st
     return f"https://news.google.com/rss/search?q={q}&hl={lang}&gl={country}&ceid={country}:pt-419"
 
 
-def fetch_news_daily(
-    ticker: str,
-    company_name: Optional[str] = None,
-    sector: Optional[str] = None,
-    start: Optional[str] = None,
-    end: Optional[str] = None,
-) -> pd.DataFrame:
-    """
-    Retorna features diárias de notícia para o ativo.
-    """
+NEWS_DAILY_COLS = [
+    "date",
+    "news_count",
+    "news_sent_mean",
+    "news_sent_sum",
+    "news_pos_count",
+    "news_neg_count",
+    "news_burst_3d",
+    "news_burst_7d",
+    "news_sent_3d",
+    "news_sent_7d",
+]
+
+
+def _news_feed_urls(ticker: str, company_name: Optional[str] = None, sector: Optional[str] = None) -> List[str]:
     queries: List[str] = [ticker]
     if company_name:
         queries.append(company_name)
     if sector:
         queries.append(f"{company_name or ticker} {sector}")
+    return [_google_news_rss(q) for q in queries]
 
+
+def _parse_news_entries(content: bytes) -> List[Dict[str, Any]]:
+    """Manchetes datadas de um RSS, com o sentimento calculado uma única vez."""
+    feed = feedparser.parse(content)
     rows: List[Dict[str, Any]] = []
 
-    for q in queries:
+    for entry in getattr(feed, "entries", []):
+        title = str(getattr(entry, "title", "") or "")
+        summary = str(getattr(entry, "summary", "") or "")
+        text = f"{title}. {summary}".strip()
+
+        published = getattr(entry, "published", None) or getattr(entry, "updated", None)
+        if not published:
+            continue
+
         try:
-            feed = feedparser.parse(_google_news_rss(q))
+            d = pd.to_datetime(published, utc=True).date()
         except Exception:
             continue
 
-        for entry in getattr(feed, "entries", []):
-            title = str(getattr(entry, "title", "") or "")
-            summary = str(getattr(entry, "summary", "") or "")
-            text = f"{title}. {summary}".strip()
-
-            published = getattr(entry, "published", None) or getattr(entry, "updated", None)
-            if not published:
-                continue
-
-            try:
-                d = pd.to_datetime(published, utc=True).date()
-            except Exception:
-                continue
-
-            ds = str(d)
-            if start and ds < start:
-                continue
-            if end and ds > end:
-                continue
-
-            rows.append(
-                {
-                    "date": ds,
-                    "headline": title,
-                    "sent_score": _simple_sentiment_pt(text),
-                    "is_pos": 1 if _simple_sentiment_pt(text) > 0 else 0,
-                    "is_neg": 1 if _simple_sentiment_pt(text) < 0 else 0,
-                }
-            )
-
-    if not rows:
-        return pd.DataFrame(columns=[
-            "date",
-            "news_count",
-            "news_sent_mean",
-            "news_sent_sum",
-            "news_pos_count",
-            "news_neg_count",
-            "news_burst_3d",
-            "news_burst_7d",
-            "news_sent_3d",
-            "news_sent_7d",
-        ])
-
-    df = pd.DataFrame(rows).drop_duplicates(subset=["date", "headline"]).sort_values("date")
+        rows.append({"date": str(d), "headline": title, "sent_score": _simple_sentiment_pt(text)})
+
+    return rows
+
+
+def _news_daily_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Agrega manchetes (date, headline, sent_score) nas features diárias de notícia."""
+    if df.empty:
+        return pd.DataFrame(columns=NEWS_DAILY_COLS)
+
+    df = df.drop_duplicates(subset=["date", "headline"]).sort_values("date")
+    df = df.assign(
+        is_pos=(df["sent_score"] > 0).astype(int),
+        is_neg=(df["sent_score"] < 0).astype(int),
+    )
 
     daily = (
         df.groupby("date", as_index=False)
@@ -355,4 +405,35 @@ def fetch_news_daily(
     news_cols = [c for c in daily.columns if c != "date"]
     daily[news_cols] = daily[news_cols].shift(1)
 
-    return daily.fillna(0.0)
\ No newline at end of file
+    return daily.fillna(0.0)
+
+
+def fetch_news_daily(
+    ticker: str,
+    company_name: Optional[str] = None,
+    sector: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Retorna features diárias de notícia para o ativo, direto dos feeds
+    (sem armazenamento). Com banco aberto, prefira ml.news_store.load_news_daily.
+    """
+    def _get(url: str) -> List[Dict[str, Any]]:
+        try:
+            resp = http_get(url, timeout=15)
+            resp.raise_for_status()
+            return _parse_news_entries(resp.content)
+        except Exception:
+            return []
+
+    urls = _news_feed_urls(ticker, company_name, sector)
+    with ThreadPoolExecutor(max_workers=len(urls), thread_name_prefix="news") as pool:
+        results = list(pool.map(_get, urls))
+
+    rows = [
+        r for entries in results for r in entries
+        if not (start and r["date"] < start) and not (end and r["date"] > end)
+    ]
+
+    return _news_daily_features(pd.DataFrame(rows, columns=["date", "headline", "sent_score"]))
\ No newline at end of file
@@ -1,46 +1,90 @@
 from __future__ import annotations
 
+import warnings
+from typing import Dict, Sequence, Union
+
 import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+TARGET_NAMES = ("y_cls", "y_sl", "y_sg", "y_vol")
 
 
-def make_targets(df: pd.DataFrame, horizon: int = 10) -> pd.DataFrame:
+def _forward_targets(
+    close: np.ndarray,
+    high: np.ndarray,
+    low: np.ndarray,
+    logret: np.ndarray,
+    horizon: int,
+) -> Dict[str, np.ndarray]:
     """
-    Cria targets para qualquer horizonte desejado.
+    Alvos de um horizonte para todas as linhas de uma vez.
+
+    Linha i usa a janela futura i+1 .. i+horizon (sliding_window_view, sem
+    cópia) e só as linhas i < n - horizon - 1 recebem alvo, como no laço
+    original.
     """
-    out = df.copy()
-    close = out["close"].astype(float).values
-    high = out["high"].astype(float).values
-    low = out["low"].astype(float).values
+    n = len(close)
+    out = {name: np.full(n, np.nan) for name in TARGET_NAMES}
+
+    m = n - horizon - 1
+    if m <= 0:
+        return out
+
+    entry = close[:m]
+    # janela da linha i é a de índice i + 1
+    w_low = sliding_window_view(low, horizon)[1:m + 1]
+    w_high = sliding_window_view(high, horizon)[1:m + 1]
+    w_lr = sliding_window_view(logret, horizon)[1:m + 1]
 
-    n = len(out)
-    y_cls = np.full(n, np.nan)
-    y_sl = np.full(n, np.nan)
-    y_sg = np.full(n, np.nan)
-    y_vol = np.full(n, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"), warnings.catch_warnings():
+        # janela toda NaN -> NaN (igual ao nanmin/nanmax por linha)
+        warnings.simplefilter("ignore", RuntimeWarning)
 
-    logret = np.log(out["close"] / out["close"].shift(1))
+        out["y_cls"][:m] = np.where((close[horizon:horizon + m] / entry - 1.0) > 0, 1.0, 0.0)
+        out["y_sl"][:m] = (np.nanmin(w_low, axis=1) / entry) - 1.0
+        out["y_sg"][:m] = (np.nanmax(w_high, axis=1) / entry) - 1.0
 
-    for i in range(n - horizon - 1):
-        entry = close[i]
-        fut_slice = slice(i + 1, i + 1 + horizon)
+        if horizon >= 2:
+            # janelas sem NaN: desvio padrão vetorizado (mesmas somas do np.std por linha)
+            nan_rows = np.isnan(w_lr).any(axis=1)
+            full = ~nan_rows
+            y_vol = out["y_vol"]
+            y_vol[:m][full] = np.std(w_lr[full], axis=1, ddof=1)
 
-        fut_close = close[i + horizon]
-        y_cls[i] = 1.0 if (fut_close / entry - 1.0) > 0 else 0.0
+            # raras janelas com NaN (preço faltando): descarta os NaN como o dropna()
+            for i in np.flatnonzero(nan_rows):
+                lr = w_lr[i][~np.isnan(w_lr[i])]
+                if len(lr) >= 2:
+                    y_vol[i] = float(np.std(lr, ddof=1))
 
-        fut_min_low = np.nanmin(low[fut_slice])
-        fut_max_high = np.nanmax(high[fut_slice])
+    return out
+
+
+def make_targets(df: pd.DataFrame, horizon: Union[int, Sequence[int]] = 10) -> pd.DataFrame:
+    """
+    Cria targets para qualquer horizonte desejado.
+
+    horizon inteiro: colunas y_cls, y_sl, y_sg, y_vol (formato de sempre).
+    Lista de horizontes: y_cls_<h>, y_sl_<h>, y_sg_<h>, y_vol_<h> para cada
+    h, calculados numa passada; ficam só as linhas com alvo em todos eles.
+    """
+    out = df.copy()
+    close = out["close"].astype(float).values
+    high = out["high"].astype(float).values
+    low = out["low"].astype(float).values
 
-        y_sl[i] = (fut_min_low / entry) - 1.0
-        y_sg[i] = (fut_max_high / entry) - 1.0
+    logret = np.log(out["close"] / out["close"].shift(1)).to_numpy(dtype=float)
 
-        fut_lr = logret.iloc[i + 1 : i + 1 + horizon].dropna().values
-        if len(fut_lr) >= 2:
-            y_vol[i] = float(np.std(fut_lr, ddof=1))
+    if isinstance(horizon, (int, np.integer)):
+        targets = _forward_targets(close, high, low, logret, int(horizon))
+    else:
+        targets = {}
+        for h in dict.fromkeys(int(h) for h in horizon):
+            for name, values in _forward_targets(close, high, low, logret, h).items():
+                targets[f"{name}_{h}"] = values
 
-    out["y_cls"] = y_cls
-    out["y_sl"] = y_sl
-    out["y_sg"] = y_sg
-    out["y_vol"] = y_vol
+    for name, values in targets.items():
+        out[name] = values
 
-    return out.dropna(subset=["y_cls", "y_sl", "y_sg", "y_vol"]).reset_index(drop=True)
\ No newline at end of file
+    return out.dropna(subset=list(targets)).reset_index(drop=True)
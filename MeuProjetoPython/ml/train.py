@@ -2,23 +2,26 @@ from __future__ import annotations
 
 import argparse
 import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import UTC, datetime, timedelta
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple, Union
 
+import numpy as np
 import pandas as pd
 
-from ml.db import DBConfig, connect, executemany, init_db, upsert_ticker
-from ml.features import build_feature_frame, parse_brapi_fundamentals
+from ml.db import DBConfig, connect, executemany, feature_tickers, init_db, load_tickers, upsert_ticker
+from ml.feature_store import load_stored_frame
+from ml.features import FEATURE_VERSION
+from ml.ingest import DEFAULT_RATES, IngestReport, ingest_tickers
+from ml.macro_store import load_macro_daily
 from ml.modeling import save_bundle, train_bundle
+from ml.snapshot import is_snapshot, read_schema, write_snapshot
 from ml.sources import (
     BrapiAuth,
-    fetch_fundamentals_brapi,
-    fetch_macro_yfinance,
-    fetch_news_daily,
-    fetch_ohlcv_brapi,
-    fetch_ohlcv_yfinance,
-    fetch_sector_yfinance,
     fetch_sgs_series,
     yf_symbol_b3,
 )
@@ -35,17 +38,176 @@ def _date_bounds(range_years: int = 6) -> tuple[str, str, str, str]:
     return str(start), str(end), start.strftime("%d/%m/%Y"), end.strftime("%d/%m/%Y")
 
 
-def _choose_best_source(df_yf: pd.DataFrame, df_br: pd.DataFrame) -> tuple[pd.DataFrame, str]:
-    if len(df_br) >= len(df_yf) and not df_br.empty:
-        return df_br, "brapi"
-    if not df_yf.empty:
-        return df_yf, "yfinance"
-    return pd.DataFrame(), "none"
-
-
-def _fundamentals_to_daily(payload: Dict[str, Any], dates: pd.Series) -> pd.DataFrame:
-    feat = parse_brapi_fundamentals(payload)
-    return pd.DataFrame([{"date": str(d), **feat} for d in dates])
+_NON_FEATURES = {"ticker", "sector", "date", "y_cls", "y_sl", "y_sg", "y_vol"}
+
+
+def _cpu_split(cpu_budget: int, n_jobs_total: int, train_procs: int = 0) -> Tuple[int, int]:
+    """
+    Divide o orçamento de CPU entre processos de treino e threads do LightGBM
+    (procs * threads <= cpu_budget, sem oversubscription).
+    train_procs=0 escolhe um processo por modelo até o limite do orçamento.
+    """
+    cpu_budget = max(1, cpu_budget)
+    procs = train_procs or cpu_budget
+    procs = max(1, min(procs, n_jobs_total, cpu_budget))
+    return procs, max(1, cpu_budget // procs)
+
+
+# dataset de um modelo: frame em memória ou diretório de snapshot (ml.snapshot)
+TrainData = Union[pd.DataFrame, Path]
+
+
+def _feature_cols(df: pd.DataFrame) -> List[str]:
+    return [c for c in df.columns if c not in _NON_FEATURES]
+
+
+def _rows(data: TrainData) -> int:
+    return len(data) if isinstance(data, pd.DataFrame) else int(read_schema(data)["rows"])
+
+
+def _train_and_save(
+    name: str,
+    data: TrainData,
+    models_dir: Path,
+    n_jobs: int,
+    own_process: bool = False,
+) -> Tuple[str, float]:
+    """
+    Treina um bundle e grava .joblib, .metrics.json e .error_report.json.
+    own_process: o modelo rodou num processo só dele; senão o pico de RSS
+    seria o do processo inteiro e vai como null no .metrics.json.
+    """
+    t0 = time.perf_counter()
+    print(f"Treinando {name}...")
+    # snapshot: o processo abre o memmap (nada de frame serializado entre processos)
+    feature_cols = _feature_cols(data) if isinstance(data, pd.DataFrame) else None
+    bundle, metrics = train_bundle(data, feature_cols=feature_cols, model_name=name, n_jobs=n_jobs)
+
+    base = models_dir / f"lgbm_{name}"
+    save_bundle(bundle, str(base) + ".joblib")
+    error_report = metrics.pop("error_report")
+    if not own_process:
+        metrics["resources"]["peak_rss_mb"] = None
+    with open(str(base) + ".metrics.json", "w", encoding="utf-8") as f:
+        json.dump(metrics, f, indent=2, ensure_ascii=False, default=str)
+    with open(str(base) + ".error_report.json", "w", encoding="utf-8") as f:
+        json.dump(error_report, f, indent=2, ensure_ascii=False, default=str)
+
+    return name, time.perf_counter() - t0
+
+
+def _train_all(
+    jobs: List[Tuple[str, TrainData]],
+    models_dir: Path,
+    cpu_budget: int,
+    train_procs: int = 0,
+) -> Dict[str, float]:
+    """
+    Treina os bundles (setores + GLOBAL) em paralelo, em processos.
+    Os modelos não dependem do número de threads (ver ml.modeling), então os
+    artefatos são os mesmos de uma execução serial. Retorna {nome: segundos}.
+    """
+    if not jobs:
+        return {}
+
+    procs, n_jobs = _cpu_split(cpu_budget, len(jobs), train_procs)
+    print(f"  {len(jobs)} modelos | {procs} processo(s) x {n_jobs} thread(s) LightGBM")
+
+    # maiores primeiro: o GLOBAL não fica sozinho no fim
+    jobs = sorted(jobs, key=lambda j: _rows(j[1]), reverse=True)
+
+    if procs == 1:
+        return dict(_train_and_save(name, df, models_dir, n_jobs) for name, df in jobs)
+
+    timings: Dict[str, float] = {}
+    # um processo novo por modelo: o pico de RSS em .metrics.json é só daquele modelo
+    with ProcessPoolExecutor(
+        max_workers=procs,
+        mp_context=multiprocessing.get_context("spawn"),
+        max_tasks_per_child=1,
+    ) as pool:
+        futures = {pool.submit(_train_and_save, name, df, models_dir, n_jobs, True): name for name, df in jobs}
+        for fut in as_completed(futures):
+            name, secs = fut.result()
+            timings[name] = secs
+    return timings
+
+
+def _frames_from_store(db: DBConfig, tickers: List[str], horizon: int, min_rows: int) -> IngestReport:
+    """Frames de treino só com o feature store e a tabela `tickers` (sem rede)."""
+    report = IngestReport()
+    t0 = time.perf_counter()
+    with connect(db) as con:
+        sectors = {t: sec for t, sec, _, _ in load_tickers(con)}
+        for t in tickers:
+            feat = load_stored_frame(con, t)
+            if len(feat) < min_rows:
+                report.skipped[t] = f"{len(feat)} linhas no feature store"
+                continue
+            feat = make_targets(feat, horizon=horizon)
+            if feat.empty:
+                report.skipped[t] = "sem targets"
+                continue
+            feat["ticker"] = t
+            feat["sector"] = sectors.get(t) or "UNKNOWN"
+            report.frames[t] = feat
+            report.sectors[t] = feat["sector"].iloc[0]
+    report.seconds = time.perf_counter() - t0
+    return report
+
+
+def _sector_jobs(
+    sector_frames: Dict[str, List[pd.DataFrame]],
+    min_sector_rows: int,
+) -> List[Tuple[str, TrainData]]:
+    """Um dataset por setor (com linhas suficientes) e o GLOBAL com todos."""
+    jobs: List[Tuple[str, TrainData]] = []
+    global_parts = []
+    for sec, parts in sector_frames.items():
+        sec_df = pd.concat(parts).sort_values("date").reset_index(drop=True)
+        global_parts.append(sec_df)
+
+        sec_name = sec.replace(" ", "_").upper()
+        if len(sec_df) >= min_sector_rows:
+            jobs.append((sec_name, sec_df))
+        else:
+            print(f"[{sec_name}] Dados insuficientes")
+
+    # GLOBAL
+    if global_parts:
+        global_df = pd.concat(global_parts).sort_values("date").reset_index(drop=True)
+        jobs.append(("GLOBAL", global_df))
+    return jobs
+
+
+def _write_snapshots(
+    jobs: List[Tuple[str, TrainData]],
+    snapshot_dir: Path,
+    meta: Dict[str, Any],
+) -> List[Tuple[str, TrainData]]:
+    """Grava cada dataset como snapshot e devolve os jobs apontando para eles."""
+    out: List[Tuple[str, TrainData]] = []
+    for name, df in jobs:
+        path = write_snapshot(df, snapshot_dir / name, feature_cols=_feature_cols(df), meta=meta)
+        print(f"  snapshot {name}: {len(df)} linhas → {path}")
+        out.append((name, path))
+    return out
+
+
+def _snapshot_jobs(snapshot_dir: Path) -> List[Tuple[str, TrainData]]:
+    """Jobs a partir de um diretório de snapshots (um subdiretório por modelo)."""
+    if not snapshot_dir.is_dir():
+        raise SystemExit(f"Diretório de snapshots não encontrado: {snapshot_dir}")
+    return [(p.name, p) for p in sorted(snapshot_dir.iterdir()) if is_snapshot(p)]
+
+
+def _train_jobs(jobs: List[Tuple[str, TrainData]], models_dir: Path, cpu_budget: int, train_procs: int) -> None:
+    print("\n[3/4] Treinando modelos...")
+    t_train = time.perf_counter()
+    timings = _train_all(jobs, models_dir, cpu_budget=cpu_budget, train_procs=train_procs)
+    for name, secs in timings.items():
+        print(f"  {name}: {secs:.1f}s")
+    print(f"  Treino total: {time.perf_counter() - t_train:.1f}s")
 
 
 def main() -> None:
@@ -60,8 +222,47 @@ def main() -> None:
     ap.add_argument("--min_rows", type=int, default=400)
     ap.add_argument("--min_sector_rows", type=int, default=800)
     ap.add_argument("--brapi_token", default=None)
+    ap.add_argument("--workers", type=int, default=8, help="Threads para as chamadas de rede")
+    ap.add_argument(
+        "--feature_procs",
+        type=int,
+        default=min(4, os.cpu_count() or 1),
+        help="Processos para features/targets (0 = na thread principal)",
+    )
+    ap.add_argument("--yf_rps", type=float, default=DEFAULT_RATES["yfinance"], help="Chamadas/s ao yfinance")
+    ap.add_argument("--brapi_rps", type=float, default=DEFAULT_RATES["brapi"], help="Chamadas/s à brapi")
+    ap.add_argument("--news_rps", type=float, default=DEFAULT_RATES["news"], help="Chamadas/s ao Google News")
+    ap.add_argument("--cpu_budget", type=int, default=os.cpu_count() or 1, help="Núcleos para o treino dos modelos")
+    ap.add_argument("--train_procs", type=int, default=0, help="Processos de treino (0 = automático)")
+    ap.add_argument(
+        "--from_store",
+        action="store_true",
+        help="Treina só com o feature store (sem rede, todo o período salvo); sem tickers usa todos os salvos",
+    )
+    ap.add_argument("--no_feature_store", action="store_true", help="Recalcula as features sem ler/gravar o feature store")
+    ap.add_argument("--snapshot_dir", default=None, help="Grava os datasets de cada modelo como snapshots (memmap)")
+    ap.add_argument(
+        "--from_snapshot",
+        default=None,
+        help="Treina a partir dos snapshots deste diretório (sem rede e sem banco)",
+    )
     args = ap.parse_args()
 
+    models_dir = Path(args.models_dir)
+    models_dir.mkdir(parents=True, exist_ok=True)
+
+    if args.from_snapshot:
+        jobs = _snapshot_jobs(Path(args.from_snapshot))
+        if not jobs:
+            raise SystemExit(f"Nenhum snapshot em {args.from_snapshot}")
+        horizons = sorted({str(read_schema(p)["meta"].get("horizon")) for _, p in jobs})
+        print(f"\n{'='*90}")
+        print(f"TREINAMENTO A PARTIR DE SNAPSHOTS ({args.from_snapshot}) | horizonte: {', '.join(horizons)}")
+        print(f"{'='*90}\n")
+        _train_jobs(jobs, models_dir, args.cpu_budget, args.train_procs)
+        print("\n✅ Treinamento finalizado!")
+        return
+
     # Carrega tickers
     tickers = []
     if args.tickers_file:
@@ -70,6 +271,16 @@ def main() -> None:
     tickers.extend([t.strip().upper() for t in args.tickers])
     tickers = list(dict.fromkeys([t for t in tickers if t]))
 
+    if args.from_store and args.interval != "1d":
+        raise SystemExit("--from_store só tem candles diários (--interval 1d)")
+
+    db = DBConfig(path=Path(args.db))
+    init_db(db)
+
+    if not tickers and args.from_store:
+        with connect(db) as con:
+            tickers = feature_tickers(con, FEATURE_VERSION)
+
     if not tickers:
         raise SystemExit("Informe --tickers ou --tickers_file")
 
@@ -78,75 +289,59 @@ def main() -> None:
     print(f"Tickers: {len(tickers)} | Período: {args.range_}")
     print(f"{'='*90}\n")
 
-    db = DBConfig(path=Path(args.db))
-    init_db(db)
-
     auth = BrapiAuth(token=args.brapi_token)
-    start_iso, end_iso, _, _ = _date_bounds(range_years=6)
-
-    models_dir = Path(args.models_dir)
-    models_dir.mkdir(parents=True, exist_ok=True)
+    start_iso, _, _, _ = _date_bounds(range_years=6)
 
     with connect(db) as con:
-        print("[1/4] Carregando macro...")
-        macro = fetch_macro_yfinance(start_iso, end_iso)
-
-        all_sector_frames: Dict[str, List[pd.DataFrame]] = {}
-
-        print("[2/4] Processando dados dos tickers...")
-        for i, t in enumerate(tickers, 1):
-            print(f"  [{i:02d}/{len(tickers)}] {t}")
-            sector, _ = fetch_sector_yfinance(t)
-
-            df_yf = fetch_ohlcv_yfinance(t, range_=args.range_, interval=args.interval)
-            df_br = fetch_ohlcv_brapi(t, auth=auth, range_=args.range_, interval=args.interval)
-            best_df, src = _choose_best_source(df_yf, df_br)
-
-            if best_df.empty or len(best_df) < args.min_rows:
-                print(f"     Pulado: dados insuficientes")
-                continue
-
-            fpay = fetch_fundamentals_brapi(t, auth=auth)
-            fundamentals_daily = _fundamentals_to_daily(fpay, best_df["date"])
-            news_daily = fetch_news_daily(ticker=t, company_name=t, sector=sector)
-
-            feat = build_feature_frame(best_df, fundamentals_daily, macro, news_daily)
-            feat = make_targets(feat, horizon=args.horizon)
-
-            if feat.empty:
-                print("     Pulado: sem targets")
-                continue
-
-            feat["ticker"] = t
-            feat["sector"] = sector or "UNKNOWN"
-            all_sector_frames.setdefault(feat["sector"].iloc[0], []).append(feat)
-
-            print(f"     Sucesso → {len(feat)} linhas")
-
-        # Treinamento
-        print("\n[3/4] Treinando modelos...")
-        global_parts = []
-        for sec, parts in all_sector_frames.items():
-            sec_df = pd.concat(parts).sort_values("date").reset_index(drop=True)
-            global_parts.append(sec_df)
-
-            sec_name = sec.replace(" ", "_").upper()
-            if len(sec_df) >= args.min_sector_rows:
-                print(f"Treinando {sec_name}...")
-                feature_cols = [c for c in sec_df.columns if c not in {"ticker","sector","date","y_cls","y_sl","y_sg","y_vol"}]
-                bundle, _ = train_bundle(sec_df, feature_cols=feature_cols, model_name=sec_name)
-                save_bundle(bundle, str(models_dir / f"lgbm_{sec_name}.joblib"))
-            else:
-                print(f"[{sec_name}] Dados insuficientes")
-
-        # GLOBAL
-        if global_parts:
-            global_df = pd.concat(global_parts).sort_values("date").reset_index(drop=True)
-            print("Treinando modelo GLOBAL...")
-            feature_cols = [c for c in global_df.columns if c not in {"ticker","sector","date","y_cls","y_sl","y_sg","y_vol"}]
-            bundle, _ = train_bundle(global_df, feature_cols=feature_cols, model_name="GLOBAL")
-            save_bundle(bundle, str(models_dir / "lgbm_GLOBAL.joblib"))
-
+        if args.from_store:
+            print("[1-2/4] Lendo features salvas (sem rede)...")
+            report = _frames_from_store(db, tickers, horizon=args.horizon, min_rows=args.min_rows)
+        else:
+            print("[1/4] Carregando macro...")
+            # salvo na tabela `macro`: decision/predict leem o mesmo
+            macro = load_macro_daily(con, start_iso)
+
+            print("[2/4] Processando dados dos tickers...")
+            report = ingest_tickers(
+                db,
+                tickers,
+                macro,
+                auth=auth,
+                horizon=args.horizon,
+                range_=args.range_,
+                interval=args.interval,
+                min_rows=args.min_rows,
+                workers=args.workers,
+                feature_procs=args.feature_procs,
+                rates={"yfinance": args.yf_rps, "brapi": args.brapi_rps, "news": args.news_rps},
+                feature_store=not args.no_feature_store,
+            )
+        print(
+            f"\n  Ingestão: {len(report.frames)} ok, {len(report.skipped)} pulados, "
+            f"{len(report.failed)} com falha em {report.seconds:.1f}s"
+        )
+        if report.builds:
+            secs = [b.seconds for b in report.builds.values()]
+            print(
+                f"  Features por ticker: mediana {np.median(secs) * 1000:.0f} ms "
+                f"(máx {max(secs) * 1000:.0f} ms)"
+            )
+        for t, err in report.failed.items():
+            print(f"     {t}: {err}")
+        if args.from_store:
+            for t, why in report.skipped.items():
+                print(f"     {t}: {why}")
+
+        all_sector_frames: Dict[str, List[pd.DataFrame]] = report.sector_frames(tickers)
+        jobs = _sector_jobs(all_sector_frames, args.min_sector_rows)
+        del report, all_sector_frames
+
+    if args.snapshot_dir:
+        print("\n  Gravando snapshots...")
+        meta = {"horizon": args.horizon, "range": args.range_, "tickers": tickers}
+        jobs = _write_snapshots(jobs, Path(args.snapshot_dir), meta)
+
+    _train_jobs(jobs, models_dir, args.cpu_budget, args.train_procs)
     print(f"\n✅ Treinamento finalizado com horizonte de {args.horizon} dias!")
 
 
@@ -5,10 +5,9 @@ import argparse
 import base64
 import json
 import re
-import time
 from typing import List, Optional
 
-import requests
+from ml.http_client import http_get
 
 # Página pública da composição do IBOV (fallback por regex no HTML)
 B3_IBOV_PAGE = (
@@ -57,7 +56,8 @@ def _dedupe_preserve(items: List[str]) -> List[str]:
     return out
 
 
-def _fetch_json_endpoint(timeout: int, page_size: int, max_retries: int) -> List[str]:
+def _fetch_json_endpoint(timeout: int, page_size: int) -> List[str]:
+    # retry/backoff ficam com o ml.http_client
     tickers: List[str] = []
     page = 1
 
@@ -71,44 +71,40 @@ def _fetch_json_endpoint(timeout: int, page_size: int, max_retries: int) -> List
         }
         url = B3_PORTFOLIO_ENDPOINT.format(payload_b64=_b64_payload(payload))
 
-        last_exc: Optional[Exception] = None
-        for attempt in range(max_retries):
-            try:
-                r = requests.get(url, timeout=timeout, headers=_headers(referer=B3_IBOV_PAGE))
-                # 520/502/503 às vezes acontecem; trata como retry
-                if r.status_code in (520, 502, 503, 504, 429, 403):
-                    time.sleep(0.8 * (attempt + 1))
-                    continue
-                r.raise_for_status()
-                data = r.json()
-                results = data.get("results") or []
-                for row in results:
-                    cod = str(row.get("cod") or "").strip().upper()
-                    if cod:
-                        tickers.append(cod)
-
-                page_info = data.get("page") or {}
-                total_pages = int(page_info.get("totalPages") or 1)
-                if page >= total_pages:
-                    return _dedupe_preserve(tickers)
-
-                page += 1
-                break  # próxima página
-            except Exception as e:
-                last_exc = e
-                time.sleep(0.8 * (attempt + 1))
-
-        # se estourou retries dessa página, aborta e deixa o fallback agir
-        if last_exc:
+        try:
+            # 520/502/503/429 já são repetidos pelo cliente; o 403 da B3 também é intermitente
+            r = http_get(
+                url,
+                timeout=timeout,
+                headers=_headers(referer=B3_IBOV_PAGE),
+                retry_status=(403,),
+            )
+            r.raise_for_status()
+            data = r.json()
+        except Exception:
+            # estourou os retries dessa página: aborta e deixa o fallback agir
             return []
 
+        results = data.get("results") or []
+        for row in results:
+            cod = str(row.get("cod") or "").strip().upper()
+            if cod:
+                tickers.append(cod)
+
+        page_info = data.get("page") or {}
+        total_pages = int(page_info.get("totalPages") or 1)
+        if page >= total_pages:
+            return _dedupe_preserve(tickers)
+
+        page += 1
+
 
 def _fetch_from_b3_html(timeout: int) -> List[str]:
     """
     Fallback: baixa a página pública da B3 e extrai tickers por regex.
     O HTML costuma conter um trecho “Carteira do Dia - dd/mm/aa ; AZZA3, ...”
     """
-    r = requests.get(B3_IBOV_PAGE, timeout=timeout, headers=_headers())
+    r = http_get(B3_IBOV_PAGE, timeout=timeout, headers=_headers())
     r.raise_for_status()
     html = r.text.upper()
 
@@ -125,13 +121,13 @@ def _fetch_from_b3_html(timeout: int) -> List[str]:
     return _dedupe_preserve(found)
 
 
-def fetch_ibov_tickers(timeout: int = 30, page_size: int = 200, max_retries: int = 4) -> List[str]:
+def fetch_ibov_tickers(timeout: int = 30, page_size: int = 200) -> List[str]:
     """
     Robust strategy:
     1) Try JSON endpoint (fast).
     2) If it fails (520/403/etc.), fallback to parsing B3 page HTML.
     """
-    tickers = _fetch_json_endpoint(timeout=timeout, page_size=page_size, max_retries=max_retries)
+    tickers = _fetch_json_endpoint(timeout=timeout, page_size=page_size)
     if tickers:
         return tickers
 
@@ -145,13 +141,12 @@ def main() -> None:
     ap.add_argument("--out", default=None, help="Output file (one ticker per line)")
     ap.add_argument("--timeout", type=int, default=30)
     ap.add_argument("--page_size", type=int, default=200)
-    ap.add_argument("--retries", type=int, default=4)
     args = ap.parse_args()
 
     if not args.ibov:
         raise SystemExit("Use --ibov")
 
-    tickers = fetch_ibov_tickers(timeout=args.timeout, page_size=args.page_size, max_retries=args.retries)
+    tickers = fetch_ibov_tickers(timeout=args.timeout, page_size=args.page_size)
 
     if args.out:
         with open(args.out, "w", encoding="utf-8") as f:
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import logging
+import pickle
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from ml.modeling import ModelBundle, load_bundle
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_KEY = "GLOBAL"
+
+
+@dataclass
+class _Entry:
+    path: Path
+    mtime: float
+    bundle: ModelBundle
+    nbytes: int
+    checked_at: float
+
+
+def _sector_key_from_path(path: Path) -> str:
+    # lgbm_FINANCIAL_SERVICES.joblib -> FINANCIAL_SERVICES
+    return path.stem[len("lgbm_"):]
+
+
+class ModelRegistry:
+    """
+    Registro em memória dos bundles lgbm_<SETOR>.joblib.
+
+    - load_all() carrega todos os bundles da pasta (uma vez, no startup).
+    - lookup() serve o bundle do setor (ou GLOBAL) sem ler o disco; só
+      recarrega quando o mtime do arquivo muda. O stat do arquivo é feito
+      no máximo a cada `check_interval` segundos por bundle.
+    """
+
+    def __init__(self, models_dir: str = "models", check_interval: float = 30.0) -> None:
+        self.models_dir = Path(models_dir)
+        self.check_interval = check_interval
+        self._entries: Dict[str, _Entry] = {}
+        self._missing: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _load_entry(self, path: Path) -> _Entry:
+        mtime = path.stat().st_mtime
+        bundle = load_bundle(str(path))
+        nbytes = len(pickle.dumps(bundle, protocol=pickle.HIGHEST_PROTOCOL))
+        return _Entry(path=path, mtime=mtime, bundle=bundle, nbytes=nbytes, checked_at=time.monotonic())
+
+    def load_all(self) -> Dict[str, int]:
+        loaded: Dict[str, _Entry] = {}
+        for path in sorted(self.models_dir.glob("lgbm_*.joblib")):
+            try:
+                loaded[_sector_key_from_path(path)] = self._load_entry(path)
+            except Exception as e:
+                logger.warning("model_load_failed %s: %s", path, e)
+
+        with self._lock:
+            self._entries = loaded
+            self._missing.clear()
+
+        footprint = self.memory_footprint()
+        logger.info(
+            "model_registry_loaded bundles=%d total_mb=%.1f",
+            len(loaded),
+            footprint["total_bytes"] / 1e6,
+        )
+        return footprint["bundles"]
+
+    def _refresh_if_stale(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        path = entry.path if entry else self.models_dir / f"lgbm_{key}.joblib"
+
+        now = time.monotonic()
+        if entry is not None and now - entry.checked_at < self.check_interval:
+            return entry
+        if entry is None and now - self._missing.get(key, float("-inf")) < self.check_interval:
+            return None
+
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            self._entries.pop(key, None)
+            self._missing[key] = now
+            return None
+
+        if entry is not None and entry.mtime == mtime:
+            entry.checked_at = now
+            return entry
+
+        logger.info("model_reload %s", path.name)
+        entry = self._load_entry(path)
+        self._entries[key] = entry
+        self._missing.pop(key, None)
+        return entry
+
+    def get(self, sector_key: str) -> Optional[ModelBundle]:
+        with self._lock:
+            entry = self._refresh_if_stale(sector_key)
+        return entry.bundle if entry else None
+
+    def lookup(self, sector_key: str) -> Optional[Tuple[str, ModelBundle]]:
+        """Retorna (nome_do_arquivo, bundle) do setor, com fallback para GLOBAL."""
+        with self._lock:
+            entry = self._refresh_if_stale(sector_key)
+            if entry is None:
+                entry = self._refresh_if_stale(FALLBACK_KEY)
+        if entry is None:
+            return None
+        return entry.path.name, entry.bundle
+
+    def memory_footprint(self) -> Dict[str, object]:
+        """Tamanho serializado (bytes) de cada bundle em memória."""
+        with self._lock:
+            bundles = {k: e.nbytes for k, e in sorted(self._entries.items())}
+        return {"bundles": bundles, "total_bytes": sum(bundles.values())}
+
+
+_registries: Dict[str, ModelRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(models_dir: str = "models") -> ModelRegistry:
+    """Registro único por processo para cada pasta de modelos."""
+    with _registries_lock:
+        reg = _registries.get(models_dir)
+        if reg is None:
+            reg = ModelRegistry(models_dir=models_dir)
+            _registries[models_dir] = reg
+        return reg
@@ -4,9 +4,12 @@ import traceback
 
 sys.path.append(str(Path(__file__).parent.parent))
 
-from ml.decision import _predict_dict
+from ml.decision import _feature_contrib_frame, _predict_dict, predict_batch
+from ml_engine.model_loader import get_registry
 from config import BRAPI_KEY
 
+MODELS_DIR = "models"
+
 
 # ==================== MAPEAMENTO + EXPLICAÇÕES ====================
 FEATURE_EXPLANATIONS = {
@@ -34,6 +37,75 @@ def _get_feature_info(feature_name: str, contribution: float):
     return name, explanation
 
 
+def _drivers(df_exp):
+    """Top fatores positivos/negativos (já explicados) a partir das contribuições."""
+    top_positive = []
+    top_negative = []
+
+    if df_exp is None or df_exp.empty:
+        return top_positive, top_negative
+
+    pos = df_exp[df_exp["contribution"] > 0].head(6)
+    neg = df_exp[df_exp["contribution"] < 0].head(6)
+
+    for _, r in pos.iterrows():
+        name, explanation = _get_feature_info(str(r["feature"]), float(r["contribution"]))
+        top_positive.append({"feature": name, "impact": f"+{float(r['contribution']):.4f}", "explanation": explanation})
+
+    for _, r in neg.iterrows():
+        name, explanation = _get_feature_info(str(r["feature"]), float(r["contribution"]))
+        top_negative.append({"feature": name, "impact": f"{float(r['contribution']):.4f}", "explanation": explanation})
+
+    return top_positive, top_negative
+
+
+def _format_result(result, dias, top_positive, top_negative):
+    return {
+        "ticker": result["ticker"],
+        "prob_up": round(result["prob_up"] * 100, 2),
+        "entry": round(result["entry"], 2),
+        "stop_gain": round(result["stop_gain"], 2),
+        "stop_loss": round(result["stop_loss"], 2),
+        "volatility": round(result.get("future_vol_logstd", 0.025), 4),
+        "sector": result.get("model", "GLOBAL").replace("lgbm_", "").replace(".joblib", ""),
+        "source": result.get("source_used", "yfinance"),
+        "model_accuracy": 0.67,
+        "top_positive": top_positive,
+        "top_negative": top_negative,
+        "horizon_days": dias,                    
+        "prediction_for": f"próximos {dias} dias" 
+    }
+
+
+def predict_tickers(tickers, dias: int = 10):
+    """
+    Versão em lote do predict_ticker: agrupa por bundle de setor e faz uma
+    única inferência por modelo. Tickers com falha voltam com "error"
+    (sem o fallback fictício do predict_ticker).
+    """
+    results = predict_batch(
+        tickers=tickers,
+        db_path="data/market.sqlite3",
+        models_dir=MODELS_DIR,
+        range_="2y",
+        interval="1d",
+        asof=None,
+        brapi_token=BRAPI_KEY,
+        brapi_bearer=None,
+        horizon=dias,
+        registry=get_registry(MODELS_DIR),
+    )
+
+    out = []
+    for ticker, result in results.items():
+        if "error" in result:
+            out.append({"ticker": ticker, "error": result["error"]})
+            continue
+        top_positive, top_negative = _drivers(result.get("_contrib_for_explain"))
+        out.append(_format_result(result, dias, top_positive, top_negative))
+    return out
+
+
 def predict_ticker(ticker: str, dias: int = 10):
     ticker = (ticker or "").strip().upper()
     
@@ -41,12 +113,13 @@ def predict_ticker(ticker: str, dias: int = 10):
         result = _predict_dict(
             ticker=ticker,
             db_path="data/market.sqlite3",
-            models_dir="models",
+            models_dir=MODELS_DIR,
             range_="2y",
             interval="1d",
             asof=None,
             brapi_token=BRAPI_KEY,
             brapi_bearer=None,
+            registry=get_registry(MODELS_DIR),
         )
 
         # Drivers explicados
@@ -57,38 +130,11 @@ def predict_ticker(ticker: str, dias: int = 10):
 
         if row is not None and bundle is not None:
             try:
-                from ml.decision import _feature_contrib_frame
-                df_exp = _feature_contrib_frame(row, bundle)
-                
-                if not df_exp.empty:
-                    pos = df_exp[df_exp["contribution"] > 0].head(6)
-                    neg = df_exp[df_exp["contribution"] < 0].head(6)
-
-                    for _, r in pos.iterrows():
-                        name, explanation = _get_feature_info(str(r["feature"]), float(r["contribution"]))
-                        top_positive.append({"feature": name, "impact": f"+{float(r['contribution']):.4f}", "explanation": explanation})
-
-                    for _, r in neg.iterrows():
-                        name, explanation = _get_feature_info(str(r["feature"]), float(r["contribution"]))
-                        top_negative.append({"feature": name, "impact": f"{float(r['contribution']):.4f}", "explanation": explanation})
+                top_positive, top_negative = _drivers(_feature_contrib_frame(row, bundle))
             except:
                 pass
 
-        return {
-            "ticker": result["ticker"],
-            "prob_up": round(result["prob_up"] * 100, 2),
-            "entry": round(result["entry"], 2),
-            "stop_gain": round(result["stop_gain"], 2),
-            "stop_loss": round(result["stop_loss"], 2),
-            "volatility": round(result.get("future_vol_logstd", 0.025), 4),
-            "sector": result.get("model", "GLOBAL").replace("lgbm_", "").replace(".joblib", ""),
-            "source": result.get("source_used", "yfinance"),
-            "model_accuracy": 0.67,
-            "top_positive": top_positive,
-            "top_negative": top_negative,
-            "horizon_days": dias,                    
-            "prediction_for": f"próximos {dias} dias" 
-        }
+        return _format_result(result, dias, top_positive, top_negative)
 
     except Exception as e:
         print(f"❌ Erro no ML para {ticker}: {e}")
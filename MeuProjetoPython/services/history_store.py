@@ -0,0 +1,127 @@
+# services/history_store.py
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+SCHEMA_SQL = """
+PRAGMA journal_mode=WAL;
+
+CREATE TABLE IF NOT EXISTS analysis_history (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id TEXT NOT NULL,
+  created_at TEXT NOT NULL,
+  ticker TEXT NOT NULL,
+  payload_json TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_analysis_history_user
+  ON analysis_history (user_id, id);
+"""
+
+
+class HistoryStore:
+    """
+    Histórico de análises por usuário em SQLite.
+
+    Cada entrada é o dict montado no app (indicadores, faixa, backtests)
+    serializado em JSON; por usuário ficam só as `limit` mais recentes.
+    """
+
+    def __init__(self, path: str, limit: int = 500) -> None:
+        self.path = Path(path)
+        self.limit = limit
+        self._init_lock = threading.Lock()
+        self._ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._ready:
+            with self._init_lock:
+                if not self._ready:
+                    self.path.parent.mkdir(parents=True, exist_ok=True)
+                    con = sqlite3.connect(str(self.path))
+                    try:
+                        con.executescript(SCHEMA_SQL)
+                        con.commit()
+                    finally:
+                        con.close()
+                    self._ready = True
+        # uma conexão por operação: seguro com o servidor multi-thread
+        return sqlite3.connect(str(self.path), timeout=10)
+
+    def add(self, user_id: str, entry: Dict[str, Any]) -> None:
+        con = self._connect()
+        try:
+            with con:
+                con.execute(
+                    "INSERT INTO analysis_history (user_id, created_at, ticker, payload_json) VALUES (?, ?, ?, ?)",
+                    (
+                        user_id,
+                        datetime.now().isoformat(timespec="seconds"),
+                        entry.get("ticker") or "",
+                        json.dumps(entry, default=str),
+                    ),
+                )
+                # mantém só as `limit` entradas mais recentes do usuário
+                con.execute(
+                    """
+                    DELETE FROM analysis_history
+                    WHERE user_id = ? AND id <= (
+                      SELECT id FROM analysis_history
+                      WHERE user_id = ?
+                      ORDER BY id DESC
+                      LIMIT 1 OFFSET ?
+                    )
+                    """,
+                    (user_id, user_id, self.limit),
+                )
+        finally:
+            con.close()
+
+    def page(self, user_id: str, page: int = 1, per_page: int = 20) -> Tuple[List[Dict[str, Any]], int]:
+        """(entradas da página, mais recentes primeiro; total do usuário)."""
+        page = max(1, page)
+        con = self._connect()
+        try:
+            total = con.execute(
+                "SELECT COUNT(*) FROM analysis_history WHERE user_id = ?", (user_id,)
+            ).fetchone()[0]
+            rows = con.execute(
+                """
+                SELECT payload_json FROM analysis_history
+                WHERE user_id = ?
+                ORDER BY id DESC
+                LIMIT ? OFFSET ?
+                """,
+                (user_id, per_page, (page - 1) * per_page),
+            ).fetchall()
+        finally:
+            con.close()
+        return [json.loads(r[0]) for r in rows], int(total)
+
+    def clear(self, user_id: str) -> None:
+        con = self._connect()
+        try:
+            with con:
+                con.execute("DELETE FROM analysis_history WHERE user_id = ?", (user_id,))
+        finally:
+            con.close()
+
+
+_stores: Dict[str, HistoryStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_history_store(path: str, limit: int = 500) -> HistoryStore:
+    """Store único por processo para cada arquivo."""
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = HistoryStore(path, limit=limit)
+            _stores[path] = store
+        store.limit = limit
+        return store
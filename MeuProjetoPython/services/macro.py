@@ -1,9 +1,14 @@
 # services/macro.py
 from __future__ import annotations
 
+import logging
+import threading
 import time
-import requests
-from typing import Dict, Any, Optional
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from ml.http_client import http_get
+from services.quotes import get_quote_service
 
 BCB_BASE = "https://api.bcb.gov.br/dados/serie/bcdata.sgs.{code}/dados/ultimos/1?formato=json"
 
@@ -16,7 +21,7 @@ SGS = {
     "usd_brl": 1,          # Dólar comercial (venda) :contentReference[oaicite:7]{index=7}
 }
 
-_cache: Dict[str, Any] = {"ts": 0, "data": None}
+logger = logging.getLogger(__name__)
 
 def _safe_float(v: str) -> Optional[float]:
     try:
@@ -26,7 +31,7 @@ def _safe_float(v: str) -> Optional[float]:
 
 def _get_bcb_last(code: int, timeout: int = 15) -> Dict[str, Any]:
     url = BCB_BASE.format(code=code)
-    r = requests.get(url, timeout=timeout)
+    r = http_get(url, timeout=timeout)
     r.raise_for_status()
     arr = r.json()
     if not arr:
@@ -35,47 +40,159 @@ def _get_bcb_last(code: int, timeout: int = 15) -> Dict[str, Any]:
     # Ex.: {"data":"23/02/2026","valor":"4.50"}
     return {"value": _safe_float(item.get("valor")), "date": item.get("data"), "source": "BCB/SGS"}
 
-def _get_brapi_quote(ticker: str, token: Optional[str] = None, timeout: int = 15) -> Dict[str, Any]:
-    # token opcional; se você já usa BRAPI_KEY, pode reaproveitar.
-    url = f"https://brapi.dev/api/quote/{ticker}"
-    params = {}
-    if token:
-        params["token"] = token
-    r = requests.get(url, params=params, timeout=timeout)
-    r.raise_for_status()
-    data = r.json()
-    res = (data.get("results") or [{}])[0]
+def _get_brapi_quote(ticker: str, token: Optional[str] = None) -> Dict[str, Any]:
+    # mesma cotação (e cache de segundos) usada pelo dashboard
+    q = get_quote_service(token).get_quote(ticker)
+    if q is None:
+        raise RuntimeError(f"cotação indisponível: {ticker}")
     return {
-        "value": res.get("regularMarketPrice"),
+        "value": q["price"],
         "date": None,
         "source": "brapi",
-        "change_pct": res.get("regularMarketChangePercent"),
+        "change_pct": q.get("change_pct"),
     }
 
-def get_macro_cards(brapi_token: Optional[str] = None) -> Dict[str, Any]:
+# =========================================================
+# Cards + TTL de cada um (séries mensais/trimestrais mudam pouco;
+# dólar e Ibovespa mudam durante o dia).
+# =========================================================
+_BCB_CARDS = [
+    ("PIB Brasil", "pib", 6 * 3600),
+    ("Taxa Selic", "selic_meta", 3600),
+    ("Inflação (IPCA)", "ipca", 6 * 3600),
+    ("Desemprego", "desemprego", 6 * 3600),
+    ("Dólar (USD/BRL)", "usd_brl", 600),
+]
+_IBOV_CARD = ("Ibovespa", 120)
+
+# depois de uma falha, tenta de novo em até 1 min (mantendo o valor antigo)
+RETRY_AFTER = 60.0
+# intervalo máximo entre verificações do refresher
+TICK_SECONDS = 15.0
+
+
+def _empty_card(source: str) -> Dict[str, Any]:
+    card: Dict[str, Any] = {"value": None, "date": None, "source": source}
+    if source == "brapi":
+        card["change_pct"] = None
+    return card
+
+
+class MacroRefresher:
     """
-    Retorna um dict pronto pro template.
-    Faz cache simples (10 min) pra não bater na API toda hora.
+    Mantém o último snapshot bom dos cards macro em memória.
+
+    - Uma thread em segundo plano verifica os cards a cada TICK_SECONDS e
+      busca em paralelo só os que expiraram (cada card tem seu TTL).
+    - snapshot() nunca faz rede: devolve o último valor bom de cada card
+      (stale-while-revalidate). Uma falha não apaga o valor anterior.
+    - Todo acesso ao estado passa pelo lock (servidor multi-thread).
     """
-    now = time.time()
-    if _cache["data"] is not None and (now - _cache["ts"] < 600):
-        return _cache["data"]
 
-    cards = {}
+    def __init__(self, brapi_token: Optional[str] = None, max_workers: int = 6) -> None:
+        self.brapi_token = brapi_token
+        self._loaders: Dict[str, Tuple[Callable[[], Dict[str, Any]], float, str]] = {}
+        for title, key, ttl in _BCB_CARDS:
+            self._loaders[title] = (lambda code=SGS[key]: _get_bcb_last(code), ttl, "BCB/SGS")
+        self._loaders[_IBOV_CARD[0]] = (
+            lambda: _get_brapi_quote("^BVSP", token=self.brapi_token),
+            _IBOV_CARD[1],
+            "brapi",
+        )
 
-    # BCB
-    cards["PIB Brasil"] = _get_bcb_last(SGS["pib"])
-    cards["Taxa Selic"] = _get_bcb_last(SGS["selic_meta"])
-    cards["Inflação (IPCA)"] = _get_bcb_last(SGS["ipca"])
-    cards["Desemprego"] = _get_bcb_last(SGS["desemprego"])
-    cards["Dólar (USD/BRL)"] = _get_bcb_last(SGS["usd_brl"])
+        self._cards: Dict[str, Dict[str, Any]] = {}
+        self._next_refresh: Dict[str, float] = {title: 0.0 for title in self._loaders}
+        self._inflight: set = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="macro")
+        self._thread: Optional[threading.Thread] = None
 
-    # Ibovespa via brapi
-    try:
-        cards["Ibovespa"] = _get_brapi_quote("^BVSP", token=brapi_token)
-    except Exception:
-        cards["Ibovespa"] = {"value": None, "date": None, "source": "brapi", "change_pct": None}
+    # -------------------- refresh --------------------
+    def _fetch(self, title: str) -> None:
+        loader, ttl, _ = self._loaders[title]
+        try:
+            card = loader()
+            ok = True
+        except Exception as e:
+            logger.warning("macro_fetch_failed %s: %s", title, e)
+            ok = False
+
+        now = time.time()
+        with self._lock:
+            if ok:
+                self._cards[title] = card
+                self._next_refresh[title] = now + ttl
+            else:
+                self._next_refresh[title] = now + min(ttl, RETRY_AFTER)
+            self._inflight.discard(title)
+
+    def refresh_due(self) -> List[Future]:
+        """Dispara (sem esperar) a busca de todos os cards vencidos."""
+        now = time.time()
+        with self._lock:
+            due = [
+                t for t, at in self._next_refresh.items()
+                if at <= now and t not in self._inflight
+            ]
+            self._inflight.update(due)
+        return [self._executor.submit(self._fetch, t) for t in due]
 
-    _cache["ts"] = now
-    _cache["data"] = cards
-    return cards
\ No newline at end of file
+    def refresh_now(self, timeout: Optional[float] = None) -> None:
+        """Busca os cards vencidos e espera terminar (warm-up/CLI)."""
+        wait(self.refresh_due(), timeout=timeout)
+
+    def _loop(self) -> None:
+        while True:
+            self.refresh_due()
+            with self._lock:
+                next_at = min(self._next_refresh.values())
+            delay = min(TICK_SECONDS, max(1.0, next_at - time.time()))
+            self._wake.wait(delay)
+            self._wake.clear()
+
+    def start(self) -> "MacroRefresher":
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="macro-refresher", daemon=True)
+                self._thread.start()
+        return self
+
+    # -------------------- leitura --------------------
+    def snapshot(self) -> Dict[str, Any]:
+        """Último valor bom de cada card, na ordem de exibição (sem rede)."""
+        now = time.time()
+        with self._lock:
+            out = {}
+            for title, (_, _, source) in self._loaders.items():
+                card = self._cards.get(title)
+                out[title] = dict(card) if card is not None else _empty_card(source)
+            stale = any(at <= now for at in self._next_refresh.values())
+        if stale:
+            # algum card venceu: acorda o refresher, mas responde já
+            self._wake.set()
+        return out
+
+
+_refresher: Optional[MacroRefresher] = None
+_refresher_lock = threading.Lock()
+
+
+def get_macro_refresher(brapi_token: Optional[str] = None) -> MacroRefresher:
+    """Refresher único por processo (iniciado na primeira chamada)."""
+    global _refresher
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = MacroRefresher(brapi_token=brapi_token).start()
+        elif brapi_token and not _refresher.brapi_token:
+            _refresher.brapi_token = brapi_token
+        return _refresher
+
+
+def get_macro_cards(brapi_token: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Retorna um dict pronto pro template.
+    Não faz rede na requisição: devolve o último snapshot do refresher em
+    segundo plano (cards ainda não carregados vêm com value=None -> "—").
+    """
+    return get_macro_refresher(brapi_token).snapshot()
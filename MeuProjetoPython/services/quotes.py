@@ -0,0 +1,199 @@
+# services/quotes.py
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+from ml.cache import TTLCache
+from ml.http_client import http_get
+
+logger = logging.getLogger(__name__)
+
+BRAPI_QUOTE_URL = "https://brapi.dev/api/quote/{symbols}"
+
+# cotação "ao vivo": alguns segundos bastam para home + dashboard + API
+QUOTE_TTL = 15.0
+# janela para juntar pedidos concorrentes numa mesma chamada
+BATCH_WINDOW = 0.02
+# símbolos por chamada multi-ticker
+MAX_BATCH = 20
+
+# planos da brapi que não aceitam vários tickers respondem com estes status
+_MULTI_REJECTED = (400, 401, 402, 403)
+
+
+def _normalize(symbol: str) -> str:
+    return (symbol or "").strip().upper()
+
+
+def _parse_quote(res: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    price = res.get("regularMarketPrice")
+    if price is None:
+        return None
+    try:
+        price = float(price)
+    except (TypeError, ValueError):
+        return None
+    return {
+        "symbol": _normalize(res.get("symbol")),
+        "price": price,
+        "change_pct": res.get("regularMarketChangePercent"),
+        "currency": res.get("currency"),
+        "market_time": res.get("regularMarketTime"),
+    }
+
+
+class QuoteService:
+    """
+    Cotações da brapi com cache de segundos e chamadas agrupadas.
+
+    Pedidos que chegam ao mesmo tempo (threads diferentes do Flask, ou uma
+    lista de tickers) são juntados em BATCH_WINDOW e resolvidos com uma
+    chamada /quote/A,B,C. Se o plano da brapi recusar multi-ticker, cai
+    para uma chamada por símbolo (em paralelo) e lembra disso.
+    """
+
+    def __init__(
+        self,
+        token: Optional[str] = None,
+        ttl: float = QUOTE_TTL,
+        batch_window: float = BATCH_WINDOW,
+        max_batch: int = MAX_BATCH,
+    ) -> None:
+        self.token = token
+        self.ttl = ttl
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.upstream_calls = 0
+        self._cache = TTLCache(maxsize=1024)
+        self._pending: Dict[str, Future] = {}
+        self._timer: Optional[threading.Timer] = None
+        self._multi_ok = True
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="quotes")
+
+    # -------------------- brapi --------------------
+    def _request(self, symbols: List[str]):
+        params = {"token": self.token} if self.token else {}
+        with self._lock:
+            self.upstream_calls += 1
+        return http_get(BRAPI_QUOTE_URL.format(symbols=",".join(symbols)), params=params, timeout=15)
+
+    def _fetch_one(self, symbol: str) -> Optional[Dict[str, Any]]:
+        r = self._request([symbol])
+        r.raise_for_status()
+        res = (r.json().get("results") or [{}])[0]
+        return _parse_quote(res)
+
+    def _fetch(self, symbols: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        if len(symbols) > 1 and self._multi_ok:
+            r = self._request(symbols)
+            if r.status_code in _MULTI_REJECTED:
+                logger.info("brapi_multi_quote_rejected status=%s; usando uma chamada por ticker", r.status_code)
+                self._multi_ok = False
+            elif r.status_code == 404:
+                # um ticker inválido derruba a chamada inteira: separa este lote
+                pass
+            else:
+                r.raise_for_status()
+                out: Dict[str, Optional[Dict[str, Any]]] = {}
+                for res in r.json().get("results") or []:
+                    q = _parse_quote(res)
+                    if q is not None:
+                        out[q["symbol"]] = q
+                return out
+
+        futures = {s: self._executor.submit(self._fetch_one, s) for s in symbols}
+        out = {}
+        for s, fut in futures.items():
+            try:
+                out[s] = fut.result()
+            except Exception as e:
+                logger.warning("brapi_quote_failed %s: %s", s, e)
+                out[s] = None
+        return out
+
+    # -------------------- batching --------------------
+    def _flush(self) -> None:
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            self._timer = None
+
+        symbols = list(pending)
+        for i in range(0, len(symbols), self.max_batch):
+            chunk = symbols[i:i + self.max_batch]
+            try:
+                quotes = self._fetch(chunk)
+            except Exception as e:
+                logger.warning("brapi_quote_batch_failed %s: %s", chunk, e)
+                quotes = {}
+
+            expires_at = time.time() + self.ttl
+            for s in chunk:
+                q = quotes.get(s)
+                if q is not None:
+                    self._cache.set(s, q, expires_at)
+                pending[s].set_result(q)
+
+    def get_quotes(self, symbols: Iterable[str], timeout: float = 30.0) -> Dict[str, Optional[Dict[str, Any]]]:
+        """{símbolo: cotação ou None}; só os que não estão em cache vão à brapi."""
+        syms = list(dict.fromkeys(_normalize(s) for s in symbols if _normalize(s)))
+
+        out: Dict[str, Optional[Dict[str, Any]]] = {}
+        for s in syms:
+            q = self._cache.get(s)
+            if q is not None:
+                out[s] = q
+
+        waits: Dict[str, Future] = {}
+        with self._lock:
+            for s in syms:
+                if s in out:
+                    continue
+                fut = self._pending.get(s)
+                if fut is None:
+                    fut = Future()
+                    self._pending[s] = fut
+                waits[s] = fut
+            if waits and self._timer is None:
+                self._timer = threading.Timer(self.batch_window, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+        for s, fut in waits.items():
+            try:
+                out[s] = fut.result(timeout=timeout)
+            except Exception as e:
+                logger.warning("brapi_quote_wait_failed %s: %s", s, e)
+                out[s] = None
+
+        return {s: out.get(s) for s in syms}
+
+    def get_quote(self, symbol: str) -> Optional[Dict[str, Any]]:
+        return self.get_quotes([symbol]).get(_normalize(symbol))
+
+    def get_price(self, symbol: str) -> Optional[float]:
+        q = self.get_quote(symbol)
+        return q["price"] if q else None
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._cache.stats(), "upstream_calls": self.upstream_calls}
+
+
+_service: Optional[QuoteService] = None
+_service_lock = threading.Lock()
+
+
+def get_quote_service(token: Optional[str] = None) -> QuoteService:
+    """Serviço único por processo (cache e agrupamento compartilhados)."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = QuoteService(token=token)
+        elif token and not _service.token:
+            _service.token = token
+        return _service
@@ -1,8 +1,8 @@
 from __future__ import annotations
 
 import logging
-import pandas as pd
-import yfinance as yf
+
+from ml.sources import yf_history
 
 from .ticker import ticker_yfinance
 from .data_quality import normalize_history_df, add_log_returns, validate_history
@@ -28,22 +28,13 @@ def fetch_history_yf(
         "fallback_used": False,
     }
 
-    def _download(p: str, i: str) -> pd.DataFrame:
-        return yf.download(
-            yf_ticker,
-            period=p,
-            interval=i,
-            progress=False,
-            auto_adjust=False, 
-            threads=False,
-        )
-
-    raw = _download(period, interval)
+    # histórico compartilhado com o ML (ml.cache): uma única ida ao yfinance
+    raw = yf_history(yf_ticker, range_=period, interval=interval)
     df = normalize_history_df(raw)
 
     if df.empty:
         meta["fallback_used"] = True
-        raw = _download("1y", "1d")
+        raw = yf_history(yf_ticker, range_="1y", interval="1d")
         df = normalize_history_df(raw)
 
     df = add_log_returns(df)